@@ -18,6 +18,19 @@ from litex.build.generic_platform import *
 # "Lattice" build flow which uses the YosysHQ tools.
 from litex.build.lattice import LatticePlatform
 
+#
+# Step three and a half, the shared code (pmod/, tools/, Etc.) lives one
+# directory up from the examples so put the top of the repository on the
+# python path and grab the build cache from tools and the timebase
+# from cores.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from cores.clockplan import ClockPlan
+from litex.soc.interconnect.csr import AutoCSR
+from cores.regbus import Rate, RegisterBus
+
 #
 # Step four here is building a "platform" (note that Litex-boards already
 # has a definition for this board, but I wanted to see what was inside
@@ -69,6 +82,16 @@ _io = [
 	("user_button_1", 0, Pins("20"), IOStandard("LVCMOS33")),
 	("user_button_2", 0, Pins("19"), IOStandard("LVCMOS33")),
 	("user_button_3", 0, Pins("18"), IOStandard("LVCMOS33")),
+
+	# The serial port, the second channel of the FTDI chip that the
+	# board is programmed through. It has two pins so they are given
+	# names with 'Subsignal', which the register bus (cores/regbus.py)
+	# asks for as "rx" and "tx".
+	("serial", 0,
+		Subsignal("rx", Pins("6")),
+		Subsignal("tx", Pins("9"), Misc("PULLUP")),
+		IOStandard("LVCMOS33")
+	),
 ]
 
 #
@@ -147,11 +170,14 @@ icebreaker = Icebreaker()
 # It is possible to create additional clock domains but that is not
 # needed for this simple example.
 #
-class Blink(Module):
+class Blink(Module, AutoCSR):
 	"""
 		Blink the USER leds on the Icebreaker
+
+		With registers=True the blink rate is a register on the serial
+		port (blink_rate_divisor), see tools/regclient.py.
 	"""
-	def __init__(self, blink_freq):
+	def __init__(self, blink_freq, registers=False):
 		#
 		# Now we "request", which is equivalent to fetching the constraints
 		# for, the two LEDs on this platform.
@@ -167,26 +193,43 @@ class Blink(Module):
 		# 
 		# To create a delay, we need a "divide-by-n" counter, and we're going
 		# to pass in the desired blink frequency when we instantiate this
-		# module. Since the clock rate is 12 MHz, and we'll not really want
-		# to go any slower than, say half a hertz, we can use a 24 bit counter.
-		#
-		counter = Signal(24)
-
+		# module.
 		#
 		# This is an example of how you can use python to do some grunt work
-		# for you. (there are better examples later). Basically calculate
-		# how many 'ticks' are in one half period of the blink frequency.
+		# for you. Basically we need to know how many 'ticks' of the clock
+		# are in one half period of the blink frequency.
 		#
 		# Since period is in nanoseconds, The delay in 'ticks' would be 
-		# (((1e9 * 1/blink_freq) / period) / 2) - 1
-		#             \              \       \    \--- zero based period
-		#              \              \       \------- half the period 
-		#               \              \-------------- period in ns
-		#                \---------------------------- The blink period in ns
+		# ((1e9 * 1/blink_freq) / period) / 2
+		#             \              \       \------- half the period 
+		#              \              \-------------- period in ns
+		#               \---------------------------- The blink period in ns
 		#
-		# As a simplification 1e9 / 2 is 500e6 (a bit of algebra)
-		# 
-		ticks = int(500e6 / (blink_freq * icebreaker.default_clk_period)) - 1
+		# Which is the same as the clock frequency divided by twice the
+		# blink frequency. Rather than building the counter here we ask a
+		# 'Timebase' (see cores/timebase.py) to do it. It hands back a
+		# 'strobe', a signal that is 1 for exactly one clock cycle every
+		# that many ticks, and it sizes the counter behind it to be just
+		# as wide as it needs to be. The other examples share one of these
+		# between several modules so they don't each need a counter.
+		#
+		# The Timebase comes from the design's 'ClockPlan' (see
+		# cores/clockplan.py) which knows how fast the clock is, here
+		# it is the platform's default_clk_period but once there is a
+		# PLL it is whatever the PLL makes.
+		#
+		# With the registers the strobe comes from a 'Rate' instead (see
+		# cores/regbus.py), which starts at the same rate but its divisor
+		# is a register the host can change over the serial port.
+		#
+		self.submodules.timebase = ClockPlan.of(icebreaker).timebase()
+		if registers:
+			self.submodules.rate = Rate(ClockPlan.of(icebreaker).freq(),
+										2 * blink_freq)
+			self.submodules.regbus = RegisterBus(icebreaker, {"blink": self})
+			half_period = self.rate.tick
+		else:
+			half_period = self.timebase.strobe(2 * blink_freq)
 
 		#
 		# This code is the "synchronous" stuff going on in the FPGA
@@ -196,22 +239,18 @@ class Blink(Module):
 		# "when positive edge of the clock, do ..." kind of block.
 		#
 		self.sync += [
-			# in FHDL we use .eq() on a signal to assign it a value.
-			# In this case we are incrementing the counter by 1. This
-			# happens on every clock cycle, so 12 million times a second.
-			counter.eq(counter + 1),
 			# the next statement is an "if" statement. The way this works
 			# is if the condition (first argument) evaluates to 'true' then
 			# the statements that follow should be executed. 
 			#
-			# The condition checks to see if the count is equal to 1/2 the
-			# number of clock ticks in the blink frequency. Note that this
-			# is statically computed, this module doesn't vary its blink
-			# speed once instantiated.
-			If(counter == ticks,
-				# when true, the counter is reset to 0 and the red LED is
-				# toggled to it's alternate state
-				counter.eq(0),
+			# The condition is the strobe from the timebase, it is only
+			# true once every half period of the blink frequency. Note
+			# that this is statically computed, this module doesn't vary
+			# its blink speed once instantiated.
+			If(half_period,
+				# when true, the red LED is toggled to it's alternate
+				# state. In FHDL we use .eq() on a signal to assign it a
+				# value.
 				red_led.eq(~red_led),
 			)
 			# and that is all there is to it, the LED blinks at 'blink_rate'
@@ -250,14 +289,25 @@ class Blink(Module):
 #
 # So this bit of code instantiates the Blink module.
 #
-led_module = Blink(3);
-
-#
-# And finally, we "build" it which takes the module structure as defined
-# and combines it with the platform to synthesize a design. The output
-# of the build stream is a bit file that we can load into the board
-# (see the makefile)
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module.
 #
+if __name__ == "__main__":
+	led_module = Blink(3, registers=bool(os.environ.get("REGISTERS")));
+	if hasattr(led_module, "regbus"):
+		led_module.regbus.write_map("build/registers.json")
 
-icebreaker.build(led_module)
+	#
+	# And finally, we "build" it which takes the module structure as defined
+	# and combines it with the platform to synthesize a design. The output
+	# of the build stream is a bit file that we can load into the board
+	# (see the makefile)
+	#
+	# Rather than calling icebreaker.build() directly we go through
+	# cached_build(). It has LiteX generate the Verilog and constraints, and
+	# if they are the same as a previous build (and the tools haven't changed)
+	# it copies the old results back instead of running yosys and nextpnr
+	# again. See tools/buildcache.py.
+	#
 
+	cached_build(icebreaker, led_module)
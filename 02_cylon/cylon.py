@@ -16,6 +16,16 @@ from litex.build.generic_platform import *
 # definition that is also in that module.
 #
 from litex_boards.platforms.icebreaker import Platform, break_off_pmod
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from cores.clockplan import ClockPlan
+from litex.soc.interconnect.csr import AutoCSR
+from cores.regbus import Rate, RegisterBus
 
 #
 # Create an instance of an icebreaker from it. This has the various LEDs
@@ -80,12 +90,15 @@ icebreaker.add_extension([gen_led8("PMOD1B", 1)])
 # Galactica on the Internet :-). I suppose I could also name it Night Rider
 # but that is more typing.
 #
-class Cylon(Module):
+class Cylon(Module, AutoCSR):
     """
         A module that has an LED bouncing back and forth on two LED8
         PMODs connected to PMOD port 1a and PMOD port 1b 
+
+        With registers=True the speed is a register on the serial port
+        (cylon_rate_divisor), see tools/regclient.py.
     """
-    def __init__(self, blink_freq):
+    def __init__(self, blink_freq, registers=False):
         #
         # As with the Blink example, we "request" the signals associated
         # with the name "led8" because we're going to be talking to them.
@@ -109,11 +122,23 @@ class Cylon(Module):
         button = icebreaker.request("user_btn")
 
         #
-        # Same counter/ticks like we used in Blink, look at the comments
-        # in that code for why 24 is enough bits of counter or how we
-        # compute ticks.
-        counter = Signal(24)
-        ticks = int(500e6 / (blink_freq * icebreaker.default_clk_period)) - 1
+        # Instead of the counter/ticks divider we used in Blink we ask a
+        # Timebase (see cores/timebase.py) for a strobe, a signal that
+        # is high for one clock cycle at the rate we want. The Blink
+        # divider counted half periods, hence the 2 *.
+        #
+        # With the registers the strobe comes from a Rate instead (see
+        # cores/regbus.py), which starts at the same rate but the host can
+        # change its divisor.
+        #
+        self.submodules.timebase = ClockPlan.of(icebreaker).timebase()
+        if registers:
+            self.submodules.rate = Rate(ClockPlan.of(icebreaker).freq(),
+                                        2 * blink_freq)
+            self.submodules.regbus = RegisterBus(icebreaker, {"cylon": self})
+            tick = self.rate.tick
+        else:
+            tick = self.timebase.strobe(2 * blink_freq)
 
 
         #
@@ -139,7 +164,7 @@ class Cylon(Module):
         #
         # Now for the synchronous part.
         #
-        # When enough ticks have gone by (the If() statement) the code does
+        # When the strobe is high (the If() statement) the code does
         # the following:
         #
         #    if the direction is LEFT then
@@ -159,9 +184,7 @@ class Cylon(Module):
         #
         fin = Signal(5)
         self.sync += [
-            counter.eq(counter + 1),
-            If(counter == ticks,
-                counter.eq(0),
+            If(tick,
                 fin.eq(fin + 1),
                 If(fin == 12,
                     fin.eq(0),
@@ -194,10 +217,15 @@ class Cylon(Module):
 #
 # now we instantiate our LED chaser.
 #
-led_module = Cylon(15);
-
-#
-# And "build" this into a bit file
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module.
 #
-icebreaker.build(led_module)
+if __name__ == "__main__":
+    led_module = Cylon(15, registers=bool(os.environ.get("REGISTERS")));
+    if hasattr(led_module, "regbus"):
+        led_module.regbus.write_map("build/registers.json")
 
+    #
+    # And "build" this into a bit file
+    #
+    cached_build(icebreaker, led_module)
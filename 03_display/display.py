@@ -7,24 +7,47 @@ from migen import *
 from litex.build.generic_platform import *
 from litex_boards.platforms.icebreaker import Platform
 #
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+#
 # This cleans up the code significantly. Here we have abstracted the
 # seven segment LED display PMOD into its own module. When we instantiate
 # it in our design we will wire it to signals in the design and tell
-# the module what PMOD port it is connected to.
+# the module what PMOD port it is connected to. (The module lives in the
+# pmod directory so the other examples can use it too.)
+#
+from pmod.led7segment import SevenSegmentLedDisplay
+#
+# And the shared timebase, which hands out clock enable strobes so that
+# the counter and the display don't each need their own divider.
 #
-from led7segment import SevenSegmentLedDisplay
+from cores.clockplan import ClockPlan
+#
+# And the register bus, which lets the host change the counting rate and
+# the count while the design is running (see cores/regbus.py).
+#
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+from cores.regbus import Rate, RegisterBus
 
 # we'll call it a icebreaker of type Platform()
 icebreaker = Platform()
 
 
-class Counter(Module):
+class Counter(Module, AutoCSR):
 	"""
 		This is a binary coded decimal counter module. When it counts up
 		at 'count_speed' counts per second it goes from 00 to 99 and rolls
 		over.
+
+		With registers=True the counting rate, the display's refresh rate
+		and the count itself are registers on the serial port, see
+		tools/regclient.py.
 	"""
-	def __init__(self, count_speed):
+	def __init__(self, count_speed, registers=False):
 		#
 		# This is going to be our count
 		#
@@ -32,10 +55,32 @@ class Counter(Module):
 		gled = icebreaker.request("user_ledg_n")
 
 		#
-		# The 'standard' divide by n clock divider
+		# Rather than the 'standard' divide by n clock divider we ask the
+		# timebase for a strobe that is high for one clock at a time. The
+		# old divider counted half periods (the 500e6 in its math) so the
+		# strobe is at twice 'count_speed' to keep the same speed. The
+		# display gets its refresh strobe from the same timebase.
 		#
-		divisor = Signal(24)
-		ticks = int((500e6/(count_speed * icebreaker.default_clk_period))) - 1
+		# The registers swap the strobes for Rates (see cores/regbus.py),
+		# which start out at the same rates but whose divisors the host
+		# can change. Writing 'value' loads the count and 'count' reads
+		# it back. The registers are named after the attributes they are
+		# in, so these are counter_rate_divisor, counter_refresh_divisor,
+		# counter_value and counter_count.
+		#
+		self.submodules.timebase = ClockPlan.of(icebreaker).timebase()
+		if registers:
+			clk_freq = ClockPlan.of(icebreaker).freq()
+			self.submodules.rate = Rate(clk_freq, 2 * count_speed)
+			self.submodules.refresh = Rate(clk_freq, 2 * 250)
+			self.value = CSRStorage(8, name="value")
+			self.count = CSRStatus(8, name="count")
+			self.comb += self.count.status.eq(count)
+			tick = self.rate.tick
+			refresh = self.refresh.tick
+		else:
+			tick = self.timebase.strobe(2 * count_speed)
+			refresh = None
 
 		#
 		# The sequential logic increments the counter in 'count' at a rate
@@ -47,9 +92,7 @@ class Counter(Module):
 		# rolling over again.
 		#
 		self.sync += [
-			divisor.eq(divisor + 1),
-			If(divisor == ticks,
-				divisor.eq(0),
+			If(tick,
 				gled.eq(~gled),
 				If(count == 0x99,
 					count.eq(0)
@@ -61,6 +104,8 @@ class Counter(Module):
 			),
 		]
 		self.comb += [ ]
+		if registers:
+			self.sync += If(self.value.re, count.eq(self.value.storage))
 		#
 		# This bit instantiates the SevenSegmentLedDisplay module and
 		# "connects" the count signal to the signal 'value' in the
@@ -71,16 +116,28 @@ class Counter(Module):
 		# branches and redundant code, Etc.
 		#
 		self.submodules += [SevenSegmentLedDisplay(icebreaker, "PMOD1A", 
-															value=count)]
+						value=count, timebase=self.timebase, strobe=refresh)]
+
+		#
+		# The register bus goes on the serial port, it finds the registers
+		# in this module when the design is finalized.
+		#
+		if registers:
+			self.submodules.regbus = RegisterBus(icebreaker, {"counter": self})
 #
 # Now instantiate a counter, which instantiates an LED display
 # sub-module which is showing the count.
 #
-count_module = Counter(5);
-
-#
-# And "build" this into a bit file
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module.
 #
+if __name__ == "__main__":
+	count_module = Counter(5, registers=bool(os.environ.get("REGISTERS")));
+	if hasattr(count_module, "regbus"):
+		count_module.regbus.write_map("build/registers.json")
 
-icebreaker.build(count_module)
+	#
+	# And "build" this into a bit file
+	#
 
+	cached_build(icebreaker, count_module)
@@ -6,7 +6,21 @@
 from migen import *
 from litex.build.generic_platform import *
 from litex_boards.platforms.icebreaker import Platform, break_off_pmod
-from led7segment import SevenSegmentLedDisplay
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from pmod.led7segment import MultiSevenSegmentLedDisplay
+from cores.clockplan import ClockPlan
+#
+# The register bus, as in 03_display, so the host can change the rates
+# and the count while it runs (see cores/regbus.py).
+#
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+from cores.regbus import Rate, RegisterBus
 
 # we'll call it an icebreaker of type Platform()
 icebreaker = Platform()
@@ -17,8 +31,16 @@ icebreaker = Platform()
 #
 icebreaker.add_extension(break_off_pmod)
 
-class Counter(Module):
-	def __init__(self, count_speed):
+class Counter(Module, AutoCSR):
+	"""
+		A four digit binary coded decimal counter on two displays, with
+		the break off PMOD's LEDs going round once a count.
+
+		With registers=True the counting rate, the displays' scan rate
+		and the count itself are registers on the serial port, see
+		tools/regclient.py.
+	"""
+	def __init__(self, count_speed, registers=False):
 		#
 		# This is going to be our count (now 16 bits wide)
 		#
@@ -36,16 +58,34 @@ class Counter(Module):
 		])
 
 		#
-		# The 'standard' divide by n clock divider
+		# One timebase for the whole design, the counter and both
+		# displays get their strobes from it rather than each running
+		# its own 24 bit divider. (twice count_speed, like the divider
+		# it replaces which counted half periods)
+		#
+		# The registers swap the strobes for Rates like 03_display does,
+		# so these are counter_rate_divisor, counter_refresh_divisor (the
+		# scan, which lights each of the four digits 250 times a second
+		# to start with), counter_value, which loads the count, and
+		# counter_count, which reads it back.
 		#
-		divisor = Signal(24)
-		ticks = int((500e6/(count_speed * icebreaker.default_clk_period))) - 1
+		self.submodules.timebase = ClockPlan.of(icebreaker).timebase()
+		if registers:
+			clk_freq = ClockPlan.of(icebreaker).freq()
+			self.submodules.rate = Rate(clk_freq, 2 * count_speed)
+			self.submodules.refresh = Rate(clk_freq, 4 * 250)
+			self.value = CSRStorage(16, name="value")
+			self.count = CSRStatus(16, name="count")
+			self.comb += self.count.status.eq(count)
+			tick = self.rate.tick
+			scan = self.refresh.tick
+		else:
+			tick = self.timebase.strobe(2 * count_speed)
+			scan = None
 		index = Signal(3)
 
 		self.sync += [
-			divisor.eq(divisor + 1),
-			If(divisor == ticks,
-				divisor.eq(0),
+			If(tick,
 				If(index == 3,
 					index.eq(0),
 					#
@@ -69,6 +109,8 @@ class Counter(Module):
 				),
 			),
 		]
+		if registers:
+			self.sync += If(self.value.re, count.eq(self.value.storage))
 		self.comb += [
 			#
 			# This drives the break off PMOD LEDs based on the
@@ -79,23 +121,38 @@ class Counter(Module):
 			If(index == 2, leds[2].eq(1)).Else(leds[2].eq(0)),
 			If(index == 3, leds[3].eq(1)).Else(leds[3].eq(0)),
  		]
-		# we will put the 'upper' two digits on PMOD1
-		self.submodules += [SevenSegmentLedDisplay(icebreaker, "PMOD1A", 
-															value=count[8:])]
-		# and the 'lower' two digits on PMOD2
-		self.submodules += [SevenSegmentLedDisplay(icebreaker, "PMOD1B", 
-															value=count[:8])]
+		#
+		# One display driver for both PMODs, we will put the 'upper' two
+		# digits on PMOD1A and the 'lower' two digits on PMOD1B. It scans
+		# the four digits one at a time through a single glyph decoder
+		# rather than having two complete display modules.
+		#
+		self.submodules += [MultiSevenSegmentLedDisplay(icebreaker,
+								["PMOD1A", "PMOD1B"], value=count,
+								timebase=self.timebase, strobe=scan)]
+
+		#
+		# The register bus goes on the serial port, it finds the registers
+		# in this module when the design is finalized.
+		#
+		if registers:
+			self.submodules.regbus = RegisterBus(icebreaker, {"counter": self})
 
 
 #
 # Now instantiate a counter, which instantiates an LED display
 # sub-module which is showing the count.
 #
-count_module = Counter(4);
-
-#
-# And "build" this into a bit file
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module.
 #
+if __name__ == "__main__":
+	count_module = Counter(4, registers=bool(os.environ.get("REGISTERS")));
+	if hasattr(count_module, "regbus"):
+		count_module.regbus.write_map("build/registers.json")
 
-icebreaker.build(count_module)
+	#
+	# And "build" this into a bit file
+	#
 
+	cached_build(icebreaker, count_module)
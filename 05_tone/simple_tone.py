@@ -4,10 +4,23 @@
 # still just easy stuff
 #
 from migen import *
-from migen.genlib.resetsync import AsyncResetSynchronizer
 from litex.build.generic_platform import *
 from litex_boards.platforms.icebreaker import Platform, break_off_pmod
-import math
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from tools.seedsweep import seed_sweep
+from cores.sine_rom import block_rom
+from cores.dds import DDS
+from cores.pll import PLL
+from pmod.i2s2 import I2S
+from cores.logic_analyzer import LogicAnalyzer
+from cores.regbus import RegisterBus, in_hertz
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
 
 # we'll call it a icebreaker of type Platform()
 icebreaker = Platform()
@@ -36,293 +49,29 @@ io = [
 icebreaker.add_extension(io)
 icebreaker.add_extension(break_off_pmod)
 
-#
-# Construct a 256 sample table of Sine wave values.
-#
-sine_wave_data = []
-for i in range(256):
-    x = (2.0 * math.pi) * ( i / 256.0)
-    a = 8388607 * math.sin(x)
-    sine_wave_data.append(C(int(a),24))
-    print("C(0x{:06x}), # {}".format(int(a),a))
-
-print("Bit width of waveform data: {}".format(len(sine_wave_data[0])))
-
-#triangle_wave_data = []
-#for i in range(256):
-#    a = int((2**16-1) * (i / 256.0))
-#    triangle_wave_data.append(C(int(a)))
-#    print("C(0x{:04x}), # {}".format(int(a),a))
-
-wave = Array(sine_wave_data)
-
-#
-# This sets up the ICE40 PLL hard block.
-#
-class PLL(Module):
-    """
-        This sets up the built-in PLL hardware to generate a clock
-        based on the input crystal which is higher in frequency
-        than the crystal. It does this using a PLL.
-
-        The output frequency is (12 Mhz * DIVF)/(2^DIVQ * DIVR) in
-        simple feedback mode. You can run it faster in one of the
-        more advanced modes. 
-
-        This code was taken largely from @tnt's NitroFPGA
-        repos. 
-
-        Note frequency has has to be between 45 and 85 it is in
-        MHz.
-    """
-    def __init__(self, plat, freq):
-        """
-            Takes platform and frequency, but it doesn't use
-            frequency yet (currently hard coded to 48 MHz) it
-            should likely take a clock domain for Global A and
-            one for Global B so that it is a bit more flexible.
-        """
-        # our copy of reset
-        self.rst = Signal(1)
-
-        #
-        # These steps add three new clock domains. Previously
-        # there was only one domain which is the default reference
-        # domain (sys). Clock domains are global to the design so
-        # when you create them they are available in all modules.
-        #
-        # They are named "cd_<xxx>" (cd is "clock domain") and is
-        # required. So these three domains are sys, por, and i2s.
-        #
-        self.clock_domains.cd_sys = ClockDomain()
-        self.clock_domains.cd_por = ClockDomain(reset_less=True)
-        self.clock_domains.cd_i2s = ClockDomain()
-
-        #
-        # We'll use the 12 MHz clock to feed the PLL
-        #
-        clk12 = plat.request("clk12")
-        #
-        # This is the  button on the icebreaker, we'll treat it as
-        # reset.
-        #
-        rst_n = plat.request("user_btn_n")
-
-        # Power on Reset
-        #
-        # PLLs don't "lock" right away, they have to synchronize the VCO
-        # with the source clock so that they are stable. So at power-on there
-        # will be some time before the PLL is "locked" onto it's frequency.
-        # This code has a 16 bit counter (por_count) that counts down from
-        # 65535 to 0 as the power on delay. It is tied to the clock input
-        # which will be 12 MHz so it will take about 5.4mS for it to count down.
-        #
-        por_count = Signal(16, reset=2**16-1)
-        por_done = Signal(1)
-        #
-        # This combinatorial code wires ClockSignal() to the power on
-        # reset clock domain's clk line. This is why it runs at 12MHz
-        #
-        self.comb += self.cd_por.clk.eq(ClockSignal())
-
-        #
-        # This combinatorial code sets the state of "por_done" to the boolean
-        # por_count == 0, which is to say power on reset is "done" once the
-        # por_count register has been decremented to 0.
-        #
-        self.comb += por_done.eq(por_count == 0)
-        
-        #
-        # This sequential code is running in the power on reset clock domain
-        # which you can tell because it isn't self.sync, rather 
-        # it is self.sync.por All clock domains are name self.sync.<domain>
-        # which is the name minus the 'cd_' prefix.
-        #
-        # The code just decrements por_count until por_done goes True (which
-        # will happen by the above combinatorial code)
-        #
-        self.sync.por += If(~por_done, por_count.eq(por_count - 1))
-
-        #
-        # This is a signal that comes off the PLL that says it is locked.
-        #
-        pll_locked = Signal(1)
-        #
-        # And this is a bit magical. There is a "hard block" (which means
-        # not configurable gates but a specific circuit for doing a specific
-        # thing) for the PLL. You can look up its I/Os in the Ice40 datasheet
-        # and the ones we're using are assigned in this call to 'Instance'
-        #
-        # The Instance definition has named parameters for all of the i/os
-        # that go to and come from the hard block, during the invocation
-        # it is our job to wire them to things in our module.
-        #
-        # The important ones are wiring the outputs (GLOBALA and GLOBALB)
-        # to clock domains, connecting the clk12 pin to the input, and
-        # wiring the PLL locked indication to a signal we can use in our
-        # code.
-        #
-        # Instance is a migen function that instantiates a hard block. We'll
-        # use this again later for other hardware in the chip.
-        #
-        # This code sets DIVF to 'freq' and freq must be between 45 and 85.
-        # This is multiplied by the system clock (12MHz) to give the VCO clock
-        # and that clock must be in the range of 533MHz to 1066MHz in order
-        # for the VCO to lock in "simple" mode.
-        #
-        # We set DIVQ to 2 since 2^2 is 4, and DIVR to 2 since
-        # the clock divisor will be 2^DIVQ * (DIVR + 1). By selecting these
-        # two the divisor is '12'.
-        #
-        # By setting DIVQ and DIVR this way we divide by 12 the VCO which was
-        # the desired frequency multiplied by 12. So the output frequency is
-        # (12 * freq) / 12 MHz or freq MHz. Easy right?
-        #
-        self.specials += Instance("SB_PLL40_2F_PAD",
-            p_DIVR = 2,                    # this sets DIVR to '3'
-            p_DIVF = freq-1,            # this sets DIVF to frequency
-            p_DIVQ = 2,                    # this makes DIVQ 2^2 or 4.
-            p_FILTER_RANGE = 1,
-            p_FEEDBACK_PATH = "SIMPLE",    # simple feedback
-            p_PLLOUT_SELECT_PORTA = "GENCLK",
-            p_PLLOUT_SELECT_PORTB = "GENCLK",
-            i_PACKAGEPIN = clk12,
-            o_PLLOUTGLOBALA = self.cd_sys.clk,
-            o_PLLOUTGLOBALB = self.cd_i2s.clk,
-            i_RESETB = rst_n,
-            o_LOCK = pll_locked,
-        )
-
-        #
-        # The Reset Synchronizer makes sure that the clock domains are
-        # synchronized. In this case they are synchronized to the power
-        # on countdown being done.
-        #
-        self.specials += [
-            AsyncResetSynchronizer(self.cd_sys, ~por_done | ~pll_locked),
-            AsyncResetSynchronizer(self.cd_i2s, ~por_done | ~pll_locked),
-        ]
-
-        #
-        # These lines add constraints to the platform clock periods so
-        # that the build tools can insure that the final design will meet
-        # the necessary timing requirements.
-        #
-        plat.add_period_constraint(self.cd_sys.clk, 1e9/(freq * 1e6))
-        plat.add_period_constraint(self.cd_i2s.clk, 1e9/(freq * 1e6))
-        plat.default_clk_period = 1e9/(freq * 1e6)
-        
-class I2S(Module):
-    """
-        This class implements an I2S interface to talk to a CODEC
-        chip on the Digilent PMOD.
-
-        The plan is to run it off the i2s clock at some point but for
-        now it is running off the system clock domain.
-
-    """
-    def __init__(self, platform, left_dr, right_dr, mclk, sclk, lrclk, sdo):
-        """
-            Initialize the i2s engine.
-
-            This code is for output only at the moment, so it isn't
-            reading data from the receive side.
-
-            left_dr and right_dr are either a Signal(16) or a Signal(24)
-            depending on if you're sending 16 bit samples or 24 bit samples.
-            The former are padded with 8 zeros to make them 24 bit samples.
-            
-            mclk is the master clock output
-            sclk is the serial clock (or bit clock) output
-            lrclk is the left/right channel select clock
-            sdo is the serial bitstream of samples, sent MSB first.
-            
-            This module creates a clock domain, sample_clk which clocks
-            each time a new sample is required. This lets you synchronize
-            with this module easily.
-        """
-        delay = Signal(8)
-        shift_count = Signal(8)
-        self.clock_domains.cd_sample_clk = ClockDomain("cd_sample_clk")
-        self.cd_sample_clk.clk = lrclk
-
-        # used to trigger the oscilloscope
-        d6 = platform.request("pmod1_6")
-        #
-        # Shift register holding data going out (one sample @ 24 bits)
-        #
-        xmit_reg = Signal(24)
-
-        #
-        # Serial Digital Out reflects the MSB of the transmit
-        # shift register.
-        #
-        self.comb += [
-            # this reflects the MSB of the transmit register to SDO
-            sdo.eq(xmit_reg[-1]),
-        ]
-
-        sticks = Signal(4)
-        lrticks = Signal(7)
-        
-        #
-        # This sequential block generates the MCLK (master clock),
-        # LRCLK (left/right clock), and the SCLK (serial clock).
-        # The ratio of the master clock to the LRCLK determines
-        # the bitwidth. We go for a 768x ratio starting with
-        # a 25MHz master clock, which makes for a 48 bit
-        # sample (2 x 24) sample period of 32.552 kHz
-        #
-        self.sync += [
-            mclk.eq(~mclk),    # running at 1/2 the clock rate (25MHz)
-            # @posedge of MCLK
-            If(mclk == 0,
-                If(sticks == 7,
-                    sticks.eq(0),
-                    sclk.eq(~sclk),
-                    # @negedge of SCLK
-                    If(sclk == 1,
-                        shift_count.eq(shift_count + 1),
-                        # generate LRCLK
-                        If(shift_count == 23,
-                            shift_count.eq(0),
-                            lrclk.eq(~lrclk),
-                        ),
-                        # shift out bits
-                        # Align sample to the MSB of the shift register
-                        # before assigning it to the shift register.
-                        If(shift_count == 0,
-                            If(lrclk == 1,
-                                xmit_reg.eq(left_dr << (24 - len(left_dr))),
-                            ).Else(
-                                xmit_reg.eq(right_dr << (24 - len(right_dr))),
-                            )
-                        ).Else(
-                            xmit_reg.eq((xmit_reg << 1) | xmit_reg[-1]),
-                        ),
-                    ),
-                ).Else( sticks.eq(sticks + 1)),
-            )
-        ]
-
-class Tone(Module):
+class Tone(Module, AutoCSR):
     """
         This is a tone generator, it generates samples to send
-        to the I2S unit which is is running at 24 kHz.
+        to the I2S unit which is is running at 32.5 kHz.
     
-        freq is the tone frequency (should be < 12 kHz)
+        freq is the tone frequency it starts with (should be < 12 kHz)
+        and depth is the number of samples in one cycle of the sine
+        table. The buttons on the break off PMOD move the tone down
+        (BTN1) or up (BTN3) a semitone, up to an octave each way, and
+        BTN2 goes back to freq. With analyzer=True there is a logic
+        analyzer on the I2S lines, and with registers=True the host can
+        set the frequency over the serial port (tools/regclient.py).
+        They both need the serial port so it is one or the other.
     """
-    def __init__(self, freq):
+    def __init__(self, freq, depth=256, analyzer=False, registers=False):
+        if analyzer and registers:
+            raise ValueError("The analyzer and the registers both use the "
+                             "serial port, pick one")
         #
         # This is going to be our count (now 16 bits wide)
         #
         count = Signal(16)
-        index = Signal(8)
         sample = Signal(8)
-        left = Signal(24)
-        right = Signal(24)
-        left_reg = Signal(24)
-        right_reg = Signal(24)
         busy = Signal(1)
 
         mclk = icebreaker.request("pmod1_3")
@@ -340,74 +89,172 @@ class Tone(Module):
         txe = Signal(1)
         d7 = icebreaker.request("pmod1_7")
         wr = Signal(1)
-        self.submodules += [
-                I2S(icebreaker, left_reg, right_reg,
-                            mclk, sclk, lrclk, sdo),
-                PLL(icebreaker, 50)]
-
-        sample_period_ns = 1e9/24.414e3
+        pll_freq = 50
+        self.submodules.i2s = I2S(icebreaker, mclk, sclk, lrclk, sdo)
+        self.submodules.pll = PLL(icebreaker, pll_freq)
+        print(self.pll.config)
+
+        #
+        # The I2S module sends one left and one right sample every 1536
+        # clocks (48 bits, 32 clocks each). The PLL can't make exactly
+        # 50 MHz, the closest it gets is 50.25 MHz which is a sample
+        # rate of 32.715 kHz. The tuning words are worked out from what
+        # it really makes (the PLL puts it in its ClockPlan, see
+        # cores/clockplan.py) so the notes are still in tune.
+        #
+        sample_rate = self.pll.clocks.freq("i2s") / 1536
+
+        #
+        # The samples come from a DDS (see cores/dds.py), a phase
+        # accumulator that adds the tuning word to the phase every
+        # sample and looks the top bits of it up in the sine table.
+        # The frequency is set by the tuning word, not by the design, so
+        # it can be changed while it is running. The right channel is a
+        # quarter of a cycle (90 degrees) ahead of the left one.
+        #
+        # The samples go into the I2S module's FIFO, so rather than
+        # running at the sample rate the DDS works out a new sample
+        # whenever there is room for one ('busy' while it is doing that)
+        # and the FIFO filling up is what slows it down to the sample
+        # rate.
+        #
+        self.submodules.dds = DDS(sample_rate, depth=depth,
+                                  offsets=(0, 0.25), dither=True)
+        block_rom(icebreaker)
+        self.comb += [
+            self.i2s.sink.valid.eq(self.dds.valid),
+            self.i2s.sink.left.eq(self.dds.values[0]),
+            self.i2s.sink.right.eq(self.dds.values[1]),
+        ]
+        self.sync += [
+            self.dds.ce.eq(0),
+            If(self.i2s.sink.ready & ~busy,
+                self.dds.ce.eq(1),
+                busy.eq(1)
+            ).Elif(self.dds.valid,
+                busy.eq(0)
+            )
+        ]
+        print(f"Freq {freq}, tuning word 0x{self.dds.tuning(freq):08x}, "
+              f"{self.dds.frequency(self.dds.tuning(freq)):.4f} Hz")
+
+        #
+        # To show that the frequency really can change at run time, the
+        # buttons step through the tuning words for the notes an octave
+        # either side of freq (there are 12 semitones to the octave and
+        # each one is 2^(1/12) higher than the last). They are sampled
+        # 100 times a second which is slow enough that they don't bounce.
+        #
+        self.submodules.timebase = self.pll.clocks.timebase()
+        notes = Array(C(self.dds.tuning(freq * 2**(n / 12)), 32)
+                      for n in range(-12, 13))
+        note = Signal(max=len(notes), reset=12)
+
+        #
+        # 'press' is high for one clock when a button has gone down
+        # since the last time.
+        #
+        buttons = Cat(*[icebreaker.request("user_btn", i) for i in range(3)])
+        sampled = Signal(3)
+        pressed = Signal(3)
+        press = Signal(3)
+        debounce = self.timebase.strobe(100)
+        if not registers:
+            self.comb += self.dds.tuning_word.eq(notes[note])
+        self.sync += If(debounce,
+                sampled.eq(buttons),
+                pressed.eq(sampled),
+                press.eq(sampled & ~pressed)
+            ).Else(
+                press.eq(0)
+            )
+        self.sync += If(press[0] & (note > 0),
+                note.eq(note - 1)
+            ).Elif(press[1],
+                note.eq(12)
+            ).Elif(press[2] & (note < len(notes) - 1),
+                note.eq(note + 1)
+            )
 
         #
-        # The 'standard' divide by n clock divider
-        #
-        divisor = Signal(48)
-        ticks = int(500e6/(freq * 256 * (1e9/100e6))) - 1
-        print(f"Freq {freq}, ticks={ticks}")
+        # With the registers the host can play any frequency at all: a
+        # write to 'tuning' plays that tuning word until a button is
+        # pressed, which goes back to the notes. 'playing' is the tuning
+        # word being played. The map says how to turn both of them into
+        # Hz, so 'tone_tuning=440Hz' plays an A.
+        #
+        if registers:
+            per_hz = 2**self.dds.acc_bits / sample_rate
+            self.tuning = CSRStorage(32, reset=self.dds.tuning(freq),
+                                     name="tuning")
+            self.playing = CSRStatus(32, name="playing")
+            in_hertz(self.tuning, multiplies=per_hz)
+            in_hertz(self.playing, multiplies=per_hz)
+            tuned = Signal()
+            self.sync += If(self.tuning.re,
+                    tuned.eq(1)
+                ).Elif(press != 0,
+                    tuned.eq(0)
+                )
+            # (the note is looked up and then picked a clock at a time,
+            # the lookup on its own is all there is time for at 50 MHz)
+            looked_up = Signal(32)
+            word = Signal(32)
+            self.sync += [
+                looked_up.eq(notes[note]),
+                word.eq(Mux(tuned, self.tuning.storage, looked_up)),
+            ]
+            self.comb += [
+                self.dds.tuning_word.eq(word),
+                self.playing.status.eq(word),
+            ]
+            self.submodules.regbus = RegisterBus(icebreaker, {"tone": self})
 
         self.comb += [
             real_sclk.eq(sclk),
             real_sdo.eq(sdo),
             real_lrclk.eq(lrclk),
             real_mclk.eq(mclk),
-            If(index == 0,
-                d7.eq(1),
-            ).Else(
-                d7.eq(0)
-            ),
+            # top bit of the phase, it falls at the start of each cycle
+            d7.eq(self.dds.phase[-1]),
         ]
 
         #
-        # Feed the current sample to the i2s device
+        # Rather than wiring more of them out to pins, the logic analyzer
+        # (see cores/logic_analyzer.py) can keep 2048 clocks of the I2S
+        # lines in block RAM, a bit more than one frame, and send them
+        # over the serial port. tools/la2vcd.py arms it and turns what
+        # comes back into a VCD file.
         #
-        self.sync.sample_clk += [
-            left_reg.eq(left),
-            right_reg.eq(right),
-        ]
-
-        flip = Signal(1)
-        self.sync += [
-            divisor.eq(divisor + 1),
-            If(divisor == ticks,
-                divisor.eq(0),
-                #
-                # Generate a new sample for our tone, in this version
-                # we are generating a simple sawtooth.
-                #
-                index.eq(index+1),
-#debug code
-                # two 24 bit samples, trigger on LRCLK to see
-                # them in the scope trace
-#               left.eq(0xAABBCC),
-#               right.eq(0x112233),
-# actual code
-                left.eq(wave[index]),
-                right.eq(wave[(index + 63)]),
-# Debug code (goes from 0 to n)
-#                sample.eq(index),
-# at 10 steps per second.
-        ).Else(
-            divisor.eq(divisor + 1)
-        ),
-        ]
+        if analyzer:
+            self.submodules.analyzer = LogicAnalyzer(icebreaker, [
+                    ("mclk", mclk), ("sclk", sclk), ("lrclk", lrclk),
+                    ("sdo", sdo), ("phase", self.dds.phase[-1]),
+                ], depth=2048, pre=256, domain="i2s")
 
 #
-# Now instantiate a tone generator
+# Now instantiate a tone generator. The design is only built when this
+# file is run, so the simulation (see sim/) can import it and make its
+# own instance of the module.
 #
-tone_module = Tone(880);
-
-#
-# And "build" this into a bit file
-#
-
-icebreaker.build(tone_module)
-
+if __name__ == "__main__":
+    tone_module = Tone(880, analyzer=bool(os.environ.get("ANALYZER")),
+                       registers=bool(os.environ.get("REGISTERS")))
+    if hasattr(tone_module, "analyzer"):
+        tone_module.analyzer.write_description("build/analyzer.json")
+    if hasattr(tone_module, "regbus"):
+        tone_module.regbus.write_map("build/registers.json")
+
+    #
+    # And "build" this into a bit file
+    #
+    # Timing closure at 50 MHz depends a lot on where nextpnr happens to
+    # place things. 'make sweep' (SEEDS=n in the environment) runs n
+    # placements in parallel and keeps the one with the best slack, it
+    # records the winning seed in build/seed.json. SEED=n builds with just
+    # that seed so a good result can be reproduced.
+    #
+    if os.environ.get("SEEDS"):
+        seed_sweep(icebreaker, tone_module, seeds=int(os.environ["SEEDS"]))
+    else:
+        cached_build(icebreaker, tone_module, seed=int(os.environ.get("SEED", 1)))
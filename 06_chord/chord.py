@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# vim: expandtab:ts=4:
+#
+# Play chords through the I2S2 PMOD, several notes at once.
+#
+from migen import *
+from litex.build.generic_platform import *
+from litex_boards.platforms.icebreaker import Platform, break_off_pmod
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from cores.sine_rom import block_rom
+from cores.voices import VoiceEngine, voice_memories
+from cores.pll import PLL
+from pmod.i2s2 import I2S
+
+icebreaker = Platform()
+
+#
+# The I2S2 PMOD goes in the top row of PMOD1B.
+#
+io = [
+        ("i2s_mclk", 0, Pins("PMOD1B:0"), IOStandard("LVCMOS33")),
+        ("i2s_lrclk", 0, Pins("PMOD1B:1"), IOStandard("LVCMOS33")),
+        ("i2s_sclk", 0, Pins("PMOD1B:2"), IOStandard("LVCMOS33")),
+        ("i2s_sdo", 0, Pins("PMOD1B:3"), IOStandard("LVCMOS33")),
+    ]
+icebreaker.add_extension(io)
+icebreaker.add_extension(break_off_pmod)
+
+#
+# The chords it steps through (C, Am, F and G, which is the chord
+# progression of about half the pop songs ever written), four notes
+# each.
+#
+CHORDS = [
+    [261.63, 329.63, 392.00, 523.25],
+    [220.00, 261.63, 329.63, 440.00],
+    [174.61, 220.00, 261.63, 349.23],
+    [196.00, 246.94, 293.66, 392.00],
+]
+
+class Chord(Module):
+    """
+        Plays one of 'chords' (a list of lists of frequencies, all the
+        same length) through the I2S2. BTN1 goes back a chord and BTN3
+        goes on to the next one.
+    """
+    def __init__(self, chords):
+        nvoices = len(chords[0])
+
+        pll_freq = 50
+        self.submodules.pll = PLL(icebreaker, pll_freq)
+        self.submodules.i2s = I2S(icebreaker,
+                                  icebreaker.request("i2s_mclk"),
+                                  icebreaker.request("i2s_sclk"),
+                                  icebreaker.request("i2s_lrclk"),
+                                  icebreaker.request("i2s_sdo"))
+        sample_rate = self.pll.clocks.freq("i2s") / 1536
+
+        #
+        # All of the voices come out of one VoiceEngine (see
+        # cores/voices.py), it works out a new mix whenever there is
+        # room in the I2S module's FIFO for one. Each voice gets a
+        # quarter of the volume so the mix can't overflow.
+        #
+        self.submodules.voices = VoiceEngine(sample_rate, voices=nvoices,
+                                             freqs=chords[0])
+        block_rom(icebreaker)
+        voice_memories(icebreaker)
+        busy = Signal()
+        self.sync += [
+            self.voices.ce.eq(0),
+            If(self.i2s.sink.ready & ~busy,
+                self.voices.ce.eq(1),
+                busy.eq(1)
+            ).Elif(self.voices.valid,
+                busy.eq(0)
+            )
+        ]
+
+        #
+        # The mix is mono so both channels get the same sample.
+        #
+        self.comb += [
+            self.i2s.sink.valid.eq(self.voices.valid),
+            self.i2s.sink.left.eq(self.voices.value),
+            self.i2s.sink.right.eq(self.voices.value),
+        ]
+
+        #
+        # Changing chord means writing a new tuning word into each of the
+        # voices, one per clock. The tuning words for every note of every
+        # chord are in a table indexed by chord and voice.
+        #
+        words = Array(C(self.voices.tuning(f), 32)
+                      for chord in chords for f in chord)
+        chord = Signal(max=max(len(chords), 2))
+        voice = Signal(max=max(nvoices, 2))
+        writing = Signal()
+        self.comb += [
+            self.voices.voice.eq(voice),
+            self.voices.tuning_word.eq(words[chord * nvoices + voice]),
+            self.voices.we_tuning.eq(writing),
+        ]
+        self.sync += If(writing,
+            If(voice == nvoices - 1,
+                writing.eq(0)
+            ).Else(
+                voice.eq(voice + 1)
+            )
+        )
+
+        #
+        # The buttons are sampled 100 times a second like simple_tone,
+        # 'press' is high for one clock when a button has gone down since
+        # the last time.
+        #
+        self.submodules.timebase = self.pll.clocks.timebase()
+        buttons = Cat(*[icebreaker.request("user_btn", i) for i in (0, 2)])
+        sampled = Signal(2)
+        pressed = Signal(2)
+        press = Signal(2)
+        debounce = self.timebase.strobe(100)
+        self.sync += If(debounce,
+                sampled.eq(buttons),
+                pressed.eq(sampled),
+                press.eq(sampled & ~pressed)
+            ).Else(
+                press.eq(0)
+            )
+        self.sync += If(press[0],
+                chord.eq(Mux(chord == 0, len(chords) - 1, chord - 1)),
+                voice.eq(0),
+                writing.eq(1)
+            ).Elif(press[1],
+                chord.eq(Mux(chord == len(chords) - 1, 0, chord + 1)),
+                voice.eq(0),
+                writing.eq(1)
+            )
+
+#
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module.
+#
+if __name__ == "__main__":
+    chord_module = Chord(CHORDS)
+
+    cached_build(icebreaker, chord_module, seed=int(os.environ.get("SEED", 1)))
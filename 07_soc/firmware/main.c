@@ -0,0 +1,191 @@
+/*
+ * vim: expandtab:ts=4:
+ *
+ * The firmware for the SoC (see ../soc.py).
+ *
+ * It runs straight out of the ROM. crt0 (LiteX's start up code for the
+ * CPU) copies the initialised variables into the SPRAM, clears the rest
+ * and calls main(). Each register in the SoC has a function in
+ * generated/csr.h, named after the peripheral and the register, that
+ * reads or writes it: display_value_write(), chaser_leds_read(),
+ * tone_tuning_write() and so on.
+ *
+ * First it measures how long the CPU takes to get at each kind of
+ * thing on its bus, in clocks, using the timer's uptime counter (which
+ * counts sys clocks). Every access is done ACCESSES times in a loop and
+ * the time for the same loop with nothing in it is taken off, so what
+ * is left is the access itself. A register is a trip over the Wishbone
+ * bus, through the bridge to the CSR bus and back; the SPRAM and the ROM
+ * are on the Wishbone bus itself.
+ *
+ * Then it puts the peripherals to work: the display counts seconds, the
+ * chaser runs faster and slower, and the tone plays a scale.
+ */
+#include <stdio.h>
+#include <stdint.h>
+
+#include <irq.h>
+#include <libbase/uart.h>
+#include <generated/csr.h>
+#include <generated/mem.h>
+#include <generated/soc.h>
+
+#define ACCESSES 256
+
+static uint64_t cycles(void)
+{
+    timer0_uptime_latch_write(1);
+    return timer0_uptime_cycles_read();
+}
+
+/*
+ * Each benchmark is a loop of ACCESSES of one kind. 'volatile' stops
+ * the compiler from deciding that reading the same thing 256 times only
+ * needs doing once.
+ */
+static uint32_t empty(void)
+{
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        ;
+    return cycles() - start;
+}
+
+static uint32_t csr_write(void)
+{
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        display_value_write(i);
+    return cycles() - start;
+}
+
+static uint32_t csr_read(void)
+{
+    volatile uint32_t value;
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        value = chaser_leds_read();
+    (void) value;
+    return cycles() - start;
+}
+
+static uint32_t csr_read_32(void)
+{
+    volatile uint32_t value;
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        value = tone_samples_read();
+    (void) value;
+    return cycles() - start;
+}
+
+static uint32_t ram_write(void)
+{
+    volatile uint32_t *ram = (volatile uint32_t *) MAIN_RAM_BASE;
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        ram[0] = i;
+    return cycles() - start;
+}
+
+static uint32_t ram_read(void)
+{
+    volatile uint32_t *ram = (volatile uint32_t *) MAIN_RAM_BASE;
+    volatile uint32_t value;
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        value = ram[0];
+    (void) value;
+    return cycles() - start;
+}
+
+static uint32_t rom_read(void)
+{
+    volatile uint32_t *rom = (volatile uint32_t *) ROM_BASE;
+    volatile uint32_t value;
+    uint64_t start = cycles();
+    for (volatile int i = 0; i < ACCESSES; i++)
+        value = rom[0];
+    (void) value;
+    return cycles() - start;
+}
+
+static const struct {
+    const char *name;
+    uint32_t (*run)(void);
+} benchmarks[] = {
+    { "register write (display_value)", csr_write },
+    { "register read (chaser_leds)", csr_read },
+    { "register read (tone_samples)", csr_read_32 },
+    { "SPRAM write", ram_write },
+    { "SPRAM read", ram_read },
+    { "ROM read", rom_read },
+};
+
+static void benchmark(void)
+{
+    uint32_t baseline = empty();
+
+    printf("clocks per access, %d accesses each (the loop takes %lu.%02lu "
+           "clocks a time on its own)\n", ACCESSES,
+           (unsigned long) (baseline / ACCESSES),
+           (unsigned long) (baseline % ACCESSES * 100 / ACCESSES));
+    for (unsigned n = 0; n < sizeof(benchmarks) / sizeof(benchmarks[0]); n++) {
+        uint32_t total = benchmarks[n].run();
+        uint32_t extra = total > baseline ? total - baseline : 0;
+        printf("    %-32s %3lu.%02lu\n", benchmarks[n].name,
+               (unsigned long) (extra / ACCESSES),
+               (unsigned long) (extra % ACCESSES * 100 / ACCESSES));
+    }
+}
+
+/*
+ * The tuning word for 'hz' is hz * 2^TONE_TUNING_BITS / TONE_SAMPLE_RATE,
+ * see cores/dds.py. The CPU has no multiplier so this is a call into
+ * compiler_rt, it is only done once a note.
+ */
+static uint32_t tuning(uint32_t hz)
+{
+    return ((uint64_t) hz << TONE_TUNING_BITS) / TONE_SAMPLE_RATE;
+}
+
+/* a C major scale, from middle C */
+static const uint16_t scale[] = { 262, 294, 330, 349, 392, 440, 494, 523 };
+
+int main(void)
+{
+#ifdef CONFIG_CPU_HAS_INTERRUPT
+    irq_setmask(0);
+    irq_setie(1);
+#endif
+    uart_init();
+
+    printf("\niCEBreaker with LiteX, %lu MHz\n",
+           (unsigned long) (CONFIG_CLOCK_FREQUENCY / 1000000));
+    benchmark();
+
+    /*
+     * Now the demonstration. Everything happens on the second (or the
+     * half second), going by the uptime counter.
+     */
+    uint32_t seconds = 0;
+    unsigned note = 0;
+    uint64_t next = cycles();
+
+    tone_mute_write(0);
+    for (;;) {
+        next += CONFIG_CLOCK_FREQUENCY / 2;
+        while (cycles() < next)
+            ;
+        note = (note + 1) % (sizeof(scale) / sizeof(scale[0]));
+        tone_tuning_write(tuning(scale[note]));
+        chaser_rate_divisor_write(CONFIG_CLOCK_FREQUENCY / (10 + 4 * note));
+        if (note % 2 == 0) {
+            seconds++;
+            display_value_write(seconds);
+            printf("%3lu s, %lu samples played\n", (unsigned long) seconds,
+                   (unsigned long) tone_samples_read());
+        }
+    }
+    return 0;
+}
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# vim: expandtab:ts=4:
+#
+# A computer: a RISC-V CPU with the examples' PMODs as its peripherals.
+#
+# This is what LiteX is really for. Rather than writing the logic that
+# drives the display, the LEDs and the tone ourselves, LiteX builds a
+# system on a chip (SoC) around a CPU (a VexRiscv, a small RISC-V that
+# fits in the UP5K alongside everything else) and the peripherals hang
+# off its bus as control and status registers. Then the program running
+# on the CPU (the firmware, in firmware/) decides what they do.
+#
+from migen import *
+from litex.build.generic_platform import *
+from litex_boards.platforms.icebreaker import Platform
+from litex.soc.integration.soc import SoCRegion
+from litex.soc.integration.soc_core import SoCCore
+from litex.soc.integration.common import get_mem_data
+from litex.soc.interconnect import wishbone
+from litex.soc.cores.ram import Up5kSPRAM
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import argparse
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from tools.seedsweep import seed_sweep
+from cores.clockplan import ClockPlan
+from cores.pll import PLL
+from cores.sine_rom import block_rom
+from pmod.peripherals import Display, Chaser, ToneGenerator
+
+kB = 1024
+
+#
+# The CPU runs its program straight out of block RAM (the ROM), there is
+# no BIOS and nothing to load. The UP5K only has 15 kB of block RAM and
+# the CPU, the UART and the tone need some of it, so the firmware gets
+# 8 kB. The 128 kB of SPRAM (the UP5K's four big single port RAMs) is
+# the rest of the memory, the first half for the firmware's variables
+# and its stack ("sram") and the second half free for whatever it wants
+# ("main_ram").
+#
+ROM_SIZE = 8 * kB
+SPRAM_SIZE = 128 * kB
+
+#
+# Where the PMODs go. The display is the one from 03_display and the
+# I2S2 sits in the top row of PMOD1B as it does for 06_chord. The LED8
+# takes the place of the break off PMOD on PMOD2.
+#
+DISPLAY_PMOD = "PMOD1A"
+TONE_PMOD = "PMOD1B"
+CHASER_PMOD = "PMOD2"
+
+
+#
+# In the simulation the board is litex_sim's: a clock, a reset and a
+# serial port that the simulator connects to the terminal. It gets the
+# iCEBreaker's PMOD connectors too (the pins don't go anywhere) so the
+# peripherals can ask for their pins the same way they do on the board.
+#
+_sim_io = [
+    ("sys_clk", 0, Pins(1)),
+    ("sys_rst", 0, Pins(1)),
+    ("serial", 0,
+        Subsignal("source_valid", Pins(1)),
+        Subsignal("source_ready", Pins(1)),
+        Subsignal("source_data", Pins(8)),
+        Subsignal("sink_valid", Pins(1)),
+        Subsignal("sink_ready", Pins(1)),
+        Subsignal("sink_data", Pins(8)),
+    ),
+]
+_sim_connectors = [
+    (pmod, " ".join(f"{pmod}_{i}" for i in range(8)))
+    for pmod in ("PMOD1A", "PMOD1B", "PMOD2")
+]
+
+
+def sim_platform(sys_clk_freq):
+    """
+        The board for the simulation, its clock runs at 'sys_clk_freq'.
+    """
+    from litex.build.sim import SimPlatform
+
+    class SimIcebreaker(SimPlatform):
+        default_clk_name = "sys_clk"
+        default_clk_period = 1e9 / sys_clk_freq
+
+        def __init__(self):
+            SimPlatform.__init__(self, "SIM", list(_sim_io),
+                                 connectors=_sim_connectors)
+
+    return SimIcebreaker()
+
+
+class SimCRG(Module):
+    """
+        Stands in for the PLL in the simulation: sys and i2s both run
+        off the simulator's clock.
+    """
+    def __init__(self, platform):
+        self.rst = Signal()
+        self.clock_domains.cd_sys = ClockDomain("sys")
+        self.clock_domains.cd_i2s = ClockDomain("i2s")
+        clk = platform.request("sys_clk")
+        rst = platform.request("sys_rst")
+        self.comb += [
+            self.cd_sys.clk.eq(clk),
+            self.cd_i2s.clk.eq(clk),
+            self.cd_sys.rst.eq(rst | self.rst),
+            self.cd_i2s.rst.eq(rst | self.rst),
+        ]
+        self.clocks = ClockPlan.of(platform)
+        self.clocks.add("i2s", self.clocks.freq())
+        self.freq = self.clocks.freq() / 1e6
+
+
+class IcebreakerSoC(SoCCore):
+    """
+        A VexRiscv with 'firmware' (a .bin file, or None for an empty
+        ROM) in its ROM, the SPRAM as its memory and the display, the
+        chaser and the tone as peripherals. The CPU and everything else
+        runs at 'sys_clk_freq' (in MHz) from the PLL, or from the
+        simulator's clock on a 'sim' platform (see sim_platform()).
+    """
+    def __init__(self, platform, sys_clk_freq=24, firmware=None, sim=False,
+                 cpu_type="vexriscv", cpu_variant="minimal"):
+        #
+        # The clocks come first so that the peripherals get their
+        # frequencies from the PLL's ClockPlan. The i2s domain is the
+        # same clock as sys, the I2S2 is happy with a 12 MHz MCLK and
+        # a 15.6 kHz sample rate.
+        #
+        if sim:
+            self.submodules.crg = SimCRG(platform)
+        else:
+            self.submodules.crg = PLL(platform, sys_clk_freq)
+        clk_freq = self.crg.freq * 1e6
+
+        if firmware is not None and not isinstance(firmware, list):
+            firmware = get_mem_data(firmware, data_width=32,
+                                    endianness="little")
+        SoCCore.__init__(self, platform, clk_freq,
+            ident="iCEBreaker with LiteX",
+            cpu_type=cpu_type,
+            cpu_variant=cpu_variant,
+            integrated_rom_size=ROM_SIZE,
+            integrated_rom_init=firmware or [],
+            integrated_sram_size=0,
+            uart_name="sim" if sim else "serial",
+            timer_uptime=True,
+        )
+
+        #
+        # The SPRAM as the CPU's memory. The simulator doesn't have the
+        # UP5K's SPRAM blocks so there it is an ordinary memory of the
+        # same size.
+        #
+        if sim:
+            self.submodules.spram = wishbone.SRAM(SPRAM_SIZE)
+        else:
+            self.submodules.spram = Up5kSPRAM(size=SPRAM_SIZE)
+        self.bus.add_slave("spram", self.spram.bus,
+                           SoCRegion(size=SPRAM_SIZE))
+        origin = self.bus.regions["spram"].origin
+        self.bus.add_region("sram", SoCRegion(origin=origin,
+                            size=SPRAM_SIZE // 2, linker=True))
+        self.bus.add_region("main_ram", SoCRegion(origin=origin + SPRAM_SIZE // 2,
+                            size=SPRAM_SIZE // 2, linker=True))
+
+        #
+        # And the peripherals, each one is a bank of registers named
+        # after the submodule (display_value, chaser_rate_divisor, ...,
+        # see pmod/peripherals.py). The firmware works the tuning word
+        # for a note out from the sample rate and the width of the DDS's
+        # phase accumulator, so they go in the headers as constants.
+        #
+        self.submodules.display = Display(platform, DISPLAY_PMOD)
+        self.submodules.chaser = Chaser(platform, CHASER_PMOD)
+        self.submodules.tone = ToneGenerator(platform, TONE_PMOD)
+        self.add_constant("TONE_SAMPLE_RATE", int(round(self.tone.sample_rate)))
+        self.add_constant("TONE_TUNING_BITS", self.tone.dds.acc_bits)
+        if not sim:
+            block_rom(platform)
+
+
+def software(soc, build_dir):
+    """
+        Writes the headers (build/software/include/generated) and builds
+        LiteX's libraries (build/software) for the firmware, which is
+        built against them, see firmware/Makefile. Needs a RISC-V gcc.
+    """
+    from litex.soc.integration.builder import Builder
+    builder = Builder(soc, output_dir=build_dir, compile_gateware=False,
+                      csr_json=os.path.join(build_dir, "csr.json"))
+    if soc.platform.name == "sim":
+        builder.build(build=False, run=False)
+    else:
+        builder.build(run=False)
+
+
+def simulate(soc, build_dir, trace=False):
+    """
+        Builds the SoC with Verilator (litex_sim's toolchain) and runs
+        it. What the firmware prints comes out on the terminal. The
+        libraries were built by software(), so they aren't built again.
+    """
+    from litex.build.sim.config import SimConfig
+    from litex.soc.integration.builder import Builder
+    sim_config = SimConfig()
+    sim_config.add_clocker("sys_clk", freq_hz=int(soc.clk_freq))
+    sim_config.add_module("serial2console", "serial")
+    builder = Builder(soc, output_dir=build_dir, compile_software=False,
+                      csr_json=os.path.join(build_dir, "csr.json"))
+    builder.build(sim_config=sim_config, trace=trace)
+
+
+#
+# The design is only built when this file is run. It is built in two
+# goes, as the firmware needs the headers that say where the registers
+# are and the ROM needs the firmware (see the Makefile):
+#
+#    ./soc.py --software            headers and libraries in build/
+#    make -C firmware BUILD_DIR=... the firmware
+#    ./soc.py                       the gateware, with the firmware in it
+#
+# With --sim it is the same but in build/sim, and the last step runs the
+# simulation rather than building the gateware.
+#
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A LiteX SoC with the "
+                                     "examples' PMODs as its peripherals")
+    parser.add_argument("--software", action="store_true",
+                        help="write the headers and build the libraries "
+                             "for the firmware")
+    parser.add_argument("--sim", action="store_true",
+                        help="simulate it with Verilator")
+    parser.add_argument("--trace", action="store_true",
+                        help="write a VCD file of the simulation")
+    parser.add_argument("--firmware", default=None,
+                        help="the firmware for the ROM (default "
+                             "BUILD/firmware/firmware.bin)")
+    parser.add_argument("--cpu-type", default="vexriscv")
+    parser.add_argument("--cpu-variant", default="minimal")
+    args = parser.parse_args()
+
+    build_dir = os.path.join("build", "sim") if args.sim else "build"
+    if args.software:
+        # the ROM's contents don't change the headers, this just keeps
+        # LiteX from building its BIOS for it
+        firmware = [0]
+    else:
+        firmware = args.firmware or os.path.join(build_dir, "firmware",
+                                                 "firmware.bin")
+        if not os.path.exists(firmware):
+            print(f"There is no {firmware}, the ROM will be empty "
+                  f"('make firmware' builds it)")
+            firmware = None
+
+    if args.sim:
+        sys_clk_freq = 24
+        platform = sim_platform(sys_clk_freq * 1e6)
+    else:
+        platform = Platform()
+    soc = IcebreakerSoC(platform, firmware=firmware, sim=args.sim,
+                        cpu_type=args.cpu_type, cpu_variant=args.cpu_variant)
+
+    if args.software:
+        software(soc, build_dir)
+    elif args.sim:
+        simulate(soc, build_dir, trace=args.trace)
+    elif os.environ.get("SEEDS"):
+        # as 05_tone does, SEEDS=n tries n placements and keeps the best
+        seed_sweep(platform, soc, seeds=int(os.environ["SEEDS"]))
+    else:
+        cached_build(platform, soc, seed=int(os.environ.get("SEED", 1)))
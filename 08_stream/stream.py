@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# vim: expandtab:ts=4:
+#
+# Play audio sent from the host over the serial port through the I2S2.
+#
+from migen import *
+from litex.build.generic_platform import *
+from litex_boards.platforms.icebreaker import Platform
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from tools.seedsweep import seed_sweep
+from cores.pll import PLL
+from pmod.pcm_stream import PCMStream
+
+icebreaker = Platform()
+
+#
+# The FTDI chip goes up to 12 Mbaud. The serial port needs a whole number
+# of clocks a bit (see cores/uart.py) and at least 4 of them, so the clock
+# is 48 MHz, which the PLL makes exactly from the 12 MHz crystal. The I2S2
+# runs off the same clock, which makes the sample rate 48 MHz / 1536 =
+# 31.25 kHz. A stereo frame is 4 bytes, 40 bits on the wire, so that is
+# 1.25 Mbaud of samples, the rest is room to catch up.
+#
+CLOCK = 48
+BAUDRATE = 12000000
+
+class Stream(Module):
+    """
+        Plays the samples that tools/pcmstream.py sends on an I2S2 in
+        the top row of PMOD1B, see pmod/pcm_stream.py. 'depth' is how
+        many frames can wait in its FIFO.
+    """
+    def __init__(self, depth=2048, baudrate=BAUDRATE):
+        self.submodules.pll = PLL(icebreaker, CLOCK)
+        self.submodules.pcm = PCMStream(icebreaker, "PMOD1B",
+                                        baudrate=baudrate, depth=depth)
+
+        #
+        # The green LED is lit while there is anything in the FIFO and
+        # the red one flashes for each underrun or overrun, stretched
+        # out to a twentieth of a second so that it can be seen. The
+        # counters only ever go up by one so their bottom bits are enough
+        # to see them move, and the stretch counts timebase ticks rather
+        # than 48 MHz clocks, a 22 bit counter doesn't make 48 MHz.
+        #
+        self.submodules.timebase = self.pll.clocks.timebase()
+        tick = self.timebase.strobe(1000)
+        gled = icebreaker.request("user_ledg_n")
+        rled = icebreaker.request("user_ledr_n")
+        stretch = Signal(max=51)
+        counted = Signal(2)
+        counts = Cat(self.pcm.underruns[0], self.pcm.overruns[0])
+        self.sync += [
+            counted.eq(counts),
+            If(counted != counts,
+                stretch.eq(50)
+            ).Elif(tick & (stretch != 0),
+                stretch.eq(stretch - 1)
+            ),
+        ]
+        self.comb += [
+            gled.eq(self.pcm.level == 0),
+            rled.eq(stretch == 0),
+        ]
+
+#
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module. The
+# host needs to know the sample rate and the size of the FIFO, they go in
+# build/stream.json.
+#
+if __name__ == "__main__":
+    stream_module = Stream()
+    stream_module.pcm.write_description("build/stream.json")
+
+    #
+    # As in 05_tone, 'make sweep' (SEEDS=n) tries n placements and keeps
+    # the best, and SEED=n builds with just that one.
+    #
+    if os.environ.get("SEEDS"):
+        seed_sweep(icebreaker, stream_module, seeds=int(os.environ["SEEDS"]))
+    else:
+        cached_build(icebreaker, stream_module, seed=int(os.environ.get("SEED", 1)))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# vim: expandtab:ts=4:
+#
+# Play samples from the UP5K's SPRAM through the I2S2.
+#
+from migen import *
+from litex.build.generic_platform import *
+from litex_boards.platforms.icebreaker import Platform, break_off_pmod
+#
+# The shared code (pmod/, tools/, Etc.) lives one directory up from the
+# examples so put the top of the repository on the python path.
+#
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tools.buildcache import cached_build
+from tools.seedsweep import seed_sweep
+from cores.pll import PLL
+from cores.regbus import RegisterBus
+from pmod.sampler import Sampler
+
+icebreaker = Platform()
+icebreaker.add_extension(break_off_pmod)
+
+#
+# As in 08_stream the clock is 48 MHz so that the serial port can go at
+# 12 Mbaud, which loads all 128 kB of samples in about a tenth of a
+# second, and the sample rate is 48 MHz / 1536 = 31.25 kHz. The samples
+# in the flash go 1 MB in, well past the bitstream.
+#
+CLOCK = 48
+BAUDRATE = 12000000
+FLASH_OFFSET = 0x100000
+
+class SamplerDemo(Module):
+    """
+        A Sampler (see pmod/sampler.py) on an I2S2 in the top row of
+        PMOD1B, with its registers on the serial port. It loads its
+        samples from the flash when it starts and tools/sampler.py can
+        load more and play them.
+    """
+    def __init__(self, baudrate=BAUDRATE):
+        self.submodules.pll = PLL(icebreaker, CLOCK)
+        self.submodules.sampler = Sampler(icebreaker, "PMOD1B",
+                                          flash_offset=FLASH_OFFSET)
+        self.submodules.regbus = RegisterBus(icebreaker,
+            {"sampler": self.sampler}, baudrate=baudrate)
+
+        #
+        # The first button on the break off board plays the region that
+        # was set up last again, sampled 100 times a second like the
+        # buttons in simple_tone, and the green LED is lit while it is
+        # playing. The red one is lit until the samples are in from the
+        # flash.
+        #
+        self.submodules.timebase = self.pll.clocks.timebase()
+        button = icebreaker.request("user_btn", 0)
+        sampled = Signal()
+        pressed = Signal()
+        debounce = self.timebase.strobe(100)
+        self.sync += If(debounce,
+                sampled.eq(button),
+                pressed.eq(sampled),
+                self.sampler.trigger.eq(sampled & ~pressed)
+            ).Else(
+                self.sampler.trigger.eq(0)
+            )
+        gled = icebreaker.request("user_ledg_n")
+        rled = icebreaker.request("user_ledr_n")
+        self.comb += [
+            gled.eq(~self.sampler.playing.status),
+            rled.eq(~self.sampler.loading.status),
+        ]
+
+#
+# The design is only built when this file is run, so the simulation
+# (see sim/) can import it and make its own instance of the module. The
+# host needs the register map and what the sampler is, they go in
+# build/registers.json and build/sampler.json.
+#
+if __name__ == "__main__":
+    sampler_module = SamplerDemo()
+    sampler_module.regbus.write_map("build/registers.json")
+    sampler_module.sampler.write_description("build/sampler.json")
+
+    #
+    # As in 05_tone, 'make sweep' (SEEDS=n) tries n placements and keeps
+    # the best, and SEED=n builds with just that one.
+    #
+    if os.environ.get("SEEDS"):
+        seed_sweep(icebreaker, sampler_module, seeds=int(os.environ["SEEDS"]))
+    else:
+        cached_build(icebreaker, sampler_module, seed=int(os.environ.get("SEED", 1)))
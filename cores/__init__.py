@@ -0,0 +1,6 @@
+#
+# This is the cores directory. The pmod directory has modules for the
+# things that plug into the board, this one has the Migen modules that
+# aren't tied to any particular piece of hardware (dividers, memories,
+# audio engines, Etc.) and are shared between the examples.
+#
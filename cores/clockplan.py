@@ -0,0 +1,132 @@
+#
+# vim: expandtab:ts=4:
+#
+# One place to find out how fast each clock domain runs.
+#
+# The examples used to work out their dividers from
+# platform.default_clk_period, which is the 12 MHz crystal, and the PLL
+# changed default_clk_period when it was built. Whether a divider got
+# the right frequency depended on whether it was made before or after
+# the PLL, and anything in a domain other than sys had to be worked out
+# by hand.
+#
+# A ClockPlan holds the frequency of every clock domain. There is one
+# per design, made from the platform (just the crystal) or by the PLL
+# (all of its outputs), it adds the timing constraint for each domain,
+# and the modules ask it for the frequency of the domain they are
+# running in:
+#
+#    clocks = ClockPlan.of(platform)
+#    sample_rate = clocks.freq("i2s") / 1536
+#    self.submodules.timebase = clocks.timebase()
+#
+# ClockPlan.of(platform) finds the plan for a platform (making the
+# crystal only one if there isn't one yet) so any module that was handed
+# the platform can find it. The PLL makes its plan when it is built, and
+# making one after something has already asked the old one for a
+# frequency is an error rather than a design that runs at two speeds.
+#
+# It also holds the tolerance for dividers. A Timebase from timebase()
+# refuses (with a ValueError while the design is being elaborated) to
+# make a strobe whose rate is further off than that, so changing the
+# clock can't quietly leave a display refreshing at the wrong rate.
+#
+# For simulation the plan can be given a 'scale', every frequency it
+# hands out is divided by it (the timing constraints still get the real
+# ones). Everything that divides a clock down gets its numbers from the
+# plan, so a scale of 1000 makes every divider 1000 times shorter and a
+# simulated second takes a thousandth of the clocks it does on the board.
+#
+from migen import *
+
+from cores.timebase import Timebase
+
+
+class ClockPlan:
+    """
+        The frequencies (in Hz) of the clock domains in a design. With
+        no 'pll' there is just sys, running off the platform's default
+        clock, otherwise there is a domain for each of the PLL's outputs.
+        'tolerance' is how far (as a fraction) a divided down rate can
+        be from the one asked for. The frequencies read back from it
+        are divided by 'scale', if it isn't given it is the same as the
+        plan this one replaces (or 1).
+    """
+    def __init__(self, platform, pll=None, tolerance=0.01, scale=None):
+        self.platform = platform
+        self.tolerance = tolerance
+        self._freqs = {}
+        self._read = set()
+
+        old = getattr(platform, "clock_plan", None)
+        if scale is None:
+            scale = old.scale if old is not None else 1
+        self.scale = scale
+        if old is not None and old._read:
+            raise ValueError(f"The clock plan was already used for "
+                             f"{', '.join(sorted(old._read))}, make the "
+                             f"ClockPlan before anything that needs it")
+        platform.clock_plan = self
+
+        if pll is None:
+            # the platform adds the constraint for its own clock
+            self.add("sys", 1e9 / platform.default_clk_period)
+        else:
+            for name, (cd, freq) in pll.domains.items():
+                self.add(name, freq, cd.clk)
+
+    @staticmethod
+    def of(platform):
+        """
+            The ClockPlan for 'platform', a new one with just its
+            default clock if nothing has made one yet.
+        """
+        plan = getattr(platform, "clock_plan", None)
+        if plan is None:
+            plan = ClockPlan(platform)
+        return plan
+
+    def add(self, domain, freq, clk=None):
+        """
+            Adds (or changes) clock domain 'domain' running at 'freq'
+            Hz. If its clock signal 'clk' is given a period constraint
+            is added for it.
+        """
+        if domain in self._read:
+            raise ValueError(f"{domain} was already used at "
+                             f"{self._freqs[domain] / self.scale} Hz")
+        self._freqs[domain] = freq
+        if clk is not None:
+            self.platform.add_period_constraint(clk, 1e9 / freq)
+
+    def domains(self):
+        """
+            The names of the clock domains in the plan.
+        """
+        return sorted(self._freqs)
+
+    def freq(self, domain="sys"):
+        """
+            The frequency (in Hz, divided by the scale) of 'domain'.
+        """
+        if domain not in self._freqs:
+            raise ValueError(f"There is no {domain} clock domain, there "
+                             f"is {', '.join(self.domains())}")
+        self._read.add(domain)
+        return self._freqs[domain] / self.scale
+
+    def period(self, domain="sys"):
+        """
+            The period (in ns) of 'domain'.
+        """
+        return 1e9 / self.freq(domain)
+
+    def timebase(self, domain="sys"):
+        """
+            A Timebase running in 'domain' that checks its strobes
+            against the tolerance.
+        """
+        timebase = Timebase(self.freq(domain), tolerance=self.tolerance)
+        if domain != "sys":
+            timebase = ClockDomainsRenamer(domain)(timebase)
+        return timebase
@@ -0,0 +1,141 @@
+#
+# vim: expandtab:ts=4:
+#
+# Direct digital synthesis (DDS) tone generator.
+#
+# The first tone generator stepped through the sine table once every
+# 'ticks' clocks where ticks was worked out from the frequency when the
+# design was built. So the frequency could only be a whole number of
+# clocks per step, and changing it meant running yosys and nextpnr all
+# over again.
+#
+# A DDS keeps the position in the wave (the phase) in an N bit register,
+# the phase accumulator, where 0 is the start of the cycle and 2^N would
+# be the end of it. Every sample the 'tuning word' is added to it and the
+# top bits of the result pick the entry in the sine table. The output
+# frequency is
+#
+#    f = tuning_word * sample_rate / 2^N
+#
+# so with a 32 bit accumulator the frequency can be set to a fraction of
+# a millihertz and, because the tuning word is just a Signal, changed
+# whenever we like while the design is running.
+#
+# Only the top bits of the phase are used to look up the table and
+# throwing the rest away produces small spurious tones (spurs) that are
+# related to the frequency. With dither=True a little noise from an
+# LFSR is added to the phase before it is cut down, which turns the
+# spurs into a (lower, flat) noise floor.
+#
+from migen import *
+
+from cores.sine_rom import SineROM
+
+
+class LFSR(Module):
+    """
+        A 32 bit Galois linear feedback shift register, x^32 + x^22 +
+        x^2 + x + 1, that steps every clock. 'value' is a new pseudo
+        random number on each clock.
+    """
+    taps = 0x80200003
+
+    def __init__(self, seed=1):
+        self.value = Signal(32, reset=seed)
+        self.sync += If(self.value[0],
+                self.value.eq((self.value >> 1) ^ LFSR.taps)
+            ).Else(
+                self.value.eq(self.value >> 1)
+            )
+
+
+class DDS(Module):
+    """
+        A DDS sine wave generator. 'sample_rate' is how often (in Hz)
+        'ce' is pulsed, each pulse advances the phase accumulator by
+        'tuning_word' and starts looking up a new sample. The table has
+        'depth' entries of 'width' bits (see SineROM).
+
+        'offsets' is a list of phase offsets (in cycles, 0.25 is 90
+        degrees) there is an output for each of them in 'values', they
+        share the one table by being looked up one after the other. When
+        all of them have been updated 'valid' is high for one clock.
+    """
+    def __init__(self, sample_rate, acc_bits=32, depth=256, width=24,
+                 offsets=(0,), dither=False):
+        self.sample_rate = sample_rate
+        self.acc_bits = acc_bits
+        self.ce = Signal()
+        self.tuning_word = Signal(acc_bits)
+        self.phase = Signal(acc_bits)
+        self.values = [Signal((width, True)) for _ in offsets]
+        self.valid = Signal()
+
+        self.submodules.rom = SineROM(depth, width)
+        addr_bits = len(self.rom.phase)
+        if addr_bits > acc_bits:
+            raise ValueError(f"A {depth} entry table needs at least "
+                             f"{addr_bits} bits of phase")
+
+        #
+        # The tuning word goes through a register of its own first so
+        # that whatever is driving it (a table of notes, a CSR, ...) is
+        # not part of the path through the accumulator's adder.
+        #
+        tuning_word = Signal(acc_bits)
+        self.sync += [
+            tuning_word.eq(self.tuning_word),
+            If(self.ce, self.phase.eq(self.phase + tuning_word)),
+        ]
+
+        #
+        # The dither is up to one table step of noise, it goes in the
+        # bits just below the ones that address the table.
+        #
+        noise = Signal(acc_bits - addr_bits)
+        if dither and len(noise):
+            self.submodules.lfsr = LFSR()
+            n = min(len(noise), 32)
+            self.comb += noise[-n:].eq(self.lfsr.value[:n])
+
+        #
+        # 'step' follows the ce strobe down the pipeline, step[k] is
+        # high k + 1 clocks after it. The dither is added to the phase
+        # on step[0] and then on step[k + 1] the offset for output k is
+        # added to that and the result goes into a register and on into
+        # the table, its value comes out SineROM.latency clocks after
+        # that. (Doing the two additions on different clocks keeps two
+        # 32 bit adders from being chained together.)
+        #
+        nout = len(offsets)
+        step = Signal(nout + SineROM.latency + 3)
+        self.sync += step.eq(Cat(self.ce, step))
+
+        offset_words = [int(round(o * 2**acc_bits)) % 2**acc_bits
+                        for o in offsets]
+        dithered = Signal(acc_bits)
+        lookup = Signal(acc_bits)
+        self.sync += dithered.eq(self.phase + noise)
+        for k, word in enumerate(offset_words):
+            self.sync += If(step[k + 1], lookup.eq(dithered + word))
+        self.comb += self.rom.phase.eq(lookup[-addr_bits:])
+
+        for k, value in enumerate(self.values):
+            self.sync += If(step[k + 2 + SineROM.latency], value.eq(self.rom.value))
+        self.comb += self.valid.eq(step[nout + 2 + SineROM.latency])
+
+    def tuning(self, freq):
+        """
+            The tuning word for 'freq' Hz.
+        """
+        word = int(round(freq * 2**self.acc_bits / self.sample_rate))
+        if not 0 <= word < 2**(self.acc_bits - 1):
+            raise ValueError(f"{freq} Hz is out of range at a sample rate "
+                             f"of {self.sample_rate} Hz")
+        return word
+
+    def frequency(self, word):
+        """
+            The frequency (in Hz) that tuning word 'word' produces.
+        """
+        return word * self.sample_rate / 2**self.acc_bits
@@ -0,0 +1,302 @@
+#
+# vim: expandtab:ts=4:
+#
+# A logic analyzer that lives in the FPGA next to the design.
+#
+# When something only goes wrong on the board the choices so far have been
+# the LEDs or wiring a signal out to a spare PMOD pin (the way d7 shows
+# the top bit of the DDS phase in simple_tone.py) and rebuilding to look
+# at a different one. LogicAnalyzer is given a list of signals to watch,
+# the probes,
+#
+#    self.submodules.la = LogicAnalyzer(platform, [
+#        ("lrclk", lrclk), ("sdo", sdo), ("count", count[:4]),
+#    ], depth=1024)
+#
+# and keeps the last 'depth' samples of all of them in block RAM, one
+# sample a clock (or every time 'ce' is high). It is armed over the
+# iCEBreaker's serial port (the FTDI chip's second channel) with a
+# trigger, runs until the trigger happens and then another 'depth' -
+# 'pre' samples, and sends the lot back, so the capture has 'pre'
+# samples from before the trigger, the sample it triggered on and the
+# ones after it.
+#
+# The trigger is set when it is armed, not when the design is built. It
+# is three masks over the probe bits: 'mask' picks the bits that have to
+# match 'value', and 'edge' the bits that also have to have changed
+# since the sample before. So "lrclk rises" is mask = edge = the lrclk
+# bit and value = 1, and all three 0 triggers straight away. A 'trigger'
+# expression given when it is built has to be true as well.
+#
+# The serial protocol is as simple as it gets, the host sends
+#
+#    'A' mask value edge
+#
+# each of them 'nbytes' bytes (the probe bits, least significant byte
+# first) and once the capture is done gets back 'depth' samples of
+# 'nbytes' bytes each, oldest first. tools/la2vcd.py does the host side
+# and writes a VCD file, and describe() (or write_description()) tells
+# it the names, widths and offsets of the probes, the depth and the
+# sample rate.
+#
+# The probe bits are packed in the order they are given, the first one
+# at the bottom. It is limited to 64 bits of probes.
+#
+from migen import *
+from litex.soc.cores.uart import RS232PHY
+
+from cores.clockplan import ClockPlan
+from tools.describe import write_json
+
+# what the host sends to arm the analyzer
+ARM = ord("A")
+
+
+def _probes(probes):
+    """
+        'probes' as a list of (name, signal), the signals can be given
+        on their own if they are Signals (they are named after their
+        own names).
+    """
+    named = []
+    for probe in probes.items() if isinstance(probes, dict) else probes:
+        if isinstance(probe, tuple):
+            name, signal = probe
+        elif isinstance(probe, Signal):
+            name, signal = probe.backtrace[-1][0], probe
+        else:
+            raise ValueError(f"{probe} needs a name, give it as (name, signal)")
+        named.append((name, signal))
+    return named
+
+
+class _Core(Module):
+    """
+        The analyzer itself in 'sys', see LogicAnalyzer.
+    """
+    def __init__(self, pads, probes, depth, pre, clk_freq, baudrate, trigger, ce):
+        width = sum(len(s) for _, s in probes)
+        nbytes = (width + 7) // 8
+        post = depth - pre - 1
+        self.armed = Signal()
+        self.triggered = Signal()
+
+        self.submodules.phy = phy = RS232PHY(pads, clk_freq, baudrate)
+
+        #
+        # The probes are registered, and then compared with the trigger
+        # into another register, so that neither the probes' own logic
+        # nor the comparison ends up in the same clock as the state
+        # machine. 'sample', 'sample_ce' and 'fire' are all two clocks behind
+        # the probes.
+        #
+        probed = Signal(width)
+        probed_ce = Signal()
+        probed_trigger = Signal()
+        previous = Signal(width)
+        sample = Signal(width)
+        sample_ce = Signal()
+        fire = Signal()
+        mask = Signal(width)
+        value = Signal(width)
+        edge = Signal(width)
+        self.sync += [
+            probed.eq(Cat(*[s for _, s in probes])),
+            probed_ce.eq(ce),
+            probed_trigger.eq(trigger),
+            If(probed_ce, previous.eq(probed)),
+            sample.eq(probed),
+            sample_ce.eq(probed_ce),
+            fire.eq(probed_ce & probed_trigger &
+                    (((probed ^ value) & mask) == 0) &
+                    (((probed ^ previous) & edge) == edge)),
+        ]
+
+        self.specials.memory = memory = Memory(width, depth)
+        self.specials.wrport = wrport = memory.get_port(write_capable=True)
+        self.specials.rdport = rdport = memory.get_port()
+
+        #
+        # 'setup' collects the three masks a byte at a time, the first
+        # byte ends up at the bottom.
+        #
+        setup = Signal(3 * 8 * nbytes)
+        received = Signal(max=3 * nbytes + 1)
+        ptr = Signal(max=depth)
+        count = Signal(max=depth + 1)
+        word = Signal(width)
+        byte = Signal(max=max(nbytes, 2))
+        sent = Signal(max=depth + 1)
+        self.comb += [
+            mask.eq(setup[:width]),
+            value.eq(setup[8 * nbytes:8 * nbytes + width]),
+            edge.eq(setup[16 * nbytes:16 * nbytes + width]),
+            wrport.adr.eq(ptr),
+            wrport.dat_w.eq(sample),
+            rdport.adr.eq(ptr + sent),
+            phy.sink.data.eq(Array(word[8 * i:8 * (i + 1)]
+                                   for i in range(nbytes))[byte]),
+        ]
+
+        # the bytes from the host, a clock later to keep the UART's own
+        # logic out of the state machine's
+        rx_valid = Signal()
+        rx_data = Signal(8)
+        self.sync += [
+            rx_valid.eq(phy.source.valid),
+            rx_data.eq(phy.source.data),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(rx_valid & (rx_data == ARM),
+                NextValue(received, 0),
+                NextState("SETUP")
+            )
+        )
+        fsm.act("SETUP",
+            If(rx_valid,
+                NextValue(setup, Cat(setup[8:], rx_data)),
+                NextValue(received, received + 1),
+                If(received == 3 * nbytes - 1,
+                    NextValue(count, 0),
+                    NextState("FILL")
+                )
+            )
+        )
+        # the samples before the trigger
+        fsm.act("FILL",
+            self.armed.eq(1),
+            If(sample_ce,
+                wrport.we.eq(1),
+                NextValue(ptr, ptr + 1),
+                NextValue(count, count + 1),
+                If(count == pre - 1,
+                    NextState("WAIT")
+                )
+            ) if pre else NextState("WAIT")
+        )
+        fsm.act("WAIT",
+            self.armed.eq(1),
+            If(sample_ce,
+                wrport.we.eq(1),
+                NextValue(ptr, ptr + 1),
+                If(fire,
+                    NextValue(count, 0),
+                    NextValue(sent, 0),
+                    NextState("POST" if post else "READ")
+                )
+            )
+        )
+        # the rest after it, until the oldest sample is at 'ptr'
+        fsm.act("POST",
+            self.triggered.eq(1),
+            If(sample_ce,
+                wrport.we.eq(1),
+                NextValue(ptr, ptr + 1),
+                NextValue(count, count + 1),
+                If(count == post - 1,
+                    NextState("READ")
+                )
+            )
+        )
+        # the read port has the sample a clock after it is addressed
+        fsm.act("READ",
+            self.triggered.eq(1),
+            NextState("LATCH")
+        )
+        fsm.act("LATCH",
+            self.triggered.eq(1),
+            NextValue(word, rdport.dat_r),
+            NextValue(byte, 0),
+            NextState("SEND")
+        )
+        fsm.act("SEND",
+            self.triggered.eq(1),
+            phy.sink.valid.eq(1),
+            If(phy.sink.ready,
+                NextValue(byte, byte + 1),
+                If(byte == nbytes - 1,
+                    NextValue(sent, sent + 1),
+                    If(sent == depth - 1,
+                        NextState("IDLE")
+                    ).Else(
+                        NextState("READ")
+                    )
+                )
+            )
+        )
+
+
+class LogicAnalyzer(Module):
+    """
+        Captures 'depth' samples of 'probes' (a list of (name, signal),
+        or of Signals) into block RAM around a trigger, 'pre' of them
+        (half by default) before it, and sends them out of 'pads' (the
+        platform's serial port if they aren't given) at 'baudrate'.
+
+        It runs in 'domain', sampling on every clock unless 'ce' (an
+        expression) is given, in which case 'rate' is how often (in Hz)
+        it is high. 'trigger' is an expression that has to be true for
+        it to trigger, on top of the one it was armed with.
+
+        'armed' is high from being armed until it triggers, and
+        'triggered' from then until the capture has been sent, for an
+        LED.
+    """
+    def __init__(self, platform, probes, depth=512, pre=None, domain="sys",
+                 baudrate=1000000, pads=None, trigger=1, ce=1, rate=None):
+        self.probes = _probes(probes)
+        self.depth = depth
+        self.pre = depth // 2 if pre is None else pre
+        self.width = sum(len(s) for _, s in self.probes)
+        self.nbytes = (self.width + 7) // 8
+        clk_freq = ClockPlan.of(platform).freq(domain)
+        self.rate = clk_freq if rate is None else rate
+        self.baudrate = baudrate
+        if not self.probes or self.width > 64:
+            raise ValueError(f"The probes are {self.width} bits, it has to be "
+                             f"between 1 and 64")
+        if depth < 2 or depth & (depth - 1):
+            raise ValueError(f"The depth has to be a power of 2, not {depth}")
+        if not 0 <= self.pre < depth:
+            raise ValueError(f"pre has to be less than the depth ({depth}), "
+                             f"not {self.pre}")
+        if clk_freq < 4 * baudrate:
+            raise ValueError(f"{baudrate} baud is too fast for a "
+                             f"{clk_freq / 1e6:.2f} MHz clock")
+
+        if pads is None:
+            pads = platform.request("serial")
+        core = _Core(pads, self.probes, depth, self.pre, clk_freq, baudrate,
+                     trigger, ce)
+        if domain != "sys":
+            core = ClockDomainsRenamer(domain)(core)
+        self.submodules.core = core
+        self.armed = core.armed
+        self.triggered = core.triggered
+
+    def describe(self):
+        """
+            What the host needs to know to make sense of a capture.
+        """
+        probes = []
+        offset = 0
+        for name, signal in self.probes:
+            probes.append({"name": name, "width": len(signal), "offset": offset})
+            offset += len(signal)
+        return {
+            "probes": probes,
+            "width": self.width,
+            "nbytes": self.nbytes,
+            "depth": self.depth,
+            "pre": self.pre,
+            "rate": self.rate,
+            "baudrate": self.baudrate,
+        }
+
+    def write_description(self, path):
+        """
+            Writes describe() to 'path' as JSON, for tools/la2vcd.py.
+        """
+        write_json(path, self.describe())
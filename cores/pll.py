@@ -0,0 +1,299 @@
+#
+# vim: expandtab:ts=4:
+#
+# The iCE40 PLL, moved here from the simple_tone example so that the
+# other audio examples can use it too.
+#
+# The PLL multiplies the 12 MHz crystal up to the clock we want. In
+# "simple" feedback mode the output is
+#
+#    f_out = 12 MHz * (DIVF + 1) / ((DIVR + 1) * 2^DIVQ)
+#
+# and the data sheet puts limits on the steps along the way: the
+# crystal divided by DIVR + 1 (the phase detector or PFD frequency) has
+# to be 10 to 133 MHz, that times DIVF + 1 (the VCO) has to be 533 to
+# 1066 MHz and the output 16 to 275 MHz. FILTER_RANGE depends on the PFD
+# frequency. pll_config() searches all of the legal settings for the
+# ones closest to the frequency asked for, the same way the icepll tool
+# from icestorm does.
+#
+from functools import lru_cache
+
+from migen import *
+from migen.genlib.resetsync import AsyncResetSynchronizer
+
+from cores.clockplan import ClockPlan
+
+
+F_PFD = (10, 133)       # MHz
+F_VCO = (533, 1066)
+F_OUT = (16, 275)
+
+
+class PLLConfig:
+    """
+        One set of PLL settings. 'freq' is the output (in MHz) they
+        give, 'error' is how far that is from what was asked for (as a
+        fraction, so 0.005 is half a percent). 'freq_b' and 'select_b'
+        are the same for the second output, which can be the same
+        frequency as the first or half of it.
+    """
+    def __init__(self, fin, divr, divf, divq):
+        self.fin = fin
+        self.divr = divr
+        self.divf = divf
+        self.divq = divq
+        self.pfd = fin / (divr + 1)
+        self.vco = self.pfd * (divf + 1)
+        self.freq = self.vco / 2**divq
+        pfd = self.pfd
+        self.filter_range = (1 if pfd < 17 else 2 if pfd < 26 else
+                             3 if pfd < 44 else 4 if pfd < 66 else
+                             5 if pfd < 101 else 6)
+        self.target = self.freq
+        self.error = 0.0
+        self.select_b = "GENCLK"
+        self.freq_b = self.freq
+        self.target_b = self.freq
+        self.error_b = 0.0
+
+    def __str__(self):
+        r = (f"PLL DIVR={self.divr} DIVF={self.divf} DIVQ={self.divq} "
+             f"FILTER_RANGE={self.filter_range}: "
+             f"{self.freq:.4f} MHz ({self.error * 100:+.3f}%)")
+        if self.target_b != self.target:
+            r += f", B {self.freq_b:.4f} MHz ({self.error_b * 100:+.3f}%)"
+        return r
+
+
+@lru_cache(maxsize=None)
+def _table(fin):
+    """
+        Every legal setting for a 'fin' MHz input, sorted by output
+        frequency. There are a few thousand so this is worked out once
+        and then searched.
+    """
+    table = []
+    for divr in range(16):
+        pfd = fin / (divr + 1)
+        if not F_PFD[0] <= pfd <= F_PFD[1]:
+            continue
+        for divf in range(128):
+            vco = pfd * (divf + 1)
+            if not F_VCO[0] <= vco <= F_VCO[1]:
+                continue
+            for divq in range(1, 7):
+                fout = vco / 2**divq
+                if F_OUT[0] <= fout <= F_OUT[1]:
+                    table.append((fout, divr, divf, divq))
+    table.sort()
+    return table
+
+
+@lru_cache(maxsize=None)
+def pll_config(freq, freq_b=None, fin=12):
+    """
+        Returns the PLLConfig whose output is closest to 'freq' MHz, or
+        if 'freq_b' is given whose two outputs together are closest to
+        'freq' and 'freq_b'. The second output can only be the same
+        frequency as the first or half of it so 'freq_b' picks which.
+        When two settings are as close as each other the one with the
+        higher PFD frequency (smaller DIVR) wins, it has less jitter.
+    """
+    for f in (freq, freq_b or freq):
+        if not F_OUT[0] <= f <= F_OUT[1]:
+            raise ValueError(f"The PLL can't make {f} MHz, it goes from "
+                             f"{F_OUT[0]} to {F_OUT[1]} MHz")
+    table = _table(fin)
+    if freq_b is None:
+        select_b = "GENCLK"
+    elif abs(freq_b - freq / 2) < abs(freq_b - freq):
+        select_b = "GENCLK_HALF"
+    else:
+        select_b = "GENCLK"
+
+    def cost(t):
+        fout = t[0]
+        err = abs(fout - freq) / freq
+        if freq_b is not None:
+            fout_b = fout / 2 if select_b == "GENCLK_HALF" else fout
+            err += abs(fout_b - freq_b) / freq_b
+        return (err, t[1])
+
+    best = min(table, key=cost)
+    config = PLLConfig(fin, *best[1:])
+    config.target = freq
+    config.error = (config.freq - freq) / freq
+    config.select_b = select_b
+    config.freq_b = config.freq / 2 if select_b == "GENCLK_HALF" else config.freq
+    config.target_b = freq if freq_b is None else freq_b
+    config.error_b = (config.freq_b - config.target_b) / config.target_b
+    return config
+
+
+#
+# This sets up the ICE40 PLL hard block.
+#
+class PLL(Module):
+    """
+        This sets up the built-in PLL hardware to generate a clock
+        based on the input crystal which is higher in frequency
+        than the crystal. It does this using a PLL.
+
+        The output frequency is (12 Mhz * (DIVF + 1))/(2^DIVQ *
+        (DIVR + 1)) in simple feedback mode, pll_config() picks the
+        dividers.
+
+        This code was taken largely from @tnt's NitroFPGA
+        repos. 
+
+        The frequencies are in MHz and can be anything from 16 to 275
+        but only some of them can be made exactly, 'freq' and
+        'i2s_freq' (and 'config') are what it actually made.
+    """
+    def __init__(self, plat, freq, i2s_freq=None):
+        """
+            Takes platform and the frequency of the sys clock domain.
+            The i2s clock domain is the same unless 'i2s_freq' is given,
+            it can be the same as 'freq' or half of it (the two outputs
+            share the PLL's VCO).
+        """
+        self.config = pll_config(freq, i2s_freq)
+        self.freq = self.config.freq
+        self.i2s_freq = self.config.freq_b
+
+        # our copy of reset
+        self.rst = Signal(1)
+
+        #
+        # These steps add three new clock domains. Previously
+        # there was only one domain which is the default reference
+        # domain (sys). Clock domains are global to the design so
+        # when you create them they are available in all modules.
+        #
+        # They are named "cd_<xxx>" (cd is "clock domain") and is
+        # required. So these three domains are sys, por, and i2s.
+        # Migen can work the name out from the "cd_<xxx>" but it does
+        # that by reading the caller's bytecode, which not every python
+        # version lets it do, so it is given as well.
+        #
+        self.clock_domains.cd_sys = ClockDomain("sys")
+        self.clock_domains.cd_por = ClockDomain("por", reset_less=True)
+        self.clock_domains.cd_i2s = ClockDomain("i2s")
+
+        #
+        # The timing constraints for the two domains are added by the
+        # design's ClockPlan (see cores/clockplan.py), which is made
+        # here so that everything built after the PLL (and the power on
+        # reset below) gets its clock frequencies from it. 'domains' is
+        # what it is made from, the clock domains the PLL drives and how
+        # fast (in Hz) they run.
+        #
+        self.domains = {
+            "sys": (self.cd_sys, self.freq * 1e6),
+            "i2s": (self.cd_i2s, self.i2s_freq * 1e6),
+        }
+        self.clocks = ClockPlan(plat, self)
+
+        #
+        # We'll use the 12 MHz clock to feed the PLL
+        #
+        clk12 = plat.request("clk12")
+        #
+        # This is the  button on the icebreaker, we'll treat it as
+        # reset.
+        #
+        rst_n = plat.request("user_btn_n")
+
+        # Power on Reset
+        #
+        # PLLs don't "lock" right away, they have to synchronize the VCO
+        # with the source clock so that they are stable. So at power-on there
+        # will be some time before the PLL is "locked" onto it's frequency.
+        # This code has a 16 bit counter (por_count) that counts down from
+        # 65535 to 0 as the power on delay. It is tied to the clock input
+        # which will be 12 MHz so it will take about 5.4mS for it to count down.
+        # (When it is simulated with a scaled ClockPlan the delay is
+        # scaled down too.)
+        #
+        por_count = Signal(16, reset=max(1, int((2**16-1) / self.clocks.scale)))
+        por_done = Signal(1)
+        #
+        # This combinatorial code wires ClockSignal() to the power on
+        # reset clock domain's clk line. This is why it runs at 12MHz
+        #
+        self.comb += self.cd_por.clk.eq(ClockSignal())
+
+        #
+        # This combinatorial code sets the state of "por_done" to the boolean
+        # por_count == 0, which is to say power on reset is "done" once the
+        # por_count register has been decremented to 0.
+        #
+        self.comb += por_done.eq(por_count == 0)
+        
+        #
+        # This sequential code is running in the power on reset clock domain
+        # which you can tell because it isn't self.sync, rather 
+        # it is self.sync.por All clock domains are name self.sync.<domain>
+        # which is the name minus the 'cd_' prefix.
+        #
+        # The code just decrements por_count until por_done goes True (which
+        # will happen by the above combinatorial code)
+        #
+        self.sync.por += If(~por_done, por_count.eq(por_count - 1))
+
+        #
+        # This is a signal that comes off the PLL that says it is locked.
+        #
+        pll_locked = Signal(1)
+        #
+        # And this is a bit magical. There is a "hard block" (which means
+        # not configurable gates but a specific circuit for doing a specific
+        # thing) for the PLL. You can look up its I/Os in the Ice40 datasheet
+        # and the ones we're using are assigned in this call to 'Instance'
+        #
+        # The Instance definition has named parameters for all of the i/os
+        # that go to and come from the hard block, during the invocation
+        # it is our job to wire them to things in our module.
+        #
+        # The important ones are wiring the outputs (GLOBALA and GLOBALB)
+        # to clock domains, connecting the clk12 pin to the input, and
+        # wiring the PLL locked indication to a signal we can use in our
+        # code.
+        #
+        # Instance is a migen function that instantiates a hard block. We'll
+        # use this again later for other hardware in the chip.
+        #
+        # The dividers come from pll_config() (see the top of this file).
+        # It used to set DIVR to 2, DIVQ to 2 and DIVF to freq - 1 which
+        # divides the VCO by 12 and multiplies the 12 MHz crystal by
+        # freq, easy, but it runs the phase detector at 4 MHz and the
+        # VCO at 4 * freq both of which are below what the data sheet
+        # allows.
+        #
+        # The second output (B) is the same clock as A or half of it.
+        #
+        self.specials += Instance("SB_PLL40_2F_PAD",
+            p_DIVR = self.config.divr,
+            p_DIVF = self.config.divf,
+            p_DIVQ = self.config.divq,
+            p_FILTER_RANGE = self.config.filter_range,
+            p_FEEDBACK_PATH = "SIMPLE",    # simple feedback
+            p_PLLOUT_SELECT_PORTA = "GENCLK",
+            p_PLLOUT_SELECT_PORTB = self.config.select_b,
+            i_PACKAGEPIN = clk12,
+            o_PLLOUTGLOBALA = self.cd_sys.clk,
+            o_PLLOUTGLOBALB = self.cd_i2s.clk,
+            i_RESETB = rst_n,
+            o_LOCK = pll_locked,
+        )
+
+        #
+        # The Reset Synchronizer makes sure that the clock domains are
+        # synchronized. In this case they are synchronized to the power
+        # on countdown being done.
+        #
+        self.specials += [
+            AsyncResetSynchronizer(self.cd_sys, ~por_done | ~pll_locked),
+            AsyncResetSynchronizer(self.cd_i2s, ~por_done | ~pll_locked),
+        ]
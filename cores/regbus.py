@@ -0,0 +1,357 @@
+#
+# vim: expandtab:ts=4:
+#
+# Registers that the host can read and write while the design runs.
+#
+# Everything the examples can be tuned with (the counting rate, the
+# display's refresh, the tone's frequency) is fixed when the design is
+# elaborated, so trying a different one is a yosys and nextpnr run. LiteX
+# already has most of what it takes to do better: control and status
+# registers (CSRStorage, CSRStatus, see litex/soc/interconnect/csr.py) and
+# the banks that put them on a bus. A module puts its tunables in CSRs and
+# mixes in AutoCSR,
+#
+#    class Counter(Module, AutoCSR):
+#        def __init__(self):
+#            self.submodules.rate = Rate(ClockPlan.of(platform).freq(), 10)
+#            self.value = CSRStorage(8, name="value")
+#            ...
+#            self.submodules.regbus = RegisterBus(platform, {"counter": self})
+#
+# and RegisterBus hangs all of them on the iCEBreaker's serial port (the
+# FTDI chip's second channel). Each module in the dict gets a bank of
+# registers and each register is one 32 bit word, named after the bank
+# and the CSR ("counter_value", "counter_rate_divisor"). The CSRs are
+# given their names, as the clock domains are, because migen can only
+# work them out from the caller's bytecode on some pythons. describe() (or
+# write_map()) says where they all ended up, and tools/regclient.py
+# reads and writes them by name.
+#
+# The bridge from the serial port to the bus speaks the UARTBone protocol,
+# so litex_server works too:
+#
+#    command (1 write, 2 read) length address data...
+#
+# with the word address and the data big endian, a read answers with
+# 'length' words. The bytes from the host go through a FIFO, so the host
+# can send a whole batch of commands without waiting for the answers.
+#
+# It isn't LiteX's UARTBone though. Its Stream2Wishbone bridge (and the
+# RS232PHY in front of it) have too much logic between their registers
+# for 05_tone's 50 MHz clock, so _Bridge does the same job straight onto
+# the CSR bus with a state machine that only looks at registers, and the
+# serial port is cores/uart.py.
+#
+# Rate is the programmable version of a Timebase strobe: a counter whose
+# divisor is a register, so the design starts at the rate it was built
+# with and the host can change it.
+#
+from types import SimpleNamespace
+
+from migen import *
+from litex.soc.cores.uart import (CMD_WRITE_BURST_INCR, CMD_READ_BURST_INCR,
+                                  CMD_WRITE_BURST_FIXED, CMD_READ_BURST_FIXED)
+from litex.soc.interconnect import csr_bus, stream
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+
+from cores.clockplan import ClockPlan
+from cores.uart import UARTPHY
+from tools.describe import write_json
+
+# the bytes from the host that can wait while an answer goes out
+FIFO_DEPTH = 64
+
+# how long (in seconds) a command can stop half way before it is dropped
+TIMEOUT = 0.1
+
+# each bank has room for 16 registers and there are up to 32 banks, LiteX
+# SoCs give each bank 512 but the fewer address bits the bank selects
+# look at the faster they are
+PAGING = 0x40
+ADDRESS_WIDTH = 9
+
+
+def in_hertz(csr, divides=None, multiplies=None):
+    """
+        Says how to set 'csr' from a frequency, for the host: the value
+        is 'divides' / Hz (a divisor) or Hz * 'multiplies' (a DDS tuning
+        word). It ends up in the register map as "hertz".
+    """
+    if divides is not None:
+        csr.hertz = {"divides": divides}
+    else:
+        csr.hertz = {"multiplies": multiplies}
+    return csr
+
+
+class Rate(Module, AutoCSR):
+    """
+        A strobe, 'tick', that is high for one clock every 'divisor'
+        clocks, where 'divisor' is a register that starts out at the
+        divisor for 'rate' Hz from a 'clk_freq' Hz clock. 'width' is how
+        many bits the divisor has, by default enough to go down to 1 Hz.
+    """
+    def __init__(self, clk_freq, rate, width=None):
+        if width is None:
+            width = bits_for(int(clk_freq))
+        self.tick = Signal()
+        self.divisor = CSRStorage(width, reset=int(round(clk_freq / rate)),
+                                  name="divisor")
+        in_hertz(self.divisor, divides=clk_freq)
+
+        #
+        # It counts down to 0 and starts again from the divisor - 1,
+        # which is worked out a clock ahead so that the subtraction isn't
+        # in the same clock as the count (a divisor of 0 ticks on every
+        # clock, like 1). A new divisor starts a new period straight
+        # away rather than waiting for the old one to run out.
+        #
+        count = Signal(width)
+        last = Signal(width)
+        self.sync += [
+            last.eq(Mux(self.divisor.storage == 0, 0,
+                        self.divisor.storage - 1)),
+            If(self.divisor.re,
+                count.eq(0),
+                self.tick.eq(0)
+            ).Elif(count == 0,
+                count.eq(last),
+                self.tick.eq(1)
+            ).Else(
+                count.eq(count - 1),
+                self.tick.eq(0)
+            )
+        ]
+
+
+class _Bridge(Module):
+    """
+        Turns UARTBone commands from 'sink' into cycles on 'bus' (a
+        csr_bus.Interface) and sends the answers to reads to 'source'.
+        A command that stops coming for 'timeout' clocks is forgotten.
+    """
+    def __init__(self, bus, timeout):
+        self.sink = sink = stream.Endpoint([("data", 8)])
+        self.source = source = stream.Endpoint([("data", 8)])
+
+        write = Signal()
+        read = Signal()
+        incr = Signal()
+        empty = Signal()
+        length = Signal(8)
+        address = Signal(32)
+        data = Signal(32)
+        byte = Signal(2)
+        last = Signal()
+        self.comb += [
+            bus.adr.eq(address),
+            bus.dat_w.eq(data),
+            source.data.eq(data[24:]),
+        ]
+
+        #
+        # Everything the state machine looks at is a register, so that
+        # it can keep up with a 50 MHz clock: 'last' is whether the word
+        # being read or written is the last one of the command, and
+        # 'expired' whether the timeout has run out. The command and
+        # whether the length is 0 are decoded as they come in.
+        #
+        expired = Signal()
+        timer = Signal(max=timeout + 1, reset=timeout)
+        self.sync += [
+            If((sink.valid & sink.ready) | (source.valid & source.ready),
+                timer.eq(timeout)
+            ).Elif(timer != 0,
+                timer.eq(timer - 1)
+            ),
+        ]
+
+        self.submodules.fsm = fsm = ResetInserter()(FSM(reset_state="COMMAND"))
+        self.sync += expired.eq((timer == 0) & ~fsm.ongoing("COMMAND"))
+        fsm.act("COMMAND",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(write, (sink.data == CMD_WRITE_BURST_INCR) |
+                                 (sink.data == CMD_WRITE_BURST_FIXED)),
+                NextValue(read, (sink.data == CMD_READ_BURST_INCR) |
+                                (sink.data == CMD_READ_BURST_FIXED)),
+                NextValue(incr, (sink.data == CMD_WRITE_BURST_INCR) |
+                                (sink.data == CMD_READ_BURST_INCR)),
+                NextState("LENGTH")
+            )
+        )
+        fsm.act("LENGTH",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(length, sink.data),
+                NextValue(empty, sink.data == 0),
+                NextValue(byte, 0),
+                NextState("ADDRESS")
+            )
+        )
+        fsm.act("ADDRESS",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(address, Cat(sink.data, address)),
+                NextValue(byte, byte + 1),
+                NextValue(last, length == 1),
+                If(byte == 3,
+                    If(empty,
+                        NextState("COMMAND")
+                    ).Elif(write,
+                        NextState("DATA")
+                    ).Elif(read,
+                        NextState("READ")
+                    ).Else(
+                        NextState("COMMAND")
+                    )
+                )
+            )
+        )
+        fsm.act("DATA",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(data, Cat(sink.data, data)),
+                NextValue(byte, byte + 1),
+                If(byte == 3,
+                    NextState("WRITE")
+                )
+            )
+        )
+        fsm.act("WRITE",
+            NextState("NEXT")
+        )
+        # the bank has the register a clock after it is addressed
+        fsm.act("READ",
+            NextState("LATCH")
+        )
+        fsm.act("LATCH",
+            NextValue(data, bus.dat_r),
+            NextState("SEND")
+        )
+        # the next byte is shifted up a clock after this one goes, so the
+        # UART's 'ready' doesn't have to reach all 32 bits of 'data'
+        fsm.act("SEND",
+            source.valid.eq(1),
+            If(source.ready,
+                NextState("SHIFT")
+            )
+        )
+        fsm.act("SHIFT",
+            NextValue(data, data << 8),
+            NextValue(byte, byte + 1),
+            If(byte == 3,
+                NextState("NEXT")
+            ).Else(
+                NextState("SEND")
+            )
+        )
+        fsm.act("NEXT",
+            NextValue(address, address + incr),
+            NextValue(length, length - 1),
+            NextValue(last, length == 2),
+            If(last,
+                NextState("COMMAND")
+            ).Elif(write,
+                NextState("DATA")
+            ).Else(
+                NextState("READ")
+            )
+        )
+        #
+        # The banks decode the address and the strobe into every
+        # register's write enable, so the strobes come straight from
+        # registers (after_entering() is one, WRITE and READ are only a
+        # clock long) rather than from the state.
+        #
+        self.comb += [
+            bus.we.eq(fsm.after_entering("WRITE")),
+            bus.re.eq(fsm.after_entering("READ")),
+            fsm.reset.eq(expired),
+        ]
+
+
+class RegisterBus(Module):
+    """
+        Makes the CSRs of 'banks' (a dict of name -> AutoCSR module)
+        readable and writable over 'pads' (the platform's serial port
+        if they aren't given) at 'baudrate'. It runs in sys.
+
+        The banks are scanned when the design is finalized (or
+        describe() is called), so the registers can be added after the
+        RegisterBus is made.
+    """
+    def __init__(self, platform, banks, baudrate=1000000, pads=None):
+        self.banks = dict(banks)
+        self.clk_freq = ClockPlan.of(platform).freq()
+        self.baudrate = baudrate
+        if self.clk_freq < 4 * baudrate:
+            raise ValueError(f"{baudrate} baud is too fast for a "
+                             f"{self.clk_freq / 1e6:.2f} MHz clock")
+        if len(self.banks) > 32:
+            raise ValueError(f"There is only room for 32 banks, not "
+                             f"{len(self.banks)}")
+        if pads is None:
+            pads = platform.request("serial")
+        self.pads = pads
+
+    def do_finalize(self):
+        self.submodules.phy = phy = UARTPHY(self.pads, self.clk_freq,
+                                            self.baudrate)
+        #
+        # The PHY hands over each byte for one clock and doesn't wait,
+        # but the bridge isn't listening while it sends an answer, so
+        # the bytes wait in a FIFO instead of being lost.
+        #
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", 8)],
+                                                       FIFO_DEPTH, buffered=True)
+        csrs = csr_bus.Interface(data_width=32, address_width=ADDRESS_WIDTH)
+        self.submodules.bridge = bridge = _Bridge(csrs,
+                                                  int(TIMEOUT * self.clk_freq))
+        self.comb += [
+            phy.source.connect(fifo.sink),
+            fifo.source.connect(bridge.sink),
+            bridge.source.connect(phy.sink),
+        ]
+        names = list(self.banks)
+        self.submodules.bankarray = csr_bus.CSRBankArray(
+            SimpleNamespace(**self.banks),
+            lambda name, memory: names.index(name) if memory is None else None,
+            data_width=32, address_width=ADDRESS_WIDTH, paging=PAGING)
+        self.submodules.interconnect = csr_bus.Interconnect(
+            csrs, self.bankarray.get_buses())
+
+    def describe(self):
+        """
+            Where the registers are, for the host. The banks are scanned
+            now if they haven't been, so this comes after the design is
+            made (it is fine to call before it is built).
+        """
+        self.finalize()
+        registers = {}
+        for bank, csrs, mapaddr, rmap in self.bankarray.banks:
+            for c in csrs:
+                simple = getattr(c, "simple_csrs", [c])
+                register = {
+                    "address": mapaddr * PAGING // 4 +
+                               rmap.simple_csrs.index(simple[0]),
+                    "words": len(simple),
+                    "size": c.size,
+                    "access": "ro" if isinstance(c, CSRStatus) else "rw",
+                }
+                if isinstance(c, CSRStorage):
+                    register["reset"] = c.storage.reset.value
+                if hasattr(c, "hertz"):
+                    register["hertz"] = c.hertz
+                registers[f"{bank}_{c.name}"] = register
+        return {
+            "clk_freq": self.clk_freq,
+            "baudrate": self.baudrate,
+            "registers": registers,
+        }
+
+    def write_map(self, path):
+        """
+            Writes describe() to 'path' as JSON, for tools/regclient.py.
+        """
+        write_json(path, self.describe())
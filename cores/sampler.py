@@ -0,0 +1,375 @@
+#
+# vim: expandtab:ts=4:
+#
+# A sample player, with its samples in the UP5K's SPRAM.
+#
+# The tone and the chords work their samples out from a sine table in
+# block RAM, and there are only 30 of those (15 kB). The UP5K has another
+# 128 kB that the examples haven't used (07_soc makes it the CPU's
+# memory): four single port RAMs (SB_SPRAM256KA) of 16k 16 bit words
+# each. That is 65536 16 bit samples, two seconds at 32 kHz, or a lot of
+# wavetables, and being hard blocks they cost no LUTs.
+#
+# SampleMemory puts the four together as one memory with one port. Like
+# the DSP in the voice engine (cores/voices.py) they are Instances, which
+# Migen can't simulate, so spram=False makes the same thing out of a
+# Memory (which a build would put in block RAM).
+#
+# SamplePlayer plays 'regions' of it. A region is where it starts, how
+# many samples long it is, whether it loops or plays once (one shot) and
+# how fast it is played: 'increment' is how far to step through it per
+# sample, in 16.16 fixed point, so 1.0 (0x10000) plays the samples as
+# they are, 2.0 an octave up and 0.5 an octave down (the position is
+# rounded down to a sample, there is no interpolation). A single cycle
+# wave in a looping region of 'length' samples is a wavetable oscillator
+# at
+#
+#    f = increment * sample_rate / (length * 2^16)
+#
+# Pulsing 'play' starts the region on the inputs. The one that was
+# playing doesn't stop at once: the output crossfades from it to the new
+# one, the new one's gain going up by 'fade' (out of 32768) every sample,
+# so a fade of 32768 / n takes n samples and 0 cuts straight over. So
+# there are two voices and a region always starts on the one that isn't
+# playing, the other one is the one fading out. A region with a length of
+# 0 is silence, playing it fades the output out.
+#
+# The memory has one port and the player has to share it with whatever
+# loads the samples. A sample only needs two reads (one for each voice)
+# every 1536 clocks so the player does the writes in between: 'write'
+# asks for the two samples in 'data' to be written to 'address' and
+# 'address' + 1 and they are, a few clocks later.
+#
+from migen import *
+
+# each SB_SPRAM256KA is 16k words of 16 bits
+SPRAM_WORDS = 16384
+
+
+class SampleMemory(Module):
+    """
+        'words' 16 bit words of SPRAM (up to all four of them, 65536).
+        The word at 'adr' is on 'dat_r' two clocks later, and 'dat_w'
+        is written there if 'we' is high. With spram=False it is a
+        Memory, for the simulation.
+    """
+    def __init__(self, words=4 * SPRAM_WORDS, spram=True):
+        self.words = words
+        self.adr = Signal(16)
+        self.dat_w = Signal(16)
+        self.we = Signal()
+        self.dat_r = Signal(16)
+
+        #
+        # The SPRAMs are in the corners of the chip, a long way from
+        # the logic that works out the address, so everything going in
+        # is registered first. That is the extra clock.
+        #
+        adr = Signal(16)
+        dat_w = Signal(16)
+        we = Signal()
+        self.sync += [
+            adr.eq(self.adr),
+            dat_w.eq(self.dat_w),
+            we.eq(self.we),
+        ]
+
+        if not spram:
+            mem = Memory(16, words)
+            port = mem.get_port(write_capable=True, mode=READ_FIRST)
+            self.specials += mem, port
+            self.comb += [
+                port.adr.eq(adr),
+                port.dat_w.eq(dat_w),
+                port.we.eq(we),
+                self.dat_r.eq(port.dat_r),
+            ]
+            return
+
+        if words % SPRAM_WORDS or not 0 < words <= 4 * SPRAM_WORDS:
+            raise ValueError(f"The SPRAM comes in {SPRAM_WORDS} words at a "
+                             f"time, up to 4 of them, not {words}")
+        #
+        # The top two bits of the address pick the block. They all see
+        # the rest of the address, only the one picked is written, and
+        # its output is picked by the address from the clock before,
+        # when the read was done.
+        #
+        banks = words // SPRAM_WORDS
+        outputs = [Signal(16) for _ in range(banks)]
+        bank = Signal(2)
+        self.sync += bank.eq(adr[14:])
+        for n, output in enumerate(outputs):
+            self.specials += Instance("SB_SPRAM256KA",
+                i_CLOCK = ClockSignal(),
+                i_ADDRESS = adr[:14],
+                i_DATAIN = dat_w,
+                i_MASKWREN = 0b1111,
+                i_WREN = we & (adr[14:] == n),
+                i_CHIPSELECT = 1,
+                i_STANDBY = 0,
+                i_SLEEP = 0,
+                i_POWEROFF = 1,
+                o_DATAOUT = output,
+            )
+        self.comb += self.dat_r.eq(Array(outputs)[bank[:bits_for(banks - 1)]])
+
+
+class _Voice(Module):
+    """
+        One of the player's two voices. Pulsing 'load' starts the region
+        on 'start', 'length', 'loop' and 'increment' from its first
+        sample, 'address' is the sample it is on and 'advance' moves it
+        on (the new one is there five clocks later, two after a load).
+        'playing' goes low when a one shot region gets to its end.
+    """
+    def __init__(self):
+        self.start = Signal(16)
+        self.length = Signal(17)
+        self.loop = Signal()
+        self.increment = Signal(32)
+        self.load = Signal()
+        self.advance = Signal()
+        self.address = Signal(16)
+        self.playing = Signal()
+
+        base = Signal(16)
+        size = Signal(17)
+        loop = Signal()
+        increment = Signal(32)
+        # where it is in the region, 17.16 fixed point
+        offset = Signal(33)
+        low = Signal(17)
+        following = Signal(34)
+        wrapped = Signal(34)
+        inside = Signal()
+        stepped = Signal()
+        added = Signal()
+        checked = Signal()
+        #
+        # Moving on is a pipeline, so that no two adders (or an adder
+        # and the comparison) are one after the other: the step is
+        # added in two halves, the fraction and then the rest with the
+        # carry, then the end of the region is checked for and then
+        # where to go next is picked. A looping region goes back by its
+        # length, keeping the fraction, so the pitch doesn't change at
+        # the loop. The address is a register as well, it goes to the
+        # SPRAM, which is a long way from everything else.
+        #
+        self.sync += [
+            self.address.eq(base + offset[16:]),
+            If(self.load,
+                base.eq(self.start),
+                size.eq(self.length),
+                loop.eq(self.loop),
+                increment.eq(self.increment),
+                offset.eq(0),
+                self.playing.eq(self.length != 0)
+            ).Elif(self.advance & self.playing,
+                low.eq(offset[:16] + increment[:16])
+            ),
+            stepped.eq(self.advance & self.playing & ~self.load),
+            following.eq(Cat(low[:16], offset[16:] + increment[16:] + low[16])),
+            added.eq(stepped),
+            inside.eq(following[16:] < size),
+            wrapped.eq(Cat(following[:16], following[16:] - size)),
+            checked.eq(added),
+            If(checked,
+                If(inside,
+                    offset.eq(following)
+                ).Elif(loop,
+                    offset.eq(wrapped)
+                ).Else(
+                    self.playing.eq(0)
+                )
+            ),
+        ]
+
+
+class SamplePlayer(Module):
+    """
+        Plays regions of 'memory' (a SampleMemory), see the top of the
+        file. Pulse 'ce' once per sample and 'value' has the next one
+        when 'valid' is high (for one clock) a few clocks later. The
+        next region is 'start', 'length', 'loop', 'increment' and
+        'fade', and pulsing 'play' starts it. 'playing' is whether it is
+        still playing (a one shot region stops at its end).
+
+        Pulsing 'write' writes the two samples in 'data' (the bottom 16
+        bits first) to 'address' and the word after it. There should be
+        at least 10 clocks between writes.
+    """
+    def __init__(self, memory):
+        self.ce = Signal()
+        self.value = Signal((16, True))
+        self.valid = Signal()
+
+        self.start = Signal(16)
+        self.length = Signal(17)
+        self.loop = Signal()
+        self.increment = Signal(32, reset=1 << 16)
+        self.fade = Signal(16)
+        self.play = Signal()
+        self.playing = Signal()
+
+        self.address = Signal(16)
+        self.data = Signal(32)
+        self.write = Signal()
+
+        #
+        # 'current' is the voice that was started last, the other one
+        # is fading out (or has finished doing that and isn't heard).
+        #
+        voices = [_Voice() for _ in range(2)]
+        self.submodules += voices
+        current = Signal()
+        for voice in voices:
+            self.comb += [
+                voice.start.eq(self.start),
+                voice.length.eq(self.length),
+                voice.loop.eq(self.loop),
+                voice.increment.eq(self.increment),
+            ]
+        new = Array(voices)[current]
+        old = Array(voices)[~current]
+        self.comb += self.playing.eq(new.playing)
+
+        #
+        # The requests wait here until the state machine gets to them,
+        # which it does between samples.
+        #
+        writing = Signal()
+        starting = Signal()
+        sampling = Signal()
+        write_address = Signal(16)
+        write_next = Signal(16)
+        write_data = Signal(32)
+        wrote = Signal()
+        started = Signal()
+        sampled = Signal()
+        self.sync += [
+            If(self.write,
+                writing.eq(1),
+                write_address.eq(self.address),
+                write_next.eq(self.address + 1),
+                write_data.eq(self.data)
+            ).Elif(wrote,
+                writing.eq(0)
+            ),
+            If(self.play,
+                starting.eq(1)
+            ).Elif(started,
+                starting.eq(0)
+            ),
+            If(self.ce,
+                sampling.eq(1)
+            ).Elif(sampled,
+                sampling.eq(0)
+            ),
+        ]
+
+        #
+        # The gain of the new voice is 1.15 fixed point, 32767 is as
+        # near to 1.0 as it gets. Once it gets there the fade is over
+        # and the output is just the new voice.
+        #
+        gain = Signal((16, True))
+        fade = Signal(16)
+        fading = Signal()
+        old_sample = Signal((16, True))
+        new_sample = Signal((16, True))
+        # 'spread' is its own signal so that the subtraction is done in
+        # 17 bits in the Verilog too, not the 16 of 'difference'
+        spread = Signal((17, True))
+        difference = Signal((16, True))
+        product = Signal((32, True))
+        louder = Signal(17)
+        self.comb += [
+            spread.eq(new_sample - old_sample),
+            difference.eq(spread[1:]),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(writing,
+                wrote.eq(1),
+                memory.adr.eq(write_address),
+                memory.dat_w.eq(write_data[:16]),
+                memory.we.eq(1),
+                NextState("WRITE")
+            ).Elif(starting,
+                NextState("START")
+            ).Elif(sampling,
+                sampled.eq(1),
+                NextState("OLD")
+            )
+        )
+        fsm.act("WRITE",
+            memory.adr.eq(write_next),
+            memory.dat_w.eq(write_data[16:]),
+            memory.we.eq(1),
+            NextState("IDLE")
+        )
+        fsm.act("START",
+            started.eq(1),
+            NextValue(current, ~current),
+            NextValue(gain, 0),
+            NextValue(fade, self.fade),
+            NextValue(fading, self.fade != 0),
+            NextState("IDLE")
+        )
+        # the reads, each sample is there two clocks after its address
+        fsm.act("OLD",
+            memory.adr.eq(old.address),
+            NextState("NEW")
+        )
+        fsm.act("NEW",
+            memory.adr.eq(new.address),
+            NextState("FETCH")
+        )
+        fsm.act("FETCH",
+            NextValue(old_sample, Mux(old.playing, memory.dat_r, 0)),
+            NextState("ADVANCE")
+        )
+        fsm.act("ADVANCE",
+            NextValue(new_sample, Mux(new.playing, memory.dat_r, 0)),
+            NextState("MULTIPLY")
+        )
+        # yosys puts the multiply in one of the DSP blocks
+        fsm.act("MULTIPLY",
+            NextValue(product, difference * gain),
+            NextValue(louder, gain + fade),
+            NextState("MIX")
+        )
+        #
+        # old + (new - old) * gain, the difference was halved to fit
+        # the multiplier's 16 bits so the product is shifted by one
+        # less to make up for it.
+        #
+        fsm.act("MIX",
+            NextValue(self.value, Mux(fading,
+                old_sample + (product >> 14), new_sample)),
+            If(louder >= 32767,
+                NextValue(fading, 0)
+            ).Else(
+                NextValue(gain, louder)
+            ),
+            NextState("IDLE")
+        )
+        self.sync += self.valid.eq(fsm.ongoing("MIX"))
+
+        #
+        # The voices' loads and steps go to a lot of registers, so they
+        # come straight from registers (after_entering() is one) rather
+        # than from the state machine's logic. The voices move on as
+        # soon as both reads are done, so that they are at their next
+        # samples by the time the state machine can get back to OLD.
+        #
+        starts = fsm.after_entering("START")
+        advances = fsm.after_entering("FETCH")
+        self.comb += [
+            voices[0].load.eq(starts & current),
+            voices[1].load.eq(starts & ~current),
+            voices[0].advance.eq(advances),
+            voices[1].advance.eq(advances),
+        ]
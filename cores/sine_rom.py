@@ -0,0 +1,125 @@
+#
+# vim: expandtab:ts=4:
+#
+# A sine wave lookup table that lives in block RAM.
+#
+# The first version of simple_tone built its 256 entry table as an
+# Array() of 24 bit C() constants and indexed it twice for every sample.
+# Yosys turns each of those into a 256 way multiplexer, 24 bits wide,
+# made out of LUTs, which is a big chunk of the UP5K and a long
+# combinatorial path that limits how fast the clock can go.
+#
+# Two things fix that. First, a sine wave is symmetric. The second
+# quarter of a cycle is the first one played backwards and the second
+# half is the first half upside down, so only the first quarter (plus
+# the peak) has to be stored:
+#
+#    quadrant 0:  table[offset]
+#    quadrant 1:  table[quarter - offset]
+#    quadrant 2: -table[offset]
+#    quadrant 3: -table[quarter - offset]
+#
+# where the quadrant is the top two bits of the phase and the offset is
+# the rest. The sign is not stored either, so the table is one bit
+# narrower than the output.
+#
+# Second, the table is a Migen Memory with a registered read port,
+# which is what the iCE40 block RAMs (SB_RAM40_4K) are. The catch is
+# that the data comes out a clock after the address goes in, and the
+# sign is applied in another register after that, so the result shows
+# up 'latency' clocks after the phase.
+#
+# Yosys decides for itself whether a memory goes into block RAM or LUTs
+# and for a table as small as this one it guesses LUTs (about 350 of
+# them for the 256 entry table). block_rom() below tells it not to.
+#
+from migen import *
+
+from cores.wavetable import wavetable, table_memory
+
+
+class SineROM(Module):
+    """
+        A 'depth' entry, 'width' bit (two's complement) sine table
+        stored as a quarter wave in block RAM. Put the phase (0 to
+        depth - 1, one full cycle) on 'phase' and the sample comes
+        out on 'value' 'latency' clocks later. depth has to be a power
+        of two and at least 8.
+    """
+    latency = 2
+
+    def __init__(self, depth=256, width=24):
+        if depth < 8 or depth & (depth - 1):
+            raise ValueError(f"SineROM depth must be a power of 2, not {depth}")
+        self.depth = depth
+        self.width = width
+        self.phase = Signal(log2_int(depth))
+        self.value = Signal((width, True))
+
+        #
+        # The first quarter of the wave including the peak, as magnitudes
+        # (the largest positive value that fits in 'width' bits is the
+        # peak). The table comes from cores/wavetable.py.
+        #
+        quarter = depth // 4
+        table = wavetable("sine", quarter + 1, width, period=depth,
+                          rounding="truncate")
+        self.specials.mem = table_memory(table, width - 1)
+        rdport = self.mem.get_port()
+        self.specials += rdport
+
+        #
+        # Split the phase into its quadrant and offset, the odd quadrants
+        # read the table backwards (quarter - offset). That is written as
+        # flipping the bits and adding quarter + 1 because if it is
+        # written as an If() yosys spots that the top address bit is 0
+        # whenever the quadrant is even, turns that into a reset on the
+        # address register and then can't put the register in the block
+        # RAM.
+        #
+        quadrant = self.phase[-2:]
+        offset = Cat(self.phase[:-2], C(0, len(rdport.adr) + 2 - len(self.phase)))
+        self.comb += rdport.adr.eq((offset ^ Replicate(quadrant[0], len(offset))) +
+                                   Mux(quadrant[0], quarter + 1, 0))
+
+        #
+        # The memory's output shows up on the next clock, so the sign
+        # (the top bit of the quadrant) is delayed to match it and then
+        # applied, flipping the bits and adding one.
+        #
+        negate = Signal()
+        magnitude = Signal(width)
+        self.comb += magnitude.eq(rdport.dat_r)
+        self.sync += [
+            negate.eq(quadrant[1]),
+            self.value.eq((magnitude ^ Replicate(negate, width)) + negate),
+        ]
+
+
+def add_yosys_command(platform, command):
+    """
+        Adds 'command' to the yosys script the icestorm toolchain runs
+        (before synth_ice40), unless it is there already.
+    """
+    #
+    # LiteX's icestorm toolchain keeps the commands in a private list,
+    # _yosys_cmds, and has no call for adding to it. This is the one
+    # place that relies on that, so if it changes this is what to fix.
+    #
+    if command not in platform.toolchain._yosys_cmds:
+        platform.toolchain._yosys_cmds.append(command)
+
+
+def block_rom(platform):
+    """
+        Has yosys put the read only Memory()s in the design (like the
+        SineROM table) in block RAM however small they are.
+    """
+    commands = [
+        # the sources are read with -defer so they have to be
+        # elaborated before there are any memories to select
+        "hierarchy -top {build_name}",
+        "setattr -set rom_style \"block\" m:*",
+    ]
+    for command in commands:
+        add_yosys_command(platform, command)
@@ -0,0 +1,173 @@
+#
+# vim: expandtab:ts=4:
+#
+# Reading the iCEBreaker's SPI flash.
+#
+# The FPGA loads its bitstream from the flash when it powers up, but the
+# flash is 16 MB and a UP5K bitstream is about 100 kB, so there is plenty
+# of room after it for data the design wants (iceprog -o 1M data.bin puts
+# a file 1 MB in). Once the FPGA is configured the flash's pins are
+# ordinary I/O ("spiflash" on the platform) and the design can read it
+# with the simplest command there is, READ (0x03): the command and a 24
+# bit address go out on MOSI and the bytes from there on come back on MISO
+# for as long as the clock keeps going.
+#
+# SPIFlashReader does that once, after reset, and hands over the bytes as
+# they come, one clock each on 'source' (like the UART's receiver does,
+# there is no waiting). Before the READ it sends RELEASE POWER DOWN
+# (0xab) in case the flash was left powered down, which the flash needs
+# 3 us to come out of.
+#
+# It is SPI mode 0: MOSI changes when the clock goes low and both ends
+# sample on the way up. The clock is sys / (2 * 'divisor'), the flash
+# would go faster than the 12 MHz that 2 makes at 48 MHz but on wires
+# this long there is no need to find out.
+#
+from migen import *
+from litex.soc.interconnect import stream
+
+READ = 0x03
+RELEASE_POWER_DOWN = 0xab
+
+# how long the flash takes to come out of power down (tRES1), in seconds
+WAKE_TIME = 3e-6
+
+
+class SPIFlashReader(Module):
+    """
+        Reads 'length' bytes from the SPI flash on 'pads' (cs_n, clk,
+        mosi and miso, and wp and hold if they are there, which are held
+        high) from 'offset' on, once, after reset. Each byte is on
+        'source.data' while 'source.valid' is high, for one clock, and
+        'done' goes high after the last one. 'clk_freq' is the clock
+        (sys) in Hz.
+    """
+    def __init__(self, pads, clk_freq, offset, length, divisor=2):
+        if not 0 <= offset < 2**24 or not 0 < length <= 2**24 - offset:
+            raise ValueError(f"{length} bytes from {offset:#x} isn't in a "
+                             f"16 MB flash")
+        self.source = stream.Endpoint([("data", 8)])
+        self.done = Signal()
+
+        cs_n = Signal(reset=1)
+        clk = Signal()
+
+        #
+        # 'tick' is the half period of the SPI clock.
+        #
+        tick = Signal()
+        count = Signal(max=max(divisor, 2))
+        self.sync += If(count == 0,
+                count.eq(divisor - 1),
+                tick.eq(1)
+            ).Else(
+                count.eq(count - 1),
+                tick.eq(0)
+            )
+
+        shift = Signal(32)
+        bits = Signal(max=33)
+        data = Signal(8)
+        remaining = Signal(max=length + 1)
+        wait = int(WAKE_TIME * clk_freq) + 1
+        # it counts down past 0, the wait is over when the top bit is set
+        timer = Signal(bits_for(wait) + 1)
+
+        #
+        # 'bits' and 'remaining' only change when the clock goes low, and
+        # it is at least two clocks before it does that again, so whether
+        # they have got to the end is worked out a clock early to keep
+        # the comparisons out of the state machine's logic.
+        #
+        last_bit = Signal()
+        last_byte = Signal()
+        self.sync += [
+            last_bit.eq(bits == 1),
+            last_byte.eq(remaining == 1),
+        ]
+        self.comb += [
+            pads.cs_n.eq(cs_n),
+            pads.clk.eq(clk),
+            pads.mosi.eq(shift[-1]),
+            self.source.data.eq(data),
+        ]
+        for pin in ("wp", "hold"):
+            if hasattr(pads, pin):
+                self.comb += getattr(pads, pin).eq(1)
+
+        #
+        # Each bit is two ticks: the clock goes up (and MISO is
+        # sampled), then down (and the next bit goes on MOSI).
+        #
+        self.submodules.fsm = fsm = FSM(reset_state="WAKE")
+        fsm.act("WAKE",
+            NextValue(cs_n, 0),
+            NextValue(shift, RELEASE_POWER_DOWN << 24),
+            NextValue(bits, 8),
+            NextState("COMMAND")
+        )
+        fsm.act("COMMAND",
+            If(tick,
+                If(~clk,
+                    NextValue(clk, 1)
+                ).Else(
+                    NextValue(clk, 0),
+                    NextValue(shift, shift << 1),
+                    NextValue(bits, bits - 1),
+                    If(last_bit,
+                        NextValue(cs_n, 1),
+                        NextValue(timer, wait - 1),
+                        NextState("WAIT")
+                    )
+                )
+            )
+        )
+        fsm.act("WAIT",
+            NextValue(timer, timer - 1),
+            If(timer[-1],
+                NextValue(cs_n, 0),
+                NextValue(shift, (READ << 24) | offset),
+                NextValue(bits, 32),
+                NextState("ADDRESS")
+            )
+        )
+        fsm.act("ADDRESS",
+            If(tick,
+                If(~clk,
+                    NextValue(clk, 1)
+                ).Else(
+                    NextValue(clk, 0),
+                    NextValue(shift, shift << 1),
+                    NextValue(bits, bits - 1),
+                    If(last_bit,
+                        NextValue(bits, 8),
+                        NextValue(remaining, length),
+                        NextState("DATA")
+                    )
+                )
+            )
+        )
+        fsm.act("DATA",
+            If(tick,
+                If(~clk,
+                    NextValue(clk, 1),
+                    NextValue(data, Cat(pads.miso, data[:7]))
+                ).Else(
+                    NextValue(clk, 0),
+                    NextValue(bits, bits - 1),
+                    If(last_bit,
+                        NextValue(bits, 8),
+                        NextValue(remaining, remaining - 1),
+                        If(last_byte,
+                            NextValue(cs_n, 1),
+                            NextState("DONE")
+                        )
+                    )
+                )
+            )
+        )
+        fsm.act("DONE",
+            self.done.eq(1)
+        )
+        self.sync += self.source.valid.eq(
+            fsm.ongoing("DATA") & tick & clk & last_bit)
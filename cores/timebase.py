@@ -0,0 +1,145 @@
+#
+# vim: expandtab:ts=4:
+#
+# A shared timebase that hands out clock enable strobes.
+#
+# Every example so far has had its own "divide by n" counter: a 24 bit
+# register that counts up every clock and a comparator that checks it
+# against a 'ticks' value computed from the clock period. Put a couple of
+# seven segment displays in a design and you end up with three or four
+# 24 bit counters all counting the same clock.
+#
+# Instead, a module asks the Timebase for a strobe at the rate it wants,
+#
+#    tick = timebase.strobe(250)
+#
+# and gets back a Signal that is 1 for exactly one clock cycle, 250 times
+# a second. It uses that as an enable in its sync code (If(tick, ...))
+# rather than running its own counter.
+#
+# Nothing is built until the design is finalized, at that point the
+# Timebase knows every rate that was asked for and it builds a chain of
+# small prescalers that covers all of them. Each rate is a whole number
+# of clocks (its divisor), and when two divisors have a common factor
+# the prescaler for that factor is built once and both rates count its
+# strobes. So 500 Hz and 6 Hz from 12 MHz (divisors 24000 and 2000000)
+# share a divide by 8000 stage and then need a divide by 3 and a divide
+# by 250 after it, rather than a 15 and a 21 bit counter. Each counter
+# is only as wide as it needs to be (bits_for), which keeps the
+# comparators short as well, and a stage wider than 12 bits is split
+# in two if its ratio has factors to split it with.
+#
+# A rate is rounded to a whole number of clocks so it is only as close
+# as the clock allows. Given a 'tolerance' (the ClockPlan passes its
+# own in, see cores/clockplan.py) strobe() raises a ValueError for a
+# rate that comes out further off than that.
+#
+from math import gcd
+
+from migen import *
+
+
+class Timebase(Module):
+    """
+        Generates single cycle clock enable strobes at requested rates
+        from one clock. clk_freq is the frequency (in Hz) of the clock
+        domain the Timebase runs in (sys unless it is renamed).
+        If 'tolerance' is given a strobe that would be more than that
+        fraction of its rate off is an error.
+    """
+    def __init__(self, clk_freq, tolerance=None):
+        self.clk_freq = clk_freq
+        self.tolerance = tolerance
+        # divisor -> the strobes handed out for it
+        self._requests = {}
+
+    def divisor(self, rate):
+        """
+            The number of clocks between strobes for 'rate' (in Hz).
+        """
+        n = int(round(self.clk_freq / rate))
+        if n < 1:
+            raise ValueError(f"Can't make a {rate} Hz strobe from a "
+                             f"{self.clk_freq} Hz clock")
+        return n
+
+    def achieved(self, rate):
+        """
+            The rate (in Hz) that strobe(rate) will actually run at.
+        """
+        return self.clk_freq / self.divisor(rate)
+
+    def strobe(self, rate):
+        """
+            Returns a Signal that is high for one clock cycle 'rate'
+            times a second.
+        """
+        if self.tolerance is not None:
+            error = abs(self.achieved(rate) - rate) / rate
+            if error > self.tolerance:
+                raise ValueError(f"A {rate} Hz strobe from a "
+                                 f"{self.clk_freq} Hz clock runs at "
+                                 f"{self.achieved(rate):.6g} Hz, "
+                                 f"{error:.2%} off")
+        tick = Signal()
+        self._requests.setdefault(self.divisor(rate), []).append(tick)
+        return tick
+
+    def _stage(self, enable, ratio):
+        """
+            One prescaler, counts 'enable' strobes and returns a strobe
+            every 'ratio' of them.
+        """
+        if ratio == 1:
+            return enable
+        #
+        # A long counter means a long comparator in front of its reset,
+        # so if the ratio has factors it is split into two shorter
+        # prescalers, one counting the other's strobes.
+        #
+        if bits_for(ratio - 1) > 12:
+            first = max(f for f in range(1, int(ratio**0.5) + 1)
+                        if ratio % f == 0)
+            if first > 1:
+                return self._stage(self._stage(enable, first), ratio // first)
+        count = Signal(bits_for(ratio - 1))
+        tick = Signal()
+        self.comb += tick.eq(enable & (count == ratio - 1))
+        self.sync += If(enable,
+            If(count == ratio - 1,
+                count.eq(0)
+            ).Else(
+                count.eq(count + 1)
+            )
+        )
+        return tick
+
+    def _build(self, base, enable, divisors):
+        """
+            Builds the prescalers for 'divisors' (all multiples of
+            'base') on top of 'enable', which strobes every 'base' clocks.
+            The largest factor that at least two of them share gets its
+            own stage and they are built on top of it.
+        """
+        divisors = sorted(set(divisors))
+        while divisors:
+            common = 1
+            for i, a in enumerate(divisors):
+                for b in divisors[i + 1:]:
+                    common = max(common, gcd(a // base, b // base))
+            if common > 1:
+                stage = base * common
+                group = [d for d in divisors if d % stage == 0]
+            else:
+                stage = divisors[0]
+                group = [stage]
+            tick = self._stage(enable, stage // base)
+            for out in self._requests.get(stage, []):
+                self.comb += out.eq(tick)
+            divisors = [d for d in divisors if d not in group]
+            rest = [d for d in group if d != stage]
+            if rest:
+                self._build(stage, tick, rest)
+
+    def do_finalize(self):
+        self._build(1, C(1), list(self._requests))
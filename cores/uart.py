@@ -0,0 +1,123 @@
+#
+# vim: expandtab:ts=4:
+#
+# A serial port (8 data bits, no parity, 1 stop bit) for fast clocks.
+#
+# LiteX's RS232PHY works out its bit times with a 32 bit phase
+# accumulator, so that any baud rate comes out right from any clock.
+# That is a 32 bit adder in front of every bit, and at 50 MHz (05_tone)
+# the carry chain on its own takes most of a clock. The baud rates we use
+# are all a whole number of clocks a bit, near enough (1 Mbaud is 12
+# clocks at 12 MHz and 50 at 50.25 MHz, half a percent fast), so UARTPHY
+# counts clocks with a counter that is only as wide as one bit time.
+#
+# It has the same 'sink' and 'source' streams as RS232PHY and can stand
+# in for it: a byte sent to 'sink' goes out when the transmitter is idle,
+# and each byte received is on 'source' for one clock ('valid' high),
+# whether or not anything is ready for it.
+#
+from migen import *
+from migen.genlib.cdc import MultiReg
+from litex.soc.interconnect import stream
+
+# how far off the bit time can be before the other end gets the wrong bits
+TOLERANCE = 0.02
+
+
+class UARTPHY(Module):
+    """
+        A serial port on 'pads' (rx and tx) at 'baudrate', from a
+        'clk_freq' Hz clock, see the top of the file.
+    """
+    def __init__(self, pads, clk_freq, baudrate=115200):
+        divisor = int(round(clk_freq / baudrate))
+        if divisor < 4 or abs(clk_freq / divisor - baudrate) > TOLERANCE * baudrate:
+            raise ValueError(f"{baudrate} baud can't be made from a "
+                             f"{clk_freq / 1e6:.2f} MHz clock")
+        self.divisor = divisor
+        self.sink = sink = stream.Endpoint([("data", 8)])
+        self.source = source = stream.Endpoint([("data", 8)])
+
+        #
+        # The receiver waits for the start bit, then samples each bit in
+        # the middle: half a bit time after the start bit began, and a
+        # whole bit time after that for the rest. A start bit that isn't
+        # still low in its middle was a glitch, and a byte without its
+        # stop bit is dropped.
+        #
+        rx = Signal(reset=1)
+        self.specials += MultiReg(pads.rx, rx, reset=1)
+        rx_timer = Signal(max=divisor)
+        rx_bits = Signal(max=8)
+        rx_data = Signal(8)
+        self.comb += source.data.eq(rx_data)
+
+        self.submodules.rx_fsm = rx_fsm = FSM(reset_state="IDLE")
+        rx_fsm.act("IDLE",
+            If(~rx,
+                NextValue(rx_timer, divisor // 2 - 1),
+                NextState("START")
+            )
+        )
+        rx_fsm.act("START",
+            NextValue(rx_timer, rx_timer - 1),
+            If(rx_timer == 0,
+                NextValue(rx_timer, divisor - 1),
+                NextValue(rx_bits, 0),
+                If(rx,
+                    NextState("IDLE")
+                ).Else(
+                    NextState("DATA")
+                )
+            )
+        )
+        rx_fsm.act("DATA",
+            NextValue(rx_timer, rx_timer - 1),
+            If(rx_timer == 0,
+                NextValue(rx_timer, divisor - 1),
+                NextValue(rx_data, Cat(rx_data[1:], rx)),
+                NextValue(rx_bits, rx_bits + 1),
+                If(rx_bits == 7,
+                    NextState("STOP")
+                )
+            )
+        )
+        rx_fsm.act("STOP",
+            NextValue(rx_timer, rx_timer - 1),
+            If(rx_timer == 0,
+                source.valid.eq(rx),
+                NextState("IDLE")
+            )
+        )
+
+        #
+        # The transmitter takes a byte when it is idle and shifts it out
+        # with its start and stop bits, the line is the bottom bit of the
+        # shift register (all ones when it is idle).
+        #
+        tx = Signal(10, reset=2**10 - 1)
+        tx_timer = Signal(max=divisor)
+        tx_bits = Signal(max=10)
+        self.comb += pads.tx.eq(tx[0])
+
+        self.submodules.tx_fsm = tx_fsm = FSM(reset_state="IDLE")
+        tx_fsm.act("IDLE",
+            sink.ready.eq(1),
+            If(sink.valid,
+                NextValue(tx, Cat(0, sink.data, 1)),
+                NextValue(tx_timer, divisor - 1),
+                NextValue(tx_bits, 0),
+                NextState("SEND")
+            )
+        )
+        tx_fsm.act("SEND",
+            NextValue(tx_timer, tx_timer - 1),
+            If(tx_timer == 0,
+                NextValue(tx_timer, divisor - 1),
+                NextValue(tx, Cat(tx[1:], 1)),
+                NextValue(tx_bits, tx_bits + 1),
+                If(tx_bits == 9,
+                    NextState("IDLE")
+                )
+            )
+        )
@@ -0,0 +1,264 @@
+#
+# vim: expandtab:ts=4:
+#
+# A polyphonic voice engine.
+#
+# One DDS (cores/dds.py) makes one tone. For a chord we want several and
+# building several DDS cores means several phase accumulators, several
+# sine tables and an adder tree to mix them, all of which grows with the
+# number of voices. But a sample only has to be ready once every 1536
+# clocks (at 50 MHz and 32.5 kHz) and a DDS only needs a couple of
+# clocks to work one out, so one set of hardware has time to do all of
+# the voices, one after the other.
+#
+# So each voice is just an entry in three memories (which go in block
+# RAM), its phase, its tuning word and its gain (volume). Once per sample
+# the engine walks through the voices, one per clock:
+#
+#    - it reads the voice's phase and tuning word, adds them and writes
+#      the new phase back,
+#    - looks the new phase up in the one shared sine table (SineROM),
+#    - multiplies the sample by the voice's gain and adds it to the mix.
+#
+# The multiply and add are done by one of the UP5K's eight DSP blocks,
+# SB_MAC16, which is a 16 x 16 multiplier with a 32 bit accumulator
+# behind it. Since it is a hard block it takes an Instance() (like the
+# PLL) and Migen can't simulate those, so dsp=False builds the same
+# thing out of ordinary logic for simulation, with the same timing.
+#
+# More voices only cost more entries in the memories and one more clock
+# per sample each.
+#
+from migen import *
+
+from cores.sine_rom import SineROM, add_yosys_command
+
+
+class VoiceEngine(Module):
+    """
+        Mixes 'voices' sine wave voices into one 'width' bit sample.
+        Pulse 'ce' once per sample ('sample_rate' times a second) and
+        'value' has the new sample when 'valid' is high (for one clock)
+        'voices' + 7 clocks later.
+
+        'freqs' and 'gains' are the starting frequency (Hz) and gain
+        (0.0 to 1.0) of each voice, the gains should add up to 1.0 or
+        less or the mix will overflow. They can be changed while it is
+        running by putting the voice number on 'voice', the value on
+        'tuning_word' (see tuning()) or 'gain' (1.0 is 0x7fff) and
+        pulsing 'we_tuning' or 'we_gain'.
+    """
+    def __init__(self, sample_rate, voices=4, freqs=None, gains=None,
+                 acc_bits=32, depth=256, width=24, dsp=True):
+        self.sample_rate = sample_rate
+        self.acc_bits = acc_bits
+        self.ce = Signal()
+        self.value = Signal((width, True))
+        self.valid = Signal()
+
+        self.voice = Signal(max=max(voices, 2))
+        self.tuning_word = Signal(acc_bits)
+        self.gain = Signal(16)
+        self.we_tuning = Signal()
+        self.we_gain = Signal()
+
+        freqs = freqs or [0] * voices
+        gains = gains or [1.0 / voices] * voices
+        self.specials.phases = Memory(acc_bits, voices, name="voice_phases")
+        self.specials.tunings = Memory(acc_bits, voices, name="voice_tunings",
+                                       init=[self.tuning(f) for f in freqs])
+        self.specials.gains = Memory(16, voices, name="voice_gains",
+                                     init=[int(g * 0x7fff) for g in gains])
+        #
+        # The read ports are READ_FIRST, the default (WRITE_FIRST) asks
+        # for the data being written to come straight out of the read
+        # port on the same clock, which the block RAMs can't do, so
+        # yosys builds it out of logic (see voice_memories()).
+        #
+        phase_rd = self.phases.get_port(mode=READ_FIRST)
+        phase_wr = self.phases.get_port(write_capable=True)
+        tuning_rd = self.tunings.get_port(mode=READ_FIRST)
+        tuning_wr = self.tunings.get_port(write_capable=True)
+        gain_rd = self.gains.get_port(mode=READ_FIRST)
+        gain_wr = self.gains.get_port(write_capable=True)
+        self.specials += phase_rd, phase_wr, tuning_rd, tuning_wr, gain_rd, gain_wr
+        self.comb += [
+            tuning_wr.adr.eq(self.voice),
+            tuning_wr.dat_w.eq(self.tuning_word),
+            tuning_wr.we.eq(self.we_tuning),
+            gain_wr.adr.eq(self.voice),
+            gain_wr.dat_w.eq(self.gain),
+            gain_wr.we.eq(self.we_gain),
+        ]
+
+        #
+        # Issue one voice per clock after ce. 'issue' is high on the
+        # clocks a voice is being read, 'first' and 'last' mark the
+        # first and last of them.
+        #
+        voice = Signal(max=max(voices, 2))
+        issue = Signal()
+        self.sync += If(self.ce,
+                issue.eq(1),
+                voice.eq(0)
+            ).Elif(issue,
+                If(voice == voices - 1,
+                    issue.eq(0)
+                ).Else(
+                    voice.eq(voice + 1)
+                )
+            )
+        first = Signal()
+        last = Signal()
+        self.comb += [
+            first.eq(issue & (voice == 0)),
+            last.eq(issue & (voice == voices - 1)),
+        ]
+
+        #
+        # Every control signal follows its voice down the pipeline, so
+        # they all go through the same delay line, delayed[k] is what
+        # they were k clocks ago.
+        #
+        # clock 0: the voice's number goes to the memories.
+        # clock 1: phase + tuning word is registered.
+        # clock 2: the new phase is written back and goes to the sine
+        #          table.
+        # clock 4: the sine value and the gain go in to the multiplier.
+        # clock 5: the product is added to the mix.
+        #
+        delayed = [Record([("issue", 1), ("first", 1), ("last", 1),
+                           ("voice", len(voice))]) for _ in range(7)]
+        self.comb += [
+            delayed[0].issue.eq(issue),
+            delayed[0].first.eq(first),
+            delayed[0].last.eq(last),
+            delayed[0].voice.eq(voice),
+        ]
+        for k in range(1, len(delayed)):
+            self.sync += delayed[k].raw_bits().eq(delayed[k - 1].raw_bits())
+
+        self.comb += [
+            phase_rd.adr.eq(voice),
+            tuning_rd.adr.eq(voice),
+            gain_rd.adr.eq(voice),
+        ]
+
+        phase = Signal(acc_bits)
+        self.sync += phase.eq(phase_rd.dat_r + tuning_rd.dat_r)
+        self.comb += [
+            phase_wr.adr.eq(delayed[2].voice),
+            phase_wr.dat_w.eq(phase),
+            phase_wr.we.eq(delayed[2].issue),
+        ]
+
+        #
+        # The table is 16 bits wide because that is how wide the DSP's
+        # inputs are. The gain has to wait for the table.
+        #
+        self.submodules.rom = SineROM(depth, 16)
+        self.comb += self.rom.phase.eq(phase[-len(self.rom.phase):])
+        gain = [Signal(16) for _ in range(SineROM.latency + 1)]
+        self.sync += gain[0].eq(gain_rd.dat_r)
+        for k in range(1, len(gain)):
+            self.sync += gain[k].eq(gain[k - 1])
+
+        #
+        # The accumulator is loaded with 0 on the clock before the first
+        # product arrives, adds each product as it arrives and holds its
+        # value the rest of the time.
+        #
+        load = delayed[4].first
+        accumulate = delayed[5].issue
+        mix = Signal((32, True))
+        if dsp:
+            self.specials += Instance("SB_MAC16",
+                # signed 16 x 16, the product registered, the 32 bit
+                # accumulator adding it to its own output
+                p_A_SIGNED = 1,
+                p_B_SIGNED = 1,
+                p_PIPELINE_16x16_MULT_REG2 = 1,
+                p_TOPOUTPUT_SELECT = 1,
+                p_TOPADDSUB_LOWERINPUT = 2,
+                p_TOPADDSUB_UPPERINPUT = 0,
+                p_TOPADDSUB_CARRYSELECT = 2,
+                p_BOTOUTPUT_SELECT = 1,
+                p_BOTADDSUB_LOWERINPUT = 2,
+                p_BOTADDSUB_UPPERINPUT = 0,
+                p_BOTADDSUB_CARRYSELECT = 0,
+                i_CLK = ClockSignal(),
+                i_CE = 1,
+                i_A = self.rom.value,
+                i_B = gain[-1],
+                i_C = 0,
+                i_D = 0,
+                i_AHOLD = 0, i_BHOLD = 0, i_CHOLD = 0, i_DHOLD = 0,
+                i_IRSTTOP = 0, i_IRSTBOT = 0,
+                i_ORSTTOP = 0, i_ORSTBOT = 0,
+                # OLOAD loads C and D (0) rather than adding
+                i_OLOADTOP = load, i_OLOADBOT = load,
+                i_ADDSUBTOP = 0, i_ADDSUBBOT = 0,
+                i_OHOLDTOP = ~(load | accumulate),
+                i_OHOLDBOT = ~(load | accumulate),
+                i_CI = 0, i_ACCUMCI = 0, i_SIGNEXTIN = 0,
+                o_O = mix,
+            )
+        else:
+            product = Signal((32, True))
+            sample = Signal((16, True))
+            scale = Signal((16, True))
+            self.comb += [sample.eq(self.rom.value), scale.eq(gain[-1])]
+            self.sync += [
+                product.eq(sample * scale),
+                If(load,
+                    mix.eq(0)
+                ).Elif(accumulate,
+                    mix.eq(mix + product)
+                )
+            ]
+
+        #
+        # The samples and the gains are both 1.15 fixed point so the
+        # products (and the mix) are 2.30, the top bit is just sign
+        # so the output is the 'width' bits below it.
+        #
+        self.sync += If(delayed[6].last, self.value.eq(mix[-1 - width:-1]))
+        self.sync += self.valid.eq(delayed[6].last)
+
+    def tuning(self, freq):
+        """
+            The tuning word for 'freq' Hz.
+        """
+        word = int(round(freq * 2**self.acc_bits / self.sample_rate))
+        if not 0 <= word < 2**(self.acc_bits - 1):
+            raise ValueError(f"{freq} Hz is out of range at a sample rate "
+                             f"of {self.sample_rate} Hz")
+        return word
+
+    def frequency(self, word):
+        """
+            The frequency (in Hz) that tuning word 'word' produces.
+        """
+        return word * self.sample_rate / 2**self.acc_bits
+
+
+def voice_memories(platform):
+    """
+        Tells yosys that the VoiceEngine memories are never read and
+        written at the same address on the same clock. Otherwise it
+        adds registers and a multiplexer after each block RAM so that
+        the read returns the old data when that happens, and those end
+        up in the path through the phase adder.
+
+        The engine itself never does that (a voice's new phase is
+        written back two clocks after it was read) but a tuning word
+        or gain written to the voice the engine is reading at that
+        moment can give one sample of the old or the new value.
+    """
+    commands = [
+        # as in block_rom(), the memories only exist after this
+        "hierarchy -top {build_name}",
+        "setattr -set no_rw_check 1 m:voice_*",
+    ]
+    for command in commands:
+        add_yosys_command(platform, command)
@@ -0,0 +1,197 @@
+#
+# vim: expandtab:ts=4:
+#
+# Waveform tables for the ROMs the audio examples look their samples up in.
+#
+# The first tone generator built its sine table in a python loop, a C()
+# constant for each entry (and printed every one of them), every time the
+# design was elaborated. That is slow for a big table and the constants
+# end up as a multiplexer rather than memory anyway.
+#
+# wavetable() works the whole table out at once with numpy,
+#
+#    table = wavetable("sine", 4096, width=16)
+#
+# for a sine, triangle, saw or square wave or one cycle of any other
+# shape given as an array. The table is 'length' entries of 'width' bit
+# samples, one cycle every 'period' entries (so a quarter wave table is
+# wavetable("sine", 65, period=256)). How the samples are rounded to
+# whole numbers is up to the caller: to the nearest, towards zero (what
+# python's int() does, the old tables were made that way) or down. With
+# 'dither' a little triangular noise (that many LSBs at most) goes in
+# before the rounding, which turns the rounding error of a short table
+# into a flat noise floor rather than harmonics. It comes from a seeded
+# generator so the same arguments always make the same table.
+#
+# Tables are remembered, both for the rest of the run and on disk in
+# the build cache directory (see tools/buildcache.py) under a hash of the
+# arguments, so the next build just loads it. ICEBREAKER_NO_CACHE turns
+# the disk copy off like it does for the builds.
+#
+# table_memory() turns a table into a Migen Memory with the table as its
+# init data. The Verilog gets it as a $readmemh file rather than as
+# thousands of constants, and yosys can put it in block RAM.
+#
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from migen import *
+
+from tools.buildcache import cache_dir
+
+#
+# Bump this if the way the tables are worked out changes, so that the
+# tables already on disk aren't used.
+#
+VERSION = 1
+
+
+def _sine(index, period):
+    return np.sin(2.0 * np.pi * index / period)
+
+
+def _triangle(index, period):
+    # 0 at the start of the cycle and the peak a quarter of the way in,
+    # like the sine
+    phase = (index / period + 0.25) % 1.0
+    return 1.0 - 4.0 * np.abs(phase - 0.5)
+
+
+def _saw(index, period):
+    # rises from -1 to 1 through the cycle, 0 at the start of it
+    return 2.0 * ((index / period + 0.5) % 1.0) - 1.0
+
+
+def _square(index, period):
+    return np.where((index / period) % 1.0 < 0.5, 1.0, -1.0)
+
+#
+# The shapes that have a name, each takes the entry numbers and the
+# period and returns values from -1 to 1.
+#
+SHAPES = {
+    "sine": _sine,
+    "triangle": _triangle,
+    "saw": _saw,
+    "square": _square,
+}
+
+_rounding = {
+    "nearest": np.rint,
+    "truncate": np.trunc,
+    "floor": np.floor,
+}
+
+# key -> table, for this run
+_tables = {}
+
+
+def _key(shape, params):
+    """
+        The hash that names a table, from its arguments (and the values
+        of an arbitrary shape).
+    """
+    key = hashlib.sha256(repr((VERSION, params)).encode())
+    if not isinstance(shape, str):
+        key.update(np.ascontiguousarray(shape, dtype=np.float64).tobytes())
+    return key.hexdigest()[:32]
+
+
+def _make(shape, length, width, period, amplitude, rounding, dither, seed,
+          signed):
+    index = np.arange(length, dtype=np.float64)
+    if isinstance(shape, str):
+        if shape not in SHAPES:
+            raise ValueError(f"No waveform called {shape}, there is "
+                             f"{', '.join(SHAPES)}")
+        values = SHAPES[shape](index, period)
+    else:
+        #
+        # One cycle of an arbitrary shape, it is stretched to the period
+        # by interpolating between its points.
+        #
+        cycle = np.asarray(shape, dtype=np.float64)
+        points = len(cycle)
+        values = np.interp((index * points / period) % points,
+                           np.arange(points + 1), np.append(cycle, cycle[0]))
+
+    if signed:
+        top = 2**(width - 1) - 1
+        low, scaled = -top, values * amplitude * top
+    else:
+        top = 2**width - 1
+        low, scaled = 0, (values * amplitude + 1.0) / 2.0 * top
+    if dither:
+        noise = np.random.default_rng(seed).random((2, length))
+        scaled = scaled + dither * (noise[0] - noise[1])
+    return np.clip(_rounding[rounding](scaled), low, top).astype(np.int64)
+
+
+def wavetable(shape="sine", length=256, width=24, period=None, amplitude=1.0,
+              rounding="nearest", dither=0, seed=1, signed=True):
+    """
+        A numpy array of 'length' 'width' bit samples of 'shape' (one of
+        SHAPES or an array with one cycle of the wave, from -1 to 1), a
+        cycle every 'period' entries ('length' if it isn't given).
+        'amplitude' is the fraction of full scale. The samples are
+        two's complement, or offset binary (0 is the bottom of the wave)
+        if 'signed' is False.
+
+        'rounding' is "nearest", "truncate" (towards zero) or "floor",
+        and 'dither' (in LSBs) adds triangular noise from a generator
+        seeded with 'seed' before they are rounded.
+
+        The array is shared with whoever else asks for the same table,
+        so it is read only.
+    """
+    if rounding not in _rounding:
+        raise ValueError(f"Rounding has to be one of {', '.join(_rounding)}, "
+                         f"not {rounding}")
+    if not isinstance(shape, str) and len(shape) == 0:
+        raise ValueError("An arbitrary waveform needs at least one point")
+    period = length if period is None else period
+    params = (shape if isinstance(shape, str) else "array", length, width,
+              period, amplitude, rounding, dither, seed if dither else None,
+              signed)
+    key = _key(shape, params)
+    if key in _tables:
+        return _tables[key]
+
+    path = None
+    if not os.environ.get("ICEBREAKER_NO_CACHE"):
+        path = os.path.join(cache_dir(), "wavetables", f"{key}.npy")
+    table = None
+    if path is not None and os.path.exists(path):
+        try:
+            table = np.load(path)
+        except (OSError, ValueError):
+            table = None
+    if table is None or len(table) != length:
+        table = _make(shape, length, width, period, amplitude, rounding,
+                      dither, seed, signed)
+        if path is not None:
+            #
+            # Written to a temporary file and renamed so that a build
+            # running at the same time never sees half a table.
+            #
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp, path)
+    table.setflags(write=False)
+    _tables[key] = table
+    return table
+
+
+def table_memory(table, width, name=None):
+    """
+        A Memory 'width' bits wide holding 'table' (two's complement
+        values are stored as their bits). Add it to the design's
+        specials and get a port from it as usual.
+    """
+    init = (np.asarray(table, dtype=np.int64) & ((1 << width) - 1)).tolist()
+    return Memory(width, len(init), init=init, name=name)
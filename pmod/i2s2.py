@@ -0,0 +1,184 @@
+#
+# vim: expandtab:ts=4:
+#
+# I2S output for the Digilent PMOD I2S2, moved here from the
+# simple_tone example so that the other audio examples can use it too.
+#
+# The I2S side runs from its own clock domain (the PLL's 'i2s' domain)
+# and the samples get to it through an asynchronous FIFO, so whatever
+# is making them runs in 'sys' and doesn't have to know anything about
+# the I2S timing. It pushes samples in whenever the FIFO has room (in
+# bursts if it likes) and the I2S side takes one out at the start of
+# each frame.
+#
+# The samples are a LiteX stream, 'sink' is an Endpoint with 'valid',
+# 'ready' and the 'left' and 'right' samples. A sample is taken when
+# valid and ready are both high on the same clock, so the producer holds
+# valid (and the sample) until it sees ready.
+#
+# request_i2s2() adds the pins of a PMOD I2S2 in the top row of a PMOD
+# connector to the platform, for designs that don't want to list them
+# one by one.
+#
+from migen import *
+from litex.build.generic_platform import IOStandard, Pins, Subsignal
+from litex.soc.interconnect import stream
+
+from pmod.resources import next_number
+
+
+def request_i2s2(platform, pmod):
+    """
+        Adds an "i2s2" resource for the D/A side (the top row) of an
+        I2S2 plugged into 'pmod' and requests it, its 'mclk', 'lrclk',
+        'sclk' and 'sdo' go to I2S. Each one gets its own number (see
+        pmod/resources.py), so a design can have more than one.
+    """
+    number = next_number(platform, "i2s2")
+    io_def = ("i2s2", number,
+        Subsignal("mclk", Pins(f"{pmod}:0")),
+        Subsignal("lrclk", Pins(f"{pmod}:1")),
+        Subsignal("sclk", Pins(f"{pmod}:2")),
+        Subsignal("sdo", Pins(f"{pmod}:3")),
+        IOStandard("LVCMOS33"),
+    )
+    platform.add_extension([io_def])
+    return platform.request("i2s2", number)
+
+
+class I2S(Module):
+    """
+        This class implements an I2S interface to talk to a CODEC
+        chip on the Digilent PMOD.
+
+        The serial side runs off the 'clock_domain' clock and the
+        samples come in through 'sink' in the sys domain, both
+        channels of a frame together, through a 'depth' entry FIFO.
+    """
+    def __init__(self, platform, mclk, sclk, lrclk, sdo, width=24,
+                 depth=8, clock_domain="i2s"):
+        """
+            Initialize the i2s engine.
+
+            This code is for output only at the moment, so it isn't
+            reading data from the receive side.
+
+            'width' is 16 or 24 depending on if you're sending 16 bit
+            samples or 24 bit samples. The former are padded with 8
+            zeros to make them 24 bit samples.
+
+            mclk is the master clock output
+            sclk is the serial clock (or bit clock) output
+            lrclk is the left/right channel select clock
+            sdo is the serial bitstream of samples, sent MSB first.
+
+            If the FIFO is empty when a frame starts the last samples
+            are sent again, so a producer that stalls makes the output
+            hold still rather than click. 'underrun' is high for a
+            clock (in 'clock_domain') when that happens.
+        """
+        layout = [("left", width), ("right", width)]
+        self.submodules.cdc = stream.ClockDomainCrossing(layout,
+            cd_from="sys", cd_to=clock_domain, depth=depth)
+        self.sink = self.cdc.sink
+        source = self.cdc.source
+        sync = getattr(self.sync, clock_domain)
+
+        shift_count = Signal(8)
+
+        #
+        # Shift register holding data going out (one sample @ 24 bits)
+        #
+        xmit_reg = Signal(24)
+
+        #
+        # Serial Digital Out reflects the MSB of the transmit
+        # shift register.
+        #
+        self.comb += [
+            # this reflects the MSB of the transmit register to SDO
+            sdo.eq(xmit_reg[-1]),
+        ]
+
+        sticks = Signal(4)
+
+        #
+        # 'shift' is high on the clock where SCLK is about to fall,
+        # which is when the next bit goes out. It is worked out a clock
+        # early (SCLK only changes when MCLK is low, so MCLK high and the
+        # same counts means the next clock is a shift) and registered.
+        #
+        # The next frame is taken from the FIFO while the last bit of
+        # the right channel is going out ('take'), so it is ready well
+        # before the left channel starts. It goes into left_next and
+        # right_next, and on the next clock into left_hold and
+        # right_hold which is what is sent. If there wasn't a frame in
+        # the FIFO the holds keep the last one and it is sent again.
+        # (Doing it in two steps keeps the FIFO's empty test away from
+        # the enables of the 48 hold bits, which is too much logic for
+        # one clock.)
+        #
+        shift = Signal()
+        take = Signal()
+        fresh = Signal()
+        left_next = Signal(width)
+        right_next = Signal(width)
+        left_hold = Signal(width)
+        right_hold = Signal(width)
+        sync += [
+            shift.eq((mclk == 1) & (sticks == 7) & (sclk == 1)),
+            take.eq((mclk == 1) & (sticks == 7) & (sclk == 1) &
+                    (shift_count == 23) & (lrclk == 0)),
+            fresh.eq(take & source.valid),
+            If(take,
+                left_next.eq(source.left),
+                right_next.eq(source.right),
+            ),
+            If(fresh,
+                left_hold.eq(left_next),
+                right_hold.eq(right_next),
+            ),
+        ]
+        self.comb += source.ready.eq(take)
+        self.underrun = Signal()
+        sync += self.underrun.eq(take & ~source.valid)
+
+        #
+        # This sequential block generates the MCLK (master clock),
+        # LRCLK (left/right clock), and the SCLK (serial clock).
+        # The ratio of the master clock to the LRCLK determines
+        # the bitwidth. We go for a 768x ratio starting with
+        # a 25MHz master clock, which makes for a 48 bit
+        # sample (2 x 24) sample period of 32.552 kHz
+        #
+        sync += [
+            mclk.eq(~mclk),    # running at 1/2 the clock rate (25MHz)
+            # @posedge of MCLK
+            If(mclk == 0,
+                If(sticks == 7,
+                    sticks.eq(0),
+                    sclk.eq(~sclk),
+                ).Else( sticks.eq(sticks + 1)),
+            ),
+            # @negedge of SCLK
+            If(shift,
+                shift_count.eq(shift_count + 1),
+                # generate LRCLK
+                If(shift_count == 23,
+                    shift_count.eq(0),
+                    lrclk.eq(~lrclk),
+                ),
+                # shift out bits
+                # Align sample to the MSB of the shift register
+                # before assigning it to the shift register.
+                If(shift_count == 0,
+                    If(lrclk == 1,
+                        xmit_reg.eq(left_hold << (24 - width)),
+                    ).Else(
+                        xmit_reg.eq(right_hold << (24 - width)),
+                    )
+                ).Else(
+                    xmit_reg.eq((xmit_reg << 1) | xmit_reg[-1]),
+                ),
+            ),
+        ]
@@ -13,6 +13,25 @@
 #
 from migen import *
 from litex.build.generic_platform import *
+from cores.clockplan import ClockPlan
+from pmod.resources import next_number
+
+def request_led7seg(platform, pmod):
+	"""
+		Adds an "led7seg" resource for the display plugged into 'pmod'
+		and requests it. Each one gets its own number so that several
+		displays on the same platform don't fight over the same name.
+	"""
+	number = next_number(platform, "led7seg")
+	pins = ""
+	for i in range(6, -1, -1):
+		pins += f"{pmod}:{i} "
+	io_def = ("led7seg", number,
+			Subsignal("num", Pins(pins)),
+			Subsignal("sel", Pins(f"{pmod}:7")),
+	)
+	platform.add_extension([io_def])
+	return platform.request("led7seg", number)
 
 class SevenSegmentLedDisplay(Module):
 	"""
@@ -22,6 +41,13 @@ class SevenSegmentLedDisplay(Module):
 		you need to pass it the platform (type Platform()), the PMOD
 		you are using (string), and an 8 wire Signal for the 'value'
 		which is displayed on the display.
+
+		If the design already has a Timebase (see cores/timebase.py)
+		pass it in as 'timebase' and the display will use a strobe
+		from it rather than building its own refresh counter. Or pass
+		the strobe itself as 'strobe' (high once per digit, twice the
+		refresh rate), a Rate from cores/regbus.py say, so the refresh
+		can be changed while it runs.
 	"""
 
 	#
@@ -48,30 +74,30 @@ class SevenSegmentLedDisplay(Module):
 			C(~0b1000111),	# F
 		))
 
-	def __init__(self, platform, pmod, value = Signal(8), rev="1.1"):
-		pins = ""
-		for i in range(6, -1, -1):
-			pins += f"{pmod}:{i} "
-		io_def = ("led7seg", 0,
-				Subsignal("num", Pins(pins)),
-				Subsignal("sel", Pins(f"{pmod}:7")),
-		)
-		platform.add_extension([io_def])
-		disp = platform.request("led7seg")
+	def __init__(self, platform, pmod, value = Signal(8), rev="1.1",
+											timebase=None, strobe=None):
+		disp = request_led7seg(platform, pmod)
 		# the active display
 		ad = Signal(1)
-		refresh = Signal(24)
-		
-		# set a 250 Hz refresh rate
-		ticks = int(500e6/(250 * platform.default_clk_period)) - 1
+
+		#
+		# Each digit is refreshed at 250 Hz, so the select line has to
+		# toggle twice that often. If we weren't handed a timebase we
+		# make one of our own.
+		#
+		if strobe is not None:
+			refresh = strobe
+		else:
+			if timebase is None:
+				timebase = ClockPlan.of(platform).timebase()
+				self.submodules += timebase
+			refresh = timebase.strobe(2 * 250)
 		#
 		# So in the clocked part this code toggles the 'select'
-		# line of the PMOD at 65 Hz
+		# line of the PMOD on every refresh strobe.
 		#
 		self.sync += [
-			refresh.eq(refresh + 1),
-			If(refresh == ticks,
-				refresh.eq(0),
+			If(refresh,
 				ad.eq(~ad),
 				disp.sel.eq(ad)
 			),
@@ -87,3 +113,82 @@ class SevenSegmentLedDisplay(Module):
 			).Else(
 				disp.num.eq(SevenSegmentLedDisplay.glyphs[value[:4]])),
 		]
+
+class MultiSevenSegmentLedDisplay(Module):
+	"""
+		Drives several of the 1BitSquared 7 segment PMODs from one glyph
+		decoder. 'pmods' is a list of the PMOD ports the displays are
+		plugged into (the first one shows the most significant digits)
+		and 'value' has four bits per digit, so two PMODs show a 16 bit
+		Signal as four hex (or BCD) digits.
+
+		'refresh' is how often (in Hz) each digit is lit. The digits are
+		scanned one at a time so the scan runs at refresh times the number
+		of digits.
+
+		Pass the design's Timebase in 'timebase' to share its prescalers,
+		or the scan strobe itself in 'strobe' (high once per digit, a
+		Rate from cores/regbus.py say) and 'refresh' is ignored.
+	"""
+	def __init__(self, platform, pmods, value, refresh=250, timebase=None,
+															strobe=None):
+		ndigits = 2 * len(pmods)
+		if len(value) > 4 * ndigits:
+			raise ValueError(f"{len(value)} bits is more than {ndigits} digits")
+		disps = [request_led7seg(platform, pmod) for pmod in pmods]
+
+		#
+		# Rather than one display module (and one glyph Array) per PMOD,
+		# only one digit is ever lit at a time. A scan counter walks
+		# through them, 'pmod' picks the display and 'half' picks which
+		# of its two digits is selected.
+		#
+		if strobe is not None:
+			scan = strobe
+		else:
+			if timebase is None:
+				timebase = ClockPlan.of(platform).timebase()
+				self.submodules += timebase
+			scan = timebase.strobe(refresh * ndigits)
+		half = Signal()
+		pmod = Signal(max=max(len(pmods), 2))
+		self.sync += If(scan,
+			half.eq(~half),
+			If(half,
+				If(pmod == len(pmods) - 1,
+					pmod.eq(0)
+				).Else(
+					pmod.eq(pmod + 1)
+				)
+			)
+		)
+
+		#
+		# Line the nibbles of 'value' up so that Cat(half, pmod) indexes
+		# the digit being shown, the first PMOD gets the top two digits.
+		# Then there is just one glyph lookup for all of the displays.
+		#
+		value = Cat(value, Replicate(0, 4 * ndigits - len(value)))
+		nibbles = []
+		for p in range(len(pmods)):
+			for h in range(2):
+				d = 2 * (len(pmods) - 1 - p) + h
+				nibbles.append(value[4*d:4*d+4])
+		digit = Array(nibbles)[Cat(half, pmod)]
+		glyph = Signal(7)
+		self.comb += glyph.eq(SevenSegmentLedDisplay.glyphs[digit])
+
+		#
+		# The PMOD being scanned gets the glyph, the others are blanked
+		# (the segments are active low so that is all ones). The select
+		# line picks the left hand (high) digit when it is 0.
+		#
+		for p, disp in enumerate(disps):
+			self.comb += [
+				disp.sel.eq(~half),
+				If(pmod == p,
+					disp.num.eq(glyph)
+				).Else(
+					disp.num.eq(0x7f)
+				)
+			]
@@ -0,0 +1,29 @@
+#
+# vim: expandtab:ts=4:
+#
+# The Digilent LED8 PMOD, eight LEDs on the eight pins of a PMOD.
+#
+# 02_cylon explains how the resource is put together (gen_led8() there),
+# this is the same thing for the modules that want an LED8 without
+# copying it: request_led8(platform, "PMOD2") adds an "led8" resource for
+# the PMOD and requests it, 'led0' to 'led7' are the LEDs from the left
+# (pin 0) to the right.
+#
+from litex.build.generic_platform import IOStandard, Pins, Subsignal
+
+from pmod.resources import next_number
+
+
+def request_led8(platform, pmod):
+    """
+        Adds an "led8" resource for the LED8 plugged into 'pmod' and
+        requests it. Each one gets its own number (see
+        pmod/resources.py), so a design can have more than one.
+    """
+    number = next_number(platform, "led8")
+    io_def = ("led8", number,
+        *[Subsignal(f"led{i}", Pins(f"{pmod}:{i}")) for i in range(8)],
+        IOStandard("LVCMOS33"),
+    )
+    platform.add_extension([io_def])
+    return platform.request("led8", number)
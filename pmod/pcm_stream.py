@@ -0,0 +1,304 @@
+#
+# vim: expandtab:ts=4:
+#
+# Audio from the host, over the serial port.
+#
+# The tone and the chords are worked out in the FPGA from a sine table.
+# PCMStream plays whatever the host sends instead: 16 bit stereo samples
+# (PCM, the same as a WAV file holds) come in over the iCEBreaker's
+# serial port, wait in a FIFO and go out to I2S at its sample rate. The
+# host side is tools/pcmstream.py, which reads a WAV file and resamples it
+# to the design's rate.
+#
+# The FTDI chip's second channel only has its RX and TX lines wired to the
+# FPGA, there is no RTS or CTS, so the flow control goes over the same
+# lines as the samples. It works on credits: the host starts out allowed
+# to send as many blocks as fit in the FIFO, and every time a block's
+# worth of frames has gone out to I2S the FPGA sends a CREDIT byte back
+# and the host can send another one. The FIFO can't overflow unless the
+# host sends more than it is allowed to.
+#
+# What the host sends is commands, one byte each:
+#
+#    DATA frames...   'block' frames, each one left then right, each of
+#                     those a 16 bit sample, least significant byte first
+#    STATUS           asks for the counters
+#    END              the stream is over
+#
+# and what comes back is
+#
+#    CREDIT                             room for another block
+#    STATUS underruns overruns level    the counters, 32, 32 and 16 bits,
+#                                       most significant byte first
+#
+# An underrun is a frame the I2S module had to send again because the
+# FIFO was empty, counted from the first frame of a stream until the END
+# (the end of a stream always runs dry, that isn't the host's fault). An
+# overrun is a frame that arrived when the FIFO was full and was lost.
+# 'level' is how many frames are in the FIFO.
+#
+# A DATA command that stops coming half way through for TIMEOUT seconds
+# is forgotten and the next byte is a command again, so a host that was
+# killed in the middle of a block doesn't leave it waiting for the rest.
+#
+from migen import *
+from migen.genlib.cdc import PulseSynchronizer
+
+from cores.clockplan import ClockPlan
+from cores.uart import UARTPHY
+from pmod.i2s2 import I2S, request_i2s2
+from tools.describe import write_json
+
+# the commands, and what comes back
+DATA = 0x01
+STATUS = 0x02
+END = 0x03
+CREDIT = 0x01
+
+# how long (in seconds) a DATA command can stop half way before it is dropped
+TIMEOUT = 0.1
+
+
+class PCMStream(Module):
+    """
+        Plays blocks of 'block' stereo 16 bit frames from the host, sent
+        over 'pads' (the platform's serial port if they aren't given) at
+        'baudrate', on an I2S2 in the top row of 'pmod'. They wait in a
+        'depth' frame FIFO. It runs in sys and the I2S module in the
+        i2s clock domain (see cores/pll.py), see the top of the file.
+    """
+    def __init__(self, platform, pmod, pads=None, baudrate=12000000,
+                 depth=2048, block=64):
+        if depth < 2 * block:
+            raise ValueError(f"A {depth} frame FIFO doesn't have room for "
+                             f"two {block} frame blocks")
+        if depth >= 2**16:
+            raise ValueError(f"{depth} frames is too deep for the status")
+        if block > 256:
+            raise ValueError(f"{block} frames is too big for a block")
+        clocks = ClockPlan.of(platform)
+        self.clk_freq = clocks.freq()
+        self.sample_rate = clocks.freq("i2s") / 1536
+        self.baudrate = baudrate
+        self.depth = depth
+        self.block = block
+        if pads is None:
+            pads = platform.request("serial")
+
+        pins = request_i2s2(platform, pmod)
+        self.submodules.i2s = i2s = I2S(platform, pins.mclk, pins.sclk,
+                                        pins.lrclk, pins.sdo, width=16)
+        self.submodules.phy = phy = UARTPHY(pads, self.clk_freq, baudrate)
+
+        #
+        # The FIFO is a ring buffer in block RAM. LiteX's SyncFIFO works
+        # out whether it can be read and written from its level on every
+        # clock, and that logic (12 bits of level, both ways at once)
+        # doesn't make 48 MHz in the UP5K. It doesn't have to here: a
+        # frame arrives at most every 40 bits and leaves once a sample,
+        # so 'full' and 'readable' are registers kept up to date along with
+        # 'level', and a frame takes two clocks to come out of the block
+        # RAM into 'out', which is what the I2S module reads.
+        #
+        mem = Memory(32, depth)
+        wport = mem.get_port(write_capable=True)
+        rport = mem.get_port()
+        self.specials += mem, wport, rport
+        produce = Signal(max=depth)
+        consume = Signal(max=depth)
+        self.level = level = Signal(16)      # as it goes in the status
+        full = Signal()
+        readable = Signal()
+        written = Signal()
+        fetch = Signal()
+        fetched = Signal()
+        out = i2s.sink
+        self.comb += [
+            wport.adr.eq(produce),
+            wport.we.eq(written),
+            rport.adr.eq(consume),
+            fetch.eq(readable & ~out.valid & ~fetched),
+        ]
+        self.sync += [
+            If(written,
+                produce.eq(Mux(produce == depth - 1, 0, produce + 1))
+            ),
+            If(fetch,
+                consume.eq(Mux(consume == depth - 1, 0, consume + 1))
+            ),
+            level.eq(level + written - fetch),
+            If(fetch,
+                full.eq(0),
+                readable.eq((level != 1) | written)
+            ).Elif(written,
+                full.eq(level == depth - 1),
+                readable.eq(1)
+            ),
+            fetched.eq(fetch),
+            If(fetched,
+                out.valid.eq(1),
+                out.left.eq(rport.dat_r[:16]),
+                out.right.eq(rport.dat_r[16:])
+            ).Elif(out.ready,
+                out.valid.eq(0)
+            ),
+        ]
+
+        #
+        # The counters. The I2S module says when it had to repeat a
+        # frame in its own clock domain, that is at most once a frame so
+        # a PulseSynchronizer can bring it over to sys.
+        #
+        self.underruns = Signal(32)
+        self.overruns = Signal(32)
+        self.submodules.underrun = underrun = PulseSynchronizer("i2s", "sys")
+        self.comb += underrun.i.eq(i2s.underrun)
+
+        #
+        # The receiver. The bytes of a frame are shifted in from the top
+        # so after the fourth one the left sample is the bottom half and
+        # the right one the top. The frame goes into the FIFO on the
+        # clock after its last byte, whether or not there is room: the
+        # UART can't wait, so a frame with nowhere to go is counted and
+        # dropped.
+        #
+        rx = phy.source
+        frame = Signal(32)
+        push = Signal()
+        streaming = Signal()
+        nbytes = Signal(max=4 * block)
+        self.comb += [
+            wport.dat_w.eq(frame),
+            written.eq(push & ~full),
+        ]
+
+        timeout = int(TIMEOUT * self.clk_freq)
+        timer = Signal(max=timeout + 1)
+        command = Signal(8)
+        self.submodules.rx_fsm = rx_fsm = FSM(reset_state="COMMAND")
+        rx_fsm.act("COMMAND",
+            If(rx.valid & (rx.data == DATA),
+                NextValue(nbytes, 0),
+                NextValue(timer, timeout),
+                NextState("DATA")
+            )
+        )
+        rx_fsm.act("DATA",
+            NextValue(timer, timer - 1),
+            If(rx.valid,
+                NextValue(frame, Cat(frame[8:], rx.data)),
+                NextValue(nbytes, nbytes + 1),
+                NextValue(timer, timeout),
+                If(nbytes == 4 * block - 1,
+                    NextState("COMMAND")
+                )
+            ).Elif(timer == 0,
+                NextState("COMMAND")
+            )
+        )
+        self.sync += [
+            push.eq(rx_fsm.ongoing("DATA") & rx.valid & (nbytes[:2] == 3)),
+            command.eq(Mux(rx_fsm.ongoing("COMMAND") & rx.valid, rx.data, 0)),
+            If(push & full,
+                self.overruns.eq(self.overruns + 1)
+            ),
+            If(underrun.o & streaming,
+                self.underruns.eq(self.underruns + 1)
+            ),
+            If(command == END,
+                streaming.eq(0)
+            ).Elif(push,
+                streaming.eq(1)
+            ),
+        ]
+
+        #
+        # The credits. Every 'block' frames that go to I2S is another
+        # one owed to the host, and they wait in 'owed' until the
+        # transmitter gets round to them.
+        #
+        played = Signal(max=block)
+        credit = Signal()
+        self.sync += [
+            credit.eq(0),
+            If(fetch,
+                played.eq(played + 1),
+                If(played == block - 1,
+                    played.eq(0),
+                    credit.eq(1)
+                )
+            )
+        ]
+
+        #
+        # The transmitter sends the status when it was asked for, and
+        # the credits owed otherwise. The counters are copied when the
+        # status starts to go out, so its bytes all come from the same
+        # moment, and it is shifted out from the top a byte at a time.
+        # As in the register bus's bridge (cores/regbus.py) the shift is
+        # a clock after the byte goes, so that the UART's 'ready' doesn't
+        # have to reach all of 'reply'.
+        #
+        tx = phy.sink
+        owed = Signal(max=depth // block + 2)
+        asked = Signal()
+        reply = Signal(88)
+        remaining = Signal(max=11)
+        paid = Signal()
+        answered = Signal()
+        self.comb += tx.data.eq(reply[-8:])
+        self.sync += [
+            If(command == STATUS,
+                asked.eq(1)
+            ).Elif(answered,
+                asked.eq(0)
+            ),
+            owed.eq(owed + credit - paid),
+        ]
+        self.submodules.tx_fsm = tx_fsm = FSM(reset_state="IDLE")
+        tx_fsm.act("IDLE",
+            If(asked,
+                answered.eq(1),
+                NextValue(reply, Cat(level, self.overruns, self.underruns,
+                                     Constant(STATUS, 8))),
+                NextValue(remaining, 10),
+                NextState("SEND")
+            ).Elif(owed != 0,
+                paid.eq(1),
+                NextValue(reply, Cat(Constant(0, 80), Constant(CREDIT, 8))),
+                NextValue(remaining, 0),
+                NextState("SEND")
+            )
+        )
+        tx_fsm.act("SEND",
+            tx.valid.eq(1),
+            If(tx.ready,
+                NextState("SHIFT")
+            )
+        )
+        tx_fsm.act("SHIFT",
+            NextValue(reply, reply << 8),
+            NextValue(remaining, remaining - 1),
+            If(remaining == 0,
+                NextState("IDLE")
+            ).Else(
+                NextState("SEND")
+            )
+        )
+
+    def describe(self):
+        """
+            What the host needs to know to stream to it.
+        """
+        return {
+            "baudrate": self.baudrate,
+            "sample_rate": self.sample_rate,
+            "depth": self.depth,
+            "block": self.block,
+        }
+
+    def write_description(self, path):
+        """
+            Writes describe() to 'path' as JSON, for tools/pcmstream.py.
+        """
+        write_json(path, self.describe())
@@ -0,0 +1,147 @@
+#
+# vim: expandtab:ts=4:
+#
+# The PMODs from the examples as peripherals for a computer (07_soc).
+#
+# In the examples each PMOD is driven by logic that was fixed when the
+# design was built: the display shows a counter, the chaser bounces at
+# the rate it was given and the tone plays the note it was told to. In a
+# LiteX SoC a CPU is on the bus instead, and a peripheral is a module
+# with control and status registers (CSRStorage, CSRStatus) that mixes
+# in AutoCSR. The SoC gives each one a bank of registers on the CPU's
+# bus and writes a C header (build/software/include/generated/csr.h)
+# with a function for each register, so the firmware can do
+#
+#    display_value_write(0x42);
+#    chaser_rate_divisor_write(CONFIG_CLOCK_FREQUENCY / 20);
+#    playing = tone_samples_read();
+#
+# The modules here wrap the same hardware the examples use
+# (SevenSegmentLedDisplay, the Cylon's chaser and the DDS and I2S from
+# the tone example) with registers in place of the constants. Their
+# rates are Rates (see cores/regbus.py) that start out at what they are
+# given and can be changed by writing the divisor. The registers work
+# just as well on a RegisterBus, which is how sim/benches.py tests them
+# without a CPU.
+#
+from migen import *
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+
+from cores.clockplan import ClockPlan
+from cores.dds import DDS
+from cores.regbus import Rate, in_hertz
+from pmod.i2s2 import I2S, request_i2s2
+from pmod.led7segment import SevenSegmentLedDisplay
+from pmod.led8 import request_led8
+
+
+class Display(Module, AutoCSR):
+    """
+        A seven segment display PMOD on 'pmod' that shows 'value' (two
+        hex digits). Each digit is refreshed 'refresh' times a second
+        to begin with.
+    """
+    def __init__(self, platform, pmod, refresh=250):
+        clk_freq = ClockPlan.of(platform).freq()
+        self.value = CSRStorage(8, name="value")
+        self.submodules.refresh = Rate(clk_freq, 2 * refresh)
+        self.submodules.display = SevenSegmentLedDisplay(platform, pmod,
+            value=self.value.storage, strobe=self.refresh.tick)
+
+
+class Chaser(Module, AutoCSR):
+    """
+        The Cylon's chaser on an LED8 PMOD on 'pmod', 'width' LEDs wide
+        and stepping 2 * 'rate' times a second to begin with. Writing 0
+        to 'enable' stops it and the LEDs show 'pattern' instead, 'leds'
+        is what they are showing.
+    """
+    def __init__(self, platform, pmod, rate=15, width=3):
+        if not 0 < width < 8:
+            raise ValueError(f"The chaser can't be {width} LEDs wide")
+        pads = request_led8(platform, pmod)
+        clk_freq = ClockPlan.of(platform).freq()
+        self.enable = CSRStorage(reset=1, name="enable")
+        self.pattern = CSRStorage(8, name="pattern")
+        self.leds = CSRStatus(8, name="leds")
+        self.submodules.rate = Rate(clk_freq, 2 * rate)
+
+        #
+        # The same as the Cylon (see 02_cylon/cylon.py) with 8 LEDs
+        # rather than 16: rotate on every tick and turn around when the
+        # lit ones reach the end. led0 is on the left, so it is the top
+        # bit.
+        #
+        display = Signal(8, reset=2**width - 1)
+        direction = Signal()
+        fin = Signal(max=8)
+        leds = Signal(8)
+        self.sync += If(self.rate.tick,
+                fin.eq(fin + 1),
+                If(fin == 8 - width - 1,
+                    fin.eq(0),
+                    direction.eq(~direction)
+                ),
+                If(direction == 0,
+                    display.eq(Cat(display[-1], display[:-1])),
+                ).Else(
+                    display.eq(Cat(display[1:], display[0])),
+                )
+            )
+        self.comb += [
+            leds.eq(Mux(self.enable.storage, display, self.pattern.storage)),
+            self.leds.status.eq(leds),
+            Cat(*[getattr(pads, f"led{7 - i}") for i in range(8)]).eq(leds),
+        ]
+
+
+class ToneGenerator(Module, AutoCSR):
+    """
+        The tone example's DDS playing through an I2S2 in the top row of
+        'pmod', starting out at 'freq' Hz. 'tuning' is the DDS tuning
+        word, 'mute' silences it and 'samples' counts the frames that
+        have gone to the I2S2 (so it goes up at the sample rate).
+
+        It needs the PLL's i2s clock domain (see cores/pll.py), and the
+        design should call block_rom() (cores/sine_rom.py) so that the
+        table ends up in block RAM.
+    """
+    def __init__(self, platform, pmod, freq=440, depth=256):
+        pins = request_i2s2(platform, pmod)
+        self.submodules.i2s = I2S(platform, pins.mclk, pins.sclk,
+                                  pins.lrclk, pins.sdo)
+        sample_rate = ClockPlan.of(platform).freq("i2s") / 1536
+        self.submodules.dds = DDS(sample_rate, depth=depth,
+                                  offsets=(0, 0.25), dither=True)
+        self.sample_rate = sample_rate
+
+        self.tuning = CSRStorage(32, reset=self.dds.tuning(freq),
+                                 name="tuning")
+        in_hertz(self.tuning, multiplies=2**self.dds.acc_bits / sample_rate)
+        self.mute = CSRStorage(name="mute")
+        self.samples = CSRStatus(32, name="samples")
+
+        #
+        # As in the tone example the DDS works out a sample whenever
+        # there is room for one in the I2S module's FIFO.
+        #
+        busy = Signal()
+        sink = self.i2s.sink
+        self.comb += [
+            self.dds.tuning_word.eq(self.tuning.storage),
+            sink.valid.eq(self.dds.valid),
+            sink.left.eq(Mux(self.mute.storage, 0, self.dds.values[0])),
+            sink.right.eq(Mux(self.mute.storage, 0, self.dds.values[1])),
+        ]
+        self.sync += [
+            self.dds.ce.eq(0),
+            If(sink.ready & ~busy,
+                self.dds.ce.eq(1),
+                busy.eq(1)
+            ).Elif(self.dds.valid,
+                busy.eq(0)
+            ),
+            If(sink.valid & sink.ready,
+                self.samples.status.eq(self.samples.status + 1)
+            )
+        ]
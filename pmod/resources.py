@@ -0,0 +1,25 @@
+#
+# vim: expandtab:ts=4:
+#
+# The request_*() functions in this directory add a resource for the PMOD
+# they are handed and request it. Two of the same thing on one platform
+# (the two displays in 04_display_two, say) can't both be number 0, LiteX
+# would find two resources with the same name and number, so each one
+# takes the next number that is free.
+#
+
+
+def next_number(platform, name):
+    """
+        The number after the highest one of the 'name' resources that
+        'platform' has, requested or not (0 if it has none).
+    """
+    #
+    # LiteX has no way to ask for this so it looks in the constraint
+    # manager's own lists, 'available' has the resources that haven't
+    # been requested yet and 'matched' the ones that have.
+    #
+    cm = platform.constraint_manager
+    taken = [r[1] for r in cm.available if r[0] == name]
+    taken += [r[1] for r, obj in cm.matched if r[0] == name]
+    return max(taken, default=-1) + 1
@@ -0,0 +1,156 @@
+#
+# vim: expandtab:ts=4:
+#
+# The sample player (cores/sampler.py) with registers, on an I2S2.
+#
+# Sampler puts a SamplePlayer and its SPRAM behind control and status
+# registers, like the peripherals in pmod/peripherals.py, so a
+# RegisterBus (or a CPU) can load the samples and say what to play:
+#
+#    start, length, loop     the region to play next, in samples
+#    increment               how fast, 16.16 fixed point (0x10000 is 1.0)
+#    fade                    how fast to crossfade to it, out of 32768 a sample
+#    play                    writing anything starts it
+#    playing                 whether it is still playing
+#
+# The samples are loaded through two more: writing 'address' says where
+# the next ones go and each write to 'data' stores two samples there (the
+# bottom 16 bits first) and moves on by two, so a fixed burst of writes to
+# 'data' fills the memory (tools/sampler.py does that). They can come from
+# the SPI flash too: with a 'flash_offset' the sampler copies the memory's
+# worth of samples (16 bit, least significant byte first) from there when
+# the design starts, which takes about 90 ms for all 128 kB, and
+# 'loading' is 1 until it is done. The host shouldn't write samples before
+# then, the two would be writing through the same pointer.
+#
+# The samples are mono and play on both channels. write_description()
+# puts what tools/sampler.py needs to know (the sample rate, how many
+# samples there is room for and where they are in the flash) in a JSON
+# file when the design is built.
+#
+from migen import *
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus, CSRStorage
+
+from cores.clockplan import ClockPlan
+from cores.sampler import SPRAM_WORDS, SampleMemory, SamplePlayer
+from cores.spiflash import SPIFlashReader
+from pmod.i2s2 import I2S, request_i2s2
+from tools.describe import write_json
+
+
+class Sampler(Module, AutoCSR):
+    """
+        A SamplePlayer with 'words' of SPRAM (spram=False for block RAM,
+        in the simulation) playing on an I2S2 in the top row of 'pmod',
+        see the top of the file. With 'flash_offset' the memory is
+        loaded from the SPI flash ('flash_pads', the platform's
+        "spiflash" if they aren't given) at that offset at the start.
+        Pulsing 'trigger' starts the region, the same as writing 'play'.
+
+        It needs the PLL's i2s clock domain (see cores/pll.py).
+    """
+    def __init__(self, platform, pmod, words=4 * SPRAM_WORDS,
+                 flash_offset=None, flash_pads=None, spram=True):
+        clocks = ClockPlan.of(platform)
+        self.sample_rate = clocks.freq("i2s") / 1536
+        self.words = words
+        self.flash_offset = flash_offset
+        pins = request_i2s2(platform, pmod)
+        self.submodules.i2s = I2S(platform, pins.mclk, pins.sclk,
+                                  pins.lrclk, pins.sdo, width=16)
+        self.submodules.memory = SampleMemory(words, spram=spram)
+        self.submodules.player = player = SamplePlayer(self.memory)
+        self.trigger = Signal()
+
+        self.start = CSRStorage(16, name="start")
+        self.length = CSRStorage(17, name="length")
+        self.loop = CSRStorage(name="loop")
+        self.increment = CSRStorage(32, reset=1 << 16, name="increment")
+        self.fade = CSRStorage(16, name="fade")
+        self.play = CSRStorage(name="play")
+        self.playing = CSRStatus(name="playing")
+        self.address = CSRStorage(16, name="address")
+        self.data = CSRStorage(32, name="data")
+        self.loading = CSRStatus(name="loading")
+        self.comb += [
+            player.start.eq(self.start.storage),
+            player.length.eq(self.length.storage),
+            player.loop.eq(self.loop.storage),
+            player.increment.eq(self.increment.storage),
+            player.fade.eq(self.fade.storage),
+            player.play.eq(self.play.re | self.trigger),
+            self.playing.status.eq(player.playing),
+        ]
+
+        #
+        # Where the next two samples go, from the host or the flash.
+        #
+        pointer = Signal(16)
+        word = Signal(32)
+        flashed = Signal()
+        self.sync += If(self.address.re,
+                pointer.eq(self.address.storage)
+            ).Elif(self.data.re | flashed,
+                pointer.eq(pointer + 2)
+            )
+        self.comb += [
+            player.address.eq(pointer),
+            player.data.eq(Mux(flashed, word, self.data.storage)),
+            player.write.eq(self.data.re | flashed),
+        ]
+
+        #
+        # The flash's bytes are shifted in from the top, so after four
+        # of them the first sample is the bottom half of 'word'.
+        #
+        if flash_offset is not None:
+            if flash_pads is None:
+                flash_pads = platform.request("spiflash")
+            self.submodules.flash = flash = SPIFlashReader(flash_pads,
+                clocks.freq(), flash_offset, 2 * words)
+            nbytes = Signal(2)
+            self.sync += [
+                If(flash.source.valid,
+                    word.eq(Cat(word[8:], flash.source.data)),
+                    nbytes.eq(nbytes + 1)
+                ),
+                flashed.eq(flash.source.valid & (nbytes == 3)),
+            ]
+            self.comb += self.loading.status.eq(~flash.done)
+
+        #
+        # As in the tone generator (pmod/peripherals.py) the player
+        # works out a sample whenever the I2S module has room for one.
+        #
+        busy = Signal()
+        sink = self.i2s.sink
+        self.comb += [
+            sink.valid.eq(player.valid),
+            sink.left.eq(player.value),
+            sink.right.eq(player.value),
+        ]
+        self.sync += [
+            player.ce.eq(0),
+            If(sink.ready & ~busy,
+                player.ce.eq(1),
+                busy.eq(1)
+            ).Elif(player.valid,
+                busy.eq(0)
+            ),
+        ]
+
+    def describe(self):
+        """
+            What the host needs to know to load it and play regions.
+        """
+        return {
+            "sample_rate": self.sample_rate,
+            "words": self.words,
+            "flash_offset": self.flash_offset,
+        }
+
+    def write_description(self, path):
+        """
+            Writes describe() to 'path' as JSON, for tools/sampler.py.
+        """
+        write_json(path, self.describe())
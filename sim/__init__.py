@@ -0,0 +1,217 @@
+#
+# vim: expandtab:ts=4:
+#
+# Simulating the examples.
+#
+# Migen can simulate a design in python (run_simulation) but at 12
+# million clocks per second of Blink time it would take all day to see
+# the LED change. Everything in these examples that divides the clock
+# down gets its numbers from the design's ClockPlan though (see
+# cores/clockplan.py), so the simulation gives the plan a 'scale'. With
+# a scale of 10000 the clock "runs" at 1200 Hz, the blink divider is
+# 10000 times shorter and a few thousand clocks covers several blinks.
+#
+# The harness is three things:
+#
+#    module = load("01_blink/blink.py", scale=10000)
+#
+# imports an example script (without building it, the build is only
+# done when the script is run) with a fresh platform that has a scaled
+# ClockPlan, so the testbench can make the example's module from it,
+#
+#    platform(scale=...)
+#
+# does the same for a bare iCEBreaker platform, for testing a module
+# that isn't a whole example, and
+#
+#    trace = simulate(top, cycles, record={"led": led}, drive={button: 1})
+#
+# runs 'top' for 'cycles' clocks, setting the signals in 'drive' (to a
+# value, or at the given clocks from a list of (cycle, value) pairs),
+# and returns what the signals in 'record' were on every clock as numpy
+# arrays. The clocks for each domain come from the ClockPlan. Nothing
+# in the testbench runs during the simulation, it sets up the inputs,
+# runs it and then checks the arrays, which is what lets a faster
+# simulator be put behind the same call.
+#
+# There are two of them (the 'backend' argument, or ICEBREAKER_SIM in
+# the environment): "migen" is Migen's own simulator and "verilator"
+# compiles the design with Verilator (see sim/verilator.py), which is
+# a lot faster. By default Verilator is used if it is installed. 'python3 -m sim.speed' compares the two.
+#
+# The testbenches for the examples are in sim/benches.py and
+#
+#    python3 -m sim [bench ...]
+#
+# runs them (or 'make sim' at the top).
+#
+import importlib.util
+import itertools
+import os
+import sys
+
+import numpy as np
+
+from migen import *
+from migen.genlib.resetsync import AsyncResetSynchronizer
+from migen.sim.core import Simulator, DummyAsyncResetSynchronizer
+
+#
+# The top of the repository, the example scripts are loaded relative to it.
+#
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if TOP not in sys.path:
+    sys.path.insert(0, TOP)
+
+from cores.clockplan import ClockPlan
+from sim import verilator
+
+_loads = itertools.count()
+
+
+def load(script, scale=1, platform="icebreaker"):
+    """
+        Imports the example 'script' (relative to the top of the
+        repository) as a new module and gives the platform it makes
+        (the global called 'platform') a ClockPlan scaled by 'scale'.
+        Each call gets a new copy, so resources can be requested again.
+    """
+    path = os.path.join(TOP, script)
+    name = f"_sim_{os.path.splitext(os.path.basename(path))[0]}_{next(_loads)}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    ClockPlan(getattr(module, platform), scale=scale)
+    return module
+
+
+def platform(scale=1):
+    """
+        An iCEBreaker platform with a ClockPlan scaled by 'scale'.
+    """
+    from litex_boards.platforms.icebreaker import Platform
+    plat = Platform()
+    ClockPlan(plat, scale=scale)
+    return plat
+
+
+class _SimInstance:
+    """
+        Stands in for the hard blocks that Migen can't simulate. The PLL
+        is just locked, its clocks come from the simulation.
+    """
+    @staticmethod
+    def lower(instance):
+        if instance.of.startswith("SB_PLL40"):
+            module = Module()
+            for item in instance.items:
+                if getattr(item, "name", None) == "LOCK":
+                    module.comb += item.expr.eq(1)
+            return module
+        raise ValueError(f"Can't simulate a {instance.of}")
+
+
+_overrides = {
+    Instance: _SimInstance,
+    AsyncResetSynchronizer: DummyAsyncResetSynchronizer,
+}
+
+
+def clocks(fragment, plan=None):
+    """
+        The clock periods (in the simulator's time units) for the clock
+        domains in 'fragment', from the frequencies in 'plan'. A domain
+        that isn't in the plan (the PLL's power on reset domain) runs
+        with sys.
+    """
+    names = {"sys"} | set(fragment.sync) | {cd.name for cd in fragment.clock_domains}
+    freqs = {}
+    if plan is not None:
+        freqs = {d: plan.freq(d) for d in plan.domains()}
+    fastest = max(freqs.values(), default=1)
+    periods = {}
+    for name in names:
+        freq = freqs.get(name, freqs.get("sys", fastest))
+        # at least 100 units a period so that the ratios survive rounding
+        periods[name] = 2 * max(1, int(round(50 * fastest / freq)))
+    return periods
+
+
+def _schedule(drive):
+    """
+        Turns 'drive' into {cycle: [(signal, value), ...]}.
+    """
+    at = {}
+    for signal, value in (drive or {}).items():
+        changes = value if isinstance(value, (list, tuple)) else [(0, value)]
+        for cycle, v in changes:
+            at.setdefault(cycle, []).append((signal, v))
+    return at
+
+
+def _record(record):
+    """
+        'record' is a dict of name: signal or a list of signals (which
+        are named by their own names).
+    """
+    if isinstance(record, dict):
+        return record
+    return {s.backtrace[-1][0] if s.backtrace else str(s): s for s in record}
+
+
+def _migen(fragment, cycles, signals, schedule, periods, domain, vcd):
+    """
+        Runs the Migen simulator, returns a list of rows of values.
+    """
+    rows = []
+
+    def bench():
+        for cycle in range(cycles):
+            for signal, value in schedule.get(cycle, ()):
+                yield signal.eq(value)
+            yield
+            rows.append((yield signals))
+
+    with Simulator(fragment, {domain: bench()}, clocks=periods,
+                   vcd_name=vcd, special_overrides=_overrides) as s:
+        s.run()
+    return rows
+
+
+def simulate(top, cycles, record=(), drive=None, plan=None, domain="sys",
+             vcd=None, backend=None):
+    """
+        Simulates 'top' for 'cycles' clocks of 'domain' and returns a
+        dict of numpy arrays with the value of each of the signals in
+        'record' after every one of those clocks. 'drive' sets inputs,
+        {signal: value} or {signal: [(cycle, value), ...]}. The clock
+        frequencies come from 'plan' (a ClockPlan). 'vcd' is the name
+        of a VCD file to write the waveforms to.
+
+        'backend' is "migen", "verilator" or "auto" (Verilator if it is
+        installed and there's no VCD to write), if it isn't given it
+        comes from ICEBREAKER_SIM in the environment, or is "auto".
+    """
+    record = _record(record)
+    names = list(record)
+    schedule = _schedule(drive)
+
+    backend = backend or os.environ.get("ICEBREAKER_SIM", "auto")
+    if backend == "auto":
+        backend = "verilator" if vcd is None and verilator.available() else "migen"
+
+    fragment = top.get_fragment()
+    periods = clocks(fragment, plan)
+    if backend == "migen":
+        rows = _migen(fragment, cycles, [record[n] for n in names],
+                      schedule, periods, domain, vcd)
+    elif backend == "verilator":
+        if vcd is not None:
+            raise ValueError("The Verilator backend doesn't write VCD files")
+        rows = verilator.run(fragment, cycles, record, schedule, periods,
+                             domain, _overrides)
+    else:
+        raise ValueError(f"Unknown simulation backend {backend}")
+
+    values = np.array(rows, dtype=np.int64).reshape(len(rows), len(names))
+    return {n: values[:, i] for i, n in enumerate(names)}
@@ -0,0 +1,50 @@
+#
+# vim: expandtab:ts=4:
+#
+# Runs the testbenches in sim/benches.py.
+#
+#    python3 -m sim [bench ...]
+#
+# With no names it runs all of them. It prints a line for each one and
+# exits with 1 if any of them failed. A bench that goes wrong some other
+# way than failing its checks (an exception from migen, say) is an ERROR,
+# its traceback is printed and the rest of them still run.
+#
+import argparse
+import sys
+import time
+import traceback
+
+from sim.benches import BENCHES, BenchFailure
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m sim",
+                                     description="Simulate the examples")
+    parser.add_argument("benches", nargs="*", metavar="bench",
+                        help=f"benches to run ({', '.join(BENCHES)})")
+    args = parser.parse_args(argv)
+
+    unknown = [b for b in args.benches if b not in BENCHES]
+    if unknown:
+        parser.error(f"no bench called {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.benches or BENCHES:
+        start = time.time()
+        try:
+            BENCHES[name]()
+            result = "pass"
+        except BenchFailure as e:
+            result = f"FAIL: {e}"
+            failed += 1
+        except Exception as e:
+            traceback.print_exc()
+            result = f"ERROR: {type(e).__name__}: {e}"
+            failed += 1
+        print(f"{name:16s} {time.time() - start:6.1f}s  {result}", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
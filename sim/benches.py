@@ -0,0 +1,788 @@
+#
+# vim: expandtab:ts=4:
+#
+# Pass/fail testbenches for the examples and the shared modules.
+#
+# Each bench builds its module with a scaled ClockPlan (see sim/__init__.py),
+# simulates it and checks what came out of the pins against what the
+# module is meant to do, raising BenchFailure if it doesn't. The scales
+# are picked so that every divider comes out as a whole number of clocks
+# and the bench sees plenty of periods of whatever it is checking.
+#
+# Where there is a model of the design (see sim/models.py) the bench
+# works out every row of the trace from it and compare() checks them
+# all at once, rather than looping over the trace in python.
+#
+# They are run by 'python3 -m sim' (see sim/__main__.py), a new one just
+# needs the @bench decorator.
+#
+import numpy as np
+
+from migen import *
+from litex.soc.interconnect import stream
+
+from sim import load, platform, simulate, models
+from pmod.led7segment import SevenSegmentLedDisplay
+from pmod.i2s2 import I2S
+from cores.pll import pll_config
+from cores.logic_analyzer import LogicAnalyzer
+from tools.i2s2wav import I2SDecoder
+from tools.la2vcd import trigger_command, samples, probe_values
+from tools.regclient import Batch
+
+#
+# name -> bench function, in the order they are defined
+#
+BENCHES = {}
+
+
+class BenchFailure(Exception):
+    pass
+
+
+def bench(func):
+    """
+        Adds 'func' to the benches that 'python3 -m sim' runs.
+    """
+    BENCHES[func.__name__] = func
+    return func
+
+
+def check(condition, message):
+    if not condition:
+        raise BenchFailure(message)
+
+
+def edges(values):
+    """
+        The indices where 'values' changes (the index of the new value).
+    """
+    return np.flatnonzero(np.diff(values)) + 1
+
+
+def intervals(values, expected, what):
+    """
+        Checks that 'values' changes every 'expected' clocks.
+    """
+    steps = np.diff(edges(values))
+    check(len(steps) > 0, f"{what} never changes")
+    check(np.all(steps == expected),
+          f"{what} changes every {sorted(set(steps.tolist()))} clocks, "
+          f"not {expected}")
+
+
+def compare(what, actual, *expected):
+    """
+        Checks a whole trace against a model at once. 'actual' has to
+        match one of the 'expected' arrays on every row (a model that
+        can't say exactly what the design does gives the choices). The
+        failure says how many rows are wrong and shows the first few.
+    """
+    actual = np.asarray(actual)
+    expected = [np.broadcast_to(e, actual.shape) for e in expected]
+    ok = np.zeros(actual.shape, dtype=bool)
+    for e in expected:
+        ok |= actual == e
+    wrong = np.flatnonzero(~ok)
+    if len(wrong):
+        shown = ", ".join(f"{i}: {actual[i]:#x} not " +
+                          " or ".join(f"{e[i]:#x}" for e in expected)
+                          for i in wrong[:4])
+        more = ", ..." if len(wrong) > 4 else ""
+        raise BenchFailure(f"{what} is wrong on {len(wrong)} of {len(actual)} "
+                           f"rows ({shown}{more})")
+
+
+def i2s_frames(trace):
+    """
+        Decodes the I2S2 pins in 'trace' ("sclk", "lrclk", "sdo", one
+        entry per i2s clock) into a list of (left, right) samples (see
+        tools/i2s2wav.py).
+    """
+    frames, _ = I2SDecoder().feed(trace["sclk"], trace["lrclk"], trace["sdo"])
+    return [tuple(int(v) for v in frame) for frame in frames]
+
+
+def uart_drive(data, clocks_per_bit, start=0):
+    """
+        The changes to a serial line that send the bytes 'data' (8N1,
+        'clocks_per_bit' clocks a bit) from clock 'start', for 'drive'.
+    """
+    changes = [(0, 1)]
+    cycle = start
+    for byte in data:
+        for bit in [0] + [(byte >> i) & 1 for i in range(8)] + [1]:
+            changes.append((cycle, bit))
+            cycle += clocks_per_bit
+    return changes
+
+
+def uart_bytes(line, clocks_per_bit):
+    """
+        The bytes sent on the serial 'line' (one entry a clock), read
+        in the middle of each bit.
+    """
+    data = []
+    i = 0
+    while True:
+        low = np.flatnonzero(line[i:] == 0)
+        if len(low) == 0:
+            return bytes(data)
+        begin = i + low[0]
+        middles = begin + clocks_per_bit // 2 + clocks_per_bit * np.arange(10)
+        if middles[-1] >= len(line):
+            return bytes(data)
+        bits = line[middles]
+        check(bits[9] == 1, f"no stop bit on the byte at clock {begin}")
+        data.append(int(np.sum(bits[1:9] << np.arange(8))))
+        i = middles[-1]
+
+
+@bench
+def blink():
+    """
+        The red LED toggles at twice the blink rate and the green one
+        follows it (or its opposite) depending on the button.
+    """
+    m = load("01_blink/blink.py", scale=10000)
+    top = m.Blink(3)
+    plat = m.icebreaker
+    button = plat.lookup_request("user_button_2")
+    trace = simulate(top, 3000, plan=plat.clock_plan, record={
+            "red": plat.lookup_request("user_led_red"),
+            "green": plat.lookup_request("user_led_green"),
+            "button": button,
+        }, drive={button: [(0, 0), (1500, 1)]})
+    intervals(trace["red"], top.timebase.divisor(2 * 3), "the red LED")
+    green = np.where(trace["button"] == 1, trace["red"], 1 - trace["red"]) * 0xf
+    check(np.all(trace["green"] == green), "the green LEDs don't follow the button")
+
+
+@bench
+def cylon():
+    """
+        Three LEDs go round the two LED8 PMODs one step per tick, turning
+        around every 13 steps unless the button is held down.
+    """
+    m = load("02_cylon/cylon.py", scale=10000)
+    top = m.Cylon(15)
+    plat = m.icebreaker
+    leds = plat.lookup_request("led8", 0)
+    more = plat.lookup_request("led8", 1)
+    button = plat.lookup_request("user_btn")
+    pattern = Cat(*[getattr(more, f"led{i}") for i in range(7, -1, -1)],
+                  *[getattr(leds, f"led{i}") for i in range(7, -1, -1)])
+    cycles = 4000
+    trace = simulate(top, cycles, plan=plat.clock_plan,
+                     record={"leds": pattern, "button": button},
+                     drive={button: [(0, 0), (2500, 1)]})
+    ticks = models.strobes(cycles, top.timebase.divisor(2 * 15))
+    check(ticks[-1] > 26, "the LEDs hardly moved")
+    compare("the LEDs", trace["leds"], models.cylon(ticks, trace["button"]))
+
+
+@bench
+def counter():
+    """
+        The BCD counter of 03_display counts 00 to 99 and round again, one
+        count per tick, and its display shows the count.
+    """
+    m = load("03_display/display.py", scale=12000)
+    top = m.Counter(5)
+    plat = m.icebreaker
+    disp = plat.lookup_request("led7seg", 0)
+    cycles = 10500
+    trace = simulate(top, cycles, plan=plat.clock_plan, record={
+            "num": disp.num, "sel": disp.sel,
+            "gled": plat.lookup_request("user_ledg_n"),
+        })
+    ticks = models.strobes(cycles, top.timebase.divisor(2 * 5))
+    check(ticks[-1] > 100, "the counter didn't get round to 00 again")
+    compare("the green LED", trace["gled"], models.toggle(ticks))
+    refresh = models.strobes(cycles, top.timebase.divisor(2 * 250))
+    num, sel = models.seven_segment(models.bcd(ticks, 2), refresh)
+    compare("the digit select", trace["sel"], sel)
+    compare("the display", trace["num"], num)
+
+
+@bench
+def counter_two():
+    """
+        The four digit BCD counter of 04_display_two on two displays,
+        one count every four ticks with the green LEDs going round once
+        per count.
+    """
+    m = load("04_display_two/display_two.py", scale=12000)
+    top = m.Counter(4)
+    plat = m.icebreaker
+    disps = [plat.lookup_request("led7seg", i) for i in range(2)]
+    leds = [plat.lookup_request("user_ledg", i) for i in (0, 2, 1, 3)]
+    cycles = 11000
+    trace = simulate(top, cycles, plan=plat.clock_plan, record={
+            "num0": disps[0].num, "sel0": disps[0].sel,
+            "num1": disps[1].num, "sel1": disps[1].sel,
+            "leds": Cat(*leds),
+        })
+    ticks = models.strobes(cycles, top.timebase.divisor(2 * 4))
+    check(ticks[-1] // 4 > 10, "the counter didn't get to 10")
+    compare("the green LEDs", trace["leds"], 1 << (ticks % 4))
+    scan = models.strobes(cycles, top.timebase.divisor(250 * 4))
+    nums, sel = models.multi_seven_segment(models.bcd(ticks // 4, 4), scan, 2)
+    for i, num in enumerate(nums):
+        compare(f"display {i}'s select", trace[f"sel{i}"], sel)
+        compare(f"display {i}", trace[f"num{i}"], num)
+
+
+@bench
+def seven_segment():
+    """
+        SevenSegmentLedDisplay shows every 8 bit value as two hex digits,
+        the top nibble while the select line is low and the bottom one
+        while it is high, switching at twice the refresh rate.
+    """
+    plat = platform(scale=6000)
+    value = Signal(8)
+    top = SevenSegmentLedDisplay(plat, "PMOD1A", value=value)
+    disp = plat.lookup_request("led7seg", 0)
+    # long enough to see both digits of each value
+    hold = 2 * 2000 // 500
+    cycles = 256 * hold
+    trace = simulate(top, cycles, plan=plat.clock_plan,
+                     record={"num": disp.num, "sel": disp.sel, "value": value},
+                     drive={value: [(hold * v, v) for v in range(256)]})
+    num, sel = models.seven_segment(trace["value"],
+                                    models.strobes(cycles, 2000 // 500))
+    compare("the digit select", trace["sel"], sel)
+    compare("the digit shown", trace["num"], num)
+
+
+class _Frames(Module):
+    """
+        Sends 'frames' numbered samples into a stream, as fast as it
+        will take them.
+    """
+    def __init__(self, frames, width=24):
+        self.source = stream.Endpoint([("left", width), ("right", width)])
+        n = Signal(max=frames + 1)
+        self.comb += [
+            self.source.valid.eq(n < frames),
+            self.source.left.eq(_left(n)),
+            self.source.right.eq(_right(n)),
+        ]
+        self.sync += If(self.source.valid & self.source.ready, n.eq(n + 1))
+
+
+def _left(n):
+    return 0x123400 + n
+
+def _right(n):
+    return 0x3c0000 - n
+
+
+@bench
+def i2s():
+    """
+        The I2S module sends the frames it is given in order and then
+        holds the last one when there aren't any more, with sys and i2s
+        running at different rates.
+    """
+    plat = platform()
+    plat.clock_plan.add("i2s", 9e6)
+    pins = {name: Signal(name=name) for name in ("mclk", "sclk", "lrclk", "sdo")}
+    top = Module()
+    top.submodules.i2s = I2S(plat, pins["mclk"], pins["sclk"],
+                             pins["lrclk"], pins["sdo"])
+    top.submodules.frames = _Frames(4)
+    top.comb += top.frames.source.connect(top.i2s.sink)
+    trace = simulate(top, 1536 * 8, record=pins, plan=plat.clock_plan,
+                     domain="i2s")
+    intervals(trace["lrclk"], 768, "LRCLK")
+    frames = i2s_frames(trace)
+    while frames and frames[0] == (0, 0):
+        frames.pop(0)
+    sent = [(_left(n), _right(n)) for n in range(4)]
+    check(len(frames) > len(sent), f"only {len(frames)} frames came out")
+    expected = sent + [sent[-1]] * (len(frames) - len(sent))
+    check(frames == expected, f"sent {[(hex(l), hex(r)) for l, r in sent]}, "
+          f"got {[(hex(l), hex(r)) for l, r in frames]}")
+
+
+@bench
+def tone():
+    """
+        The tone example plays the samples of a sine wave at the
+        frequency it was asked for, full scale, with the right channel a
+        quarter of a cycle ahead of the left.
+    """
+    scale = 256
+    m = load("05_tone/simple_tone.py", scale=scale)
+    sample_rate = pll_config(50).freq_b * 1e6 / scale / 1536
+    # not a whole number of samples a cycle, so the dither matters
+    top = m.Tone(sample_rate * 0.1234)
+    plat = m.icebreaker
+    trace = simulate(top, 1536 * 9, plan=plat.clock_plan, domain="i2s", record={
+            "sclk": plat.lookup_request("pmod1_0"),
+            "lrclk": plat.lookup_request("pmod1_1"),
+            "sdo": plat.lookup_request("pmod1_2"),
+        })
+    frames = i2s_frames(trace)
+    while frames and frames[0] == (0, 0):
+        frames.pop(0)
+    check(len(frames) >= 6, f"only {len(frames)} frames came out")
+
+    dds = top.dds
+    expected = models.dds(dds.tuning(sample_rate * 0.1234), len(frames),
+                          dds.acc_bits, dds.rom.depth, dds.rom.width,
+                          offsets=(0, 0.25), dither=True)
+    for channel, samples, choices in zip(("left", "right"),
+                                         np.array(frames).T, expected):
+        compare(f"the {channel} channel", samples, *choices)
+
+
+@bench
+def logic_analyzer():
+    """
+        The logic analyzer, armed over the serial port to trigger when
+        the bottom bit of a counter rises with the top four bits at 4,
+        sends back the counter from 8 samples before 0x41 on.
+    """
+    plat = platform()
+    count = Signal(8)
+    top = Module()
+    top.sync += count.eq(count + 1)
+    top.submodules.la = LogicAnalyzer(plat, [
+            ("odd", count[0]), ("high", count[4:]), ("count", count),
+        ], depth=32, pre=8)
+    serial = plat.lookup_request("serial")
+    description = top.la.describe()
+    command = trigger_command(description, ["odd=rise", "high=4"])
+    bit = int(plat.clock_plan.freq() / description["baudrate"])
+    trace = simulate(top, 10000, plan=plat.clock_plan,
+                     record={"tx": serial.tx},
+                     drive={serial.rx: uart_drive(command, bit, start=20)})
+    data = uart_bytes(trace["tx"], bit)
+    size = description["depth"] * description["nbytes"]
+    check(len(data) == size, f"{len(data)} bytes came back, not {size}")
+    values = probe_values(samples(data, description), description)
+    expected = (0x41 - description["pre"] + np.arange(32)) & 0xff
+    compare("the count", values["count"], expected)
+    compare("the odd bit", values["odd"], expected & 1)
+    compare("the top bits", values["high"], expected >> 4)
+
+
+@bench
+def registers():
+    """
+        The register bus on 03_display's counter, one batch over the
+        serial port sets the counting rate, loads the count and reads
+        back the count and the rate. After that the counter counts at
+        the new rate from where it was loaded.
+    """
+    m = load("03_display/display.py")
+    top = m.Counter(5, registers=True)
+    plat = m.icebreaker
+    regmap = top.regbus.describe()
+    serial = plat.lookup_request("serial")
+    batch = Batch(regmap["registers"])
+    batch.write("counter_rate_divisor", "12000Hz")
+    batch.write("counter_value", 0x42)
+    count = batch.read("counter_count")
+    rate = batch.read("counter_rate_divisor")
+    bit = int(plat.clock_plan.freq() / regmap["baudrate"])
+    trace = simulate(top, 8000, plan=plat.clock_plan, record={
+            "tx": serial.tx, "count": top.count.status,
+            "gled": plat.lookup_request("user_ledg_n"),
+        }, drive={serial.rx: uart_drive(batch.commands(), bit, start=20)})
+    data = uart_bytes(trace["tx"], bit)
+    check(len(data) == batch.size(),
+          f"{len(data)} bytes came back, not {batch.size()}")
+    batch.done(data)
+    check(rate.value == 1000, f"the rate's divisor reads back as {rate.value}")
+    loaded = np.flatnonzero(trace["count"] == 0x42)
+    check(len(loaded) > 0, "the count was never loaded")
+    after = trace["count"][loaded[0]:]
+    check(count.value in after,
+          f"the count read back as {count.value:#x}, it was never that")
+    gled = trace["gled"][loaded[0]:]
+    intervals(gled, 1000, "the green LED")
+    ticks = np.concatenate(([0], np.cumsum(np.diff(gled) != 0)))
+    compare("the count", after, models.bcd(42 + ticks, 2))
+
+
+@bench
+def soc_peripherals():
+    """
+        The SoC's peripherals (pmod/peripherals.py) on a register bus in
+        place of the CPU. The first batch speeds up the chaser and the
+        display's refresh and gives the display a value, the second stops
+        the chaser on a pattern and mutes the tone. The chaser steps and
+        the display flips at the new rates, the LEDs show the pattern and
+        the tone only sends silence to the I2S2 after the mute.
+    """
+    from pmod.peripherals import Display, Chaser, ToneGenerator
+    from cores.regbus import RegisterBus
+    plat = platform()
+    plat.clock_plan.add("i2s", plat.clock_plan.freq())
+    top = Module()
+    top.submodules.display = Display(plat, "PMOD1A")
+    top.submodules.chaser = Chaser(plat, "PMOD2")
+    top.submodules.tone = ToneGenerator(plat, "PMOD1B")
+    # as fast as the serial port goes at 12 MHz, to keep the bench short
+    top.submodules.regbus = RegisterBus(plat, {
+        "display": top.display, "chaser": top.chaser, "tone": top.tone},
+        baudrate=3000000)
+    regmap = top.regbus.describe()
+    serial = plat.lookup_request("serial")
+    disp = plat.lookup_request("led7seg", 0)
+    leds = plat.lookup_request("led8", 0)
+    pins = plat.lookup_request("i2s2", 0)
+
+    first = Batch(regmap["registers"])
+    first.write("chaser_rate_divisor", 50)
+    first.write("display_refresh_divisor", 40)
+    first.write("display_value", 0x3c)
+    moving = first.read("chaser_leds")
+    second = Batch(regmap["registers"])
+    second.write("chaser_enable", 0)
+    second.write("chaser_pattern", 0xa5)
+    second.write("tone_mute", 1)
+    stopped = second.read("chaser_leds")
+    played = second.read("tone_samples")
+
+    bit = int(plat.clock_plan.freq() / regmap["baudrate"])
+    later = 2500
+    trace = simulate(top, 1536 * 5, plan=plat.clock_plan, record={
+            "tx": serial.tx, "num": disp.num, "sel": disp.sel,
+            "value": top.display.value.storage,
+            "enable": top.chaser.enable.storage,
+            "pattern": top.chaser.pattern.storage,
+            "mute": top.tone.mute.storage,
+            "sclk": pins.sclk, "lrclk": pins.lrclk, "sdo": pins.sdo,
+            "left": top.tone.i2s.sink.left, "valid": top.tone.i2s.sink.valid,
+            "ready": top.tone.i2s.sink.ready,
+            **{f"led{i}": getattr(leds, f"led{i}") for i in range(8)},
+        }, drive={serial.rx: uart_drive(first.commands(), bit, start=20) +
+                             uart_drive(second.commands(), bit, start=later)[1:]})
+    data = uart_bytes(trace["tx"], bit)
+    check(len(data) == first.size() + second.size(),
+          f"{len(data)} bytes came back, not {first.size() + second.size()}")
+    first.done(data[:first.size()])
+    second.done(data[first.size():])
+
+    # led0 is the left hand LED, the top bit
+    pads = sum(trace[f"led{i}"].astype(np.int64) << (7 - i) for i in range(8))
+    loaded = np.flatnonzero(trace["value"] == 0x3c)
+    check(len(loaded) > 0, "the display's value was never written")
+    off = np.flatnonzero(trace["enable"] == 0)
+    check(len(off) > 0, "the chaser was never stopped")
+    running = pads[loaded[0]:off[0]]
+    intervals(running, 50, "the chaser")
+    check(all(bin(v).count("1") == 3 for v in running),
+          "the chaser doesn't always have 3 LEDs lit")
+    check(bin(moving.value).count("1") == 3,
+          f"chaser_leds read back as {moving.value:#04x} while it was moving")
+    shown = np.flatnonzero(trace["pattern"] == 0xa5)
+    check(len(shown) > 0, "the pattern was never written")
+    # until the pattern is written they show the one it was reset to
+    compare("the stopped LEDs", pads[off[0]:shown[0]], 0)
+    compare("the pattern", pads[shown[0] + 1:], 0xa5)
+    check(stopped.value == 0xa5,
+          f"chaser_leds read back as {stopped.value:#04x}, not 0xa5")
+
+    intervals(trace["sel"][loaded[0]:], 40, "the display's select line")
+    glyphs = set(trace["num"][loaded[0] + 40:].tolist())
+    check(glyphs == {int(models.GLYPHS[0x3]), int(models.GLYPHS[0xc])},
+          f"the display shows {sorted(glyphs)}, not 3 and c")
+
+    # the I2S module's FIFO holds 8 frames, more than the bench waits
+    # for, so the mute is checked where the samples go into it
+    frames = i2s_frames(trace)
+    check(any(f != (0, 0) for f in frames), "the tone was silent")
+    check(played.value > 0, "tone_samples says no samples were played")
+    taken = (trace["valid"] & trace["ready"]).astype(bool)
+    muted = np.flatnonzero(trace["mute"] == 1)
+    check(len(muted) > 0, "the tone was never muted")
+    before = trace["left"][:muted[0]][taken[:muted[0]]]
+    after = trace["left"][muted[0] + 1:][taken[muted[0] + 1:]]
+    check(np.any(before != 0), "the tone was silent before the mute")
+    check(len(after) > 0, "no samples went to the I2S2 after the mute")
+    compare("the samples after the mute", after, 0)
+
+
+def _pcm_stream(depth, block):
+    """
+        A PCMStream at 12 MHz with the I2S2 on the same clock and the
+        serial port as fast as it will go, for the streaming benches.
+    """
+    from pmod.pcm_stream import PCMStream
+    plat = platform()
+    plat.clock_plan.add("i2s", plat.clock_plan.freq())
+    top = PCMStream(plat, "PMOD1B", baudrate=3000000, depth=depth,
+                    block=block)
+    pins = plat.lookup_request("i2s2", 0)
+    record = {"sclk": pins.sclk, "lrclk": pins.lrclk, "sdo": pins.sdo}
+    return top, plat, record
+
+
+@bench
+def pcm_stream():
+    """
+        The host streamer (tools/pcmstream.py) plays some frames through
+        PCMStream over a stand-in serial port. They all come out of the
+        I2S2 in order, the credits keep the FIFO from overflowing and the
+        host keeps it from running dry, so both counters stay at 0.
+    """
+    from sim.serial import SerialStandIn, converse
+    from tools.pcmstream import Streamer, blocks, quantize
+    top, plat, record = _pcm_stream(depth=8, block=2)
+    bit = int(plat.clock_plan.freq() / top.baudrate)
+    frames = quantize(0.9 * np.sin(np.arange(1, 13)[:, None] * [0.7, 1.3]),
+                      rng=np.random.default_rng(1))
+    streamer = Streamer(blocks(frames, top.block), top.depth // top.block)
+    port = SerialStandIn()
+    # a credit comes back as a frame leaves the FIFO, there are still the
+    # frames in the I2S2's clock crossing to play when the last one does
+    drain = []
+
+    def host(port):
+        streamer.step(port)
+        if streamer.done:
+            drain.append(1)
+        return len(drain) * 10 * bit > 1536 * 10
+
+    trace = converse(top, plat.lookup_request("serial"), port, host,
+                     1536 * 28, bit, plan=plat.clock_plan, record=record)
+    check(streamer.done, f"the stream didn't finish, {streamer.played} of "
+          f"{len(streamer.packets)} blocks played")
+    played = i2s_frames(trace)
+    while played and played[0] == (0, 0):
+        played.pop(0)
+    # each 16 bit sample goes out as the top of a 24 bit word
+    sent = [(int(l) << 8, int(r) << 8) for l, r in frames]
+    check(played[:len(sent)] == sent,
+          f"sent {sent[:4]}..., played {played[:4]}...")
+    counted = streamer.counted()
+    check(counted == (0, 0, 0), f"the counters moved: {counted}")
+
+
+@bench
+def pcm_counters():
+    """
+        A host that doesn't wait for credits: it sends more frames than
+        the FIFO (and the I2S2's clock crossing) can hold, which counts
+        the ones that didn't fit as overruns, and then nothing, so the
+        I2S2 runs dry and counts underruns until END.
+    """
+    from sim.serial import SerialStandIn, converse
+    from tools.pcmstream import Streamer, blocks
+    top, plat, record = _pcm_stream(depth=4, block=2)
+    bit = int(plat.clock_plan.freq() / top.baudrate)
+    frames = np.arange(1, 25).repeat(2).reshape(-1, 2)
+    port = SerialStandIn()
+    # a Streamer with nothing to send ends the stream and reads the
+    # counters, once the I2S2 has had time to run dry
+    streamer = Streamer([], 0)
+    polls = []
+
+    def host(port):
+        polls.append(1)
+        if len(polls) == 1:
+            port.write(b"".join(blocks(frames, top.block)))
+        elif len(polls) * 10 * bit > 1536 * 20:
+            streamer.step(port)
+        return streamer.done
+
+    trace = converse(top, plat.lookup_request("serial"), port, host,
+                     1536 * 23, bit, plan=plat.clock_plan, record=record)
+    check(streamer.done, "the status didn't come back")
+    status = streamer.statuses[-1]
+    played = [l >> 8 for l, r in i2s_frames(trace) if l]
+    # the ones that fit are played in order, whatever was dropped
+    unique = sorted(set(played))
+    check(played == sorted(played) and unique[0] == 1,
+          f"played {unique}, out of order")
+    check(status.overruns == len(frames) - len(unique),
+          f"{len(frames)} sent, {len(unique)} played, "
+          f"{status.overruns} overruns")
+    repeats = len(played) - len(unique)
+    check(status.underruns >= repeats > 0,
+          f"{repeats} frames repeated, {status.underruns} underruns")
+
+
+@bench
+def sample_player():
+    """
+        A SamplePlayer, with block RAM for its SPRAM, loaded with random
+        samples through its write port. It plays a looping region, cuts
+        to a one shot one at one and a half times the speed with a short
+        crossfade, plays a region at half speed and then fades out to
+        silence, all of which comes out the same as the model's.
+    """
+    from cores.sampler import SampleMemory, SamplePlayer
+    words = np.random.default_rng(25).integers(-2**15, 2**15, 64)
+    top = Module()
+    top.submodules.memory = SampleMemory(len(words), spram=False)
+    top.submodules.player = player = SamplePlayer(top.memory)
+
+    # the writes, then a sample every 16 clocks with the regions
+    # starting half way between them
+    period = 16
+    first = 20 + 10 * len(words) // 2
+    unsigned = words & 0xffff
+    drive = {player.write: [], player.address: [], player.data: [],
+             player.ce: [], player.play: []}
+    for n in range(len(words) // 2):
+        drive[player.write] += [(10 + 10 * n, 1), (11 + 10 * n, 0)]
+        drive[player.address].append((10 + 10 * n, 2 * n))
+        drive[player.data].append((10 + 10 * n,
+            int(unsigned[2 * n]) | int(unsigned[2 * n + 1]) << 16))
+    samples = 72
+    for n in range(samples):
+        drive[player.ce] += [(first + period * n, 1), (first + period * n + 1, 0)]
+    plays = [(0, 0, 10, 1, 0x10000, 0),
+             (15, 20, 7, 0, 0x18000, 8192),
+             (30, 40, 12, 1, 0x8000, 0),
+             (55, 0, 0, 0, 0x10000, 4096)]
+    for field in ("start", "length", "loop", "increment", "fade"):
+        drive[getattr(player, field)] = []
+    for sample, start, length, loop, increment, fade in plays:
+        cycle = first + period * sample - period // 2
+        for field, value in zip(("start", "length", "loop", "increment", "fade"),
+                                (start, length, loop, increment, fade)):
+            drive[getattr(player, field)].append((cycle, value))
+        drive[player.play] += [(cycle, 1), (cycle + 1, 0)]
+
+    trace = simulate(top, first + period * samples + 10,
+                     record={"value": player.value, "valid": player.valid},
+                     drive=drive)
+    played = trace["value"][trace["valid"] == 1]
+    check(len(played) == samples, f"{len(played)} samples, not {samples}")
+    compare("the samples", played, models.sampler(words, plays, samples))
+
+
+class _Flash(Module):
+    """
+        The flash end of the SPI bus on 'pads' for the sampler bench:
+        after a READ command and its address it sends the bytes of
+        'data' from 'offset' on, MSB first, changing MISO when the clock
+        goes low. Anything else it is sent is ignored. It samples the
+        pins on sys, so the SPI clock has to be a quarter of that or
+        slower.
+    """
+    def __init__(self, pads, data, offset):
+        mem = Memory(8, len(data), init=list(data))
+        port = mem.get_port(async_read=True)
+        self.specials += mem, port
+        clk = Signal()
+        command = Signal(32)
+        bits = Signal(6)
+        index = Signal(max=len(data) + 1)
+        shift = Signal(8)
+        count = Signal(3)
+        reading = Signal()
+        rising = pads.clk & ~clk
+        falling = ~pads.clk & clk
+        self.comb += [
+            port.adr.eq(index),
+            reading.eq((bits == 32) & (command[24:] == 0x03)),
+            pads.miso.eq(shift[7]),
+        ]
+        self.sync += [
+            clk.eq(pads.clk),
+            If(pads.cs_n,
+                bits.eq(0),
+                count.eq(0)
+            ).Elif(rising & (bits != 32),
+                command.eq(Cat(pads.mosi, command[:31])),
+                bits.eq(bits + 1),
+                If(bits == 31,
+                    index.eq(Cat(pads.mosi, command[:23]) - offset)
+                )
+            ).Elif(falling & reading,
+                If(count == 0,
+                    shift.eq(port.dat_r),
+                    index.eq(index + 1)
+                ).Else(
+                    shift.eq(shift << 1)
+                ),
+                count.eq(count + 1)
+            ),
+        ]
+
+
+@bench
+def sampler():
+    """
+        The Sampler (pmod/sampler.py) with a small memory, loaded from a
+        model of the flash when it starts. Then one batch over the
+        register bus writes new samples over the second half of it with
+        a fixed burst (tools/sampler.py's way) and plays a looping region
+        across the two halves at twice the speed. What goes to the I2S2
+        is the region over and over, and it says it is playing and done
+        loading.
+    """
+    from pmod.sampler import Sampler
+    from cores.regbus import RegisterBus
+    from tools.sampler import words as packed, play
+    plat = platform()
+    # the I2S2 eight times as fast, for a sample every 192 clocks
+    plat.clock_plan.add("i2s", 8 * plat.clock_plan.freq())
+    rng = np.random.default_rng(9)
+    size = 16
+    flashed = rng.integers(1, 2**15, size).astype(np.int16)
+    loaded = -rng.integers(1, 2**15, size // 2).astype(np.int16)
+    offset = 0x100000
+    pads = Record([("cs_n", 1), ("clk", 1), ("mosi", 1), ("miso", 1)])
+    top = Module()
+    top.submodules.sampler = Sampler(plat, "PMOD1B", words=size,
+        flash_offset=offset, flash_pads=pads, spram=False)
+    top.submodules.flash = _Flash(pads, flashed.astype("<i2").tobytes(),
+                                  offset)
+    top.submodules.regbus = RegisterBus(plat, {"sampler": top.sampler},
+                                        baudrate=3000000)
+    regmap = top.regbus.describe()
+    serial = plat.lookup_request("serial")
+
+    batch = Batch(regmap["registers"])
+    batch.write("sampler_address", size // 2)
+    batch.stream("sampler_data", packed(loaded))
+    region = {"start": 4, "length": 8}
+    play(batch, region, loop=True, step=0x20000)
+    playing = batch.read("sampler_playing")
+    loading = batch.read("sampler_loading")
+
+    bit = int(plat.clock_plan.freq() / regmap["baudrate"])
+    # after the flash, which is 4 clocks a bit
+    start = 4 * 8 * 2 * size + 200
+    sent = len(batch.commands()) * 10 * bit
+    sink = top.sampler.i2s.sink
+    trace = simulate(top, start + sent + 192 * 12, plan=plat.clock_plan,
+        record={
+            "tx": serial.tx, "left": sink.left, "right": sink.right,
+            "taken": sink.valid & sink.ready,
+            "loading": top.sampler.loading.status,
+        }, drive={serial.rx: uart_drive(batch.commands(), bit, start=start)})
+    data = uart_bytes(trace["tx"], bit)
+    check(len(data) == batch.size(),
+          f"{len(data)} bytes came back, not {batch.size()}")
+    batch.done(data)
+    done = np.flatnonzero(trace["loading"] == 0)
+    check(len(done) > 0 and done[0] < start,
+          "the samples weren't in from the flash before the batch")
+    check(playing.value == 1 and loading.value == 0,
+          f"playing read back as {playing.value}, loading as {loading.value}")
+
+    memory = np.concatenate((flashed[:size // 2], loaded))
+    taken = trace["taken"] == 1
+    # the sink's samples are 16 bits, unsigned in the trace
+    left = (trace["left"][taken] ^ 0x8000) - 0x8000
+    compare("the right channel", trace["right"][taken], trace["left"][taken])
+    # it is silent until the region starts
+    heard = np.flatnonzero(left)
+    check(len(heard) > 0, "the region was never played")
+    played = left[heard[0]:]
+    check(len(played) >= 8, f"only {len(played)} samples of the region "
+          f"were played")
+    expected = models.sampler(memory, [(0, region["start"], region["length"],
+                                        1, 0x20000, 0)], len(played))
+    compare("the samples", played, expected)
@@ -0,0 +1,226 @@
+#
+# vim: expandtab:ts=4:
+#
+# Reference models of the examples, written with numpy.
+#
+# A bench used to check a trace by stepping through it in a python loop,
+# working out what the design should do next and comparing one clock at a
+# time. That is fine for a few thousand clocks but once Verilator can
+# simulate millions of them (see sim/verilator.py) the loop takes longer
+# than the simulation does.
+#
+# So each model here works out what the design does for a whole trace in
+# one go, as arrays with a row for every clock, and the bench compares the
+# lot at once (sim.benches.compare()). The models are written from what
+# the designs are meant to do rather than from their code, so that a bench
+# is a check of the design and not of itself.
+#
+# The rows line up with sim.simulate()'s: row k is the state after clock
+# k + 1. A Timebase strobe for 'divisor' is high on the clocks where
+# (clock + 1) is a multiple of it (all of its prescalers start at 0), so
+# by row k there have been (k + 1) // divisor of them. strobes() counts
+# them and most of the models take those counts, rather than clocks, as
+# their input.
+#
+import math
+
+import numpy as np
+
+#
+# The segments (abcdefg, a is the top bit) lit for the digits 0 to 9 and
+# the letters A to F. The PMOD's segments are active low.
+#
+SEGMENTS = np.array([
+    0x7e, 0x30, 0x6d, 0x79, 0x33, 0x5b, 0x5f, 0x70,
+    0x7f, 0x73, 0x77, 0x1f, 0x4e, 0x3d, 0x4f, 0x47,
+])
+GLYPHS = ~SEGMENTS & 0x7f
+BLANK = 0x7f
+
+
+def strobes(cycles, divisor):
+    """
+        The number of strobes a Timebase has made for 'divisor' by each
+        of the first 'cycles' rows of a trace.
+    """
+    return (np.arange(cycles, dtype=np.int64) + 1) // divisor
+
+
+def toggle(count):
+    """
+        A register that starts at 0 and flips on every strobe, given the
+        number of strobes so far.
+    """
+    return count & 1
+
+
+def seven_segment(value, refresh):
+    """
+        What SevenSegmentLedDisplay puts on the PMOD ("num", "sel") for
+        the 8 bit 'value' on each row, 'refresh' being the number of
+        refresh strobes so far. The digit shown flips on every strobe
+        (the top nibble first) and the select line follows it a strobe
+        later, so it is low while the top nibble is shown.
+    """
+    value = np.asarray(value)
+    shown = toggle(refresh)
+    sel = np.where(refresh > 0, toggle(refresh - 1), 0)
+    num = GLYPHS[np.where(shown == 1, value >> 4, value & 0xf)]
+    return num, sel
+
+
+def multi_seven_segment(value, scan, pmods):
+    """
+        What MultiSevenSegmentLedDisplay puts on 'pmods' displays, a list
+        of "num" arrays (one for each PMOD) and the select line they all
+        share, 'scan' being the number of scan strobes so far. The scan
+        shows the right hand digit of the first PMOD, then its left hand
+        one, then moves on to the next PMOD.
+    """
+    value = np.asarray(value)
+    half = toggle(scan)
+    pmod = (scan // 2) % pmods
+    digit = 2 * (pmods - 1 - pmod) + half
+    glyph = GLYPHS[(value >> (4 * digit)) & 0xf]
+    nums = [np.where(pmod == p, glyph, BLANK) for p in range(pmods)]
+    return nums, 1 - half
+
+
+def bcd(n, digits):
+    """
+        'n' (an array of whole numbers) in binary coded decimal, one
+        digit a nibble, wrapping round after 'digits' digits.
+    """
+    n = np.asarray(n, dtype=np.int64) % 10**digits
+    value = np.zeros_like(n)
+    for d in range(digits):
+        value |= ((n // 10**d) % 10) << (4 * d)
+    return value
+
+
+def cylon(ticks, button, start=0x7, width=16, turn=13):
+    """
+        The Cylon's LEDs on each row, 'ticks' being the number of steps so
+        far and 'button' the button on each row. Every step rotates the
+        pattern one LED (left to begin with) and every 'turn' steps it
+        changes direction, unless the button was down on the clock of
+        that step.
+    """
+    ticks = np.asarray(ticks)
+    button = np.asarray(button)
+    # the row each step shows up on, the button is read the clock before
+    rows = np.flatnonzero(np.diff(ticks)) + 1
+    step = np.arange(1, len(rows) + 1)
+    flip = (step % turn == 0) & (button[rows - 1] == 0)
+    # a step goes the way the flips before it left the direction
+    direction = (np.cumsum(flip) - flip) & 1
+    position = np.concatenate(([0], np.cumsum(1 - 2 * direction))) % width
+    mask = (1 << width) - 1
+    patterns = ((start << position) | (start >> (width - position))) & mask
+    return patterns[ticks]
+
+
+def sine_table(depth=256, width=24):
+    """
+        A whole cycle of the sine that SineROM stores a quarter of, as
+        signed 'width' bit samples. The rest of the cycle is the first
+        quarter mirrored, the same way SineROM reads it back.
+    """
+    peak = 2**(width - 1) - 1
+    quarter = depth // 4
+    first = np.array([int(peak * math.sin(2.0 * math.pi * i / depth))
+                      for i in range(quarter + 1)], dtype=np.int64)
+    half = np.concatenate((first, first[quarter - 1:0:-1]))
+    return np.concatenate((half, -half))
+
+
+def dds(tuning_word, samples, acc_bits=32, depth=256, width=24, offsets=(0,),
+        dither=False):
+    """
+        The first 'samples' samples of a DDS running at 'tuning_word',
+        a list with one array for each of 'offsets'. The phase goes up
+        by the tuning word before each sample.
+
+        With dither the noise added to the phase is less than one table
+        step, so a sample is either the table entry the phase points at
+        or the next one. Each output is then a pair of arrays, the two
+        samples the design can produce, otherwise it is exact.
+    """
+    table = sine_table(depth, width)
+    shift = acc_bits - int(math.log2(depth))
+    phase = (np.arange(1, samples + 1, dtype=np.uint64) *
+             np.uint64(tuning_word)) % np.uint64(2**acc_bits)
+    outputs = []
+    for offset in offsets:
+        word = np.uint64(int(round(offset * 2**acc_bits)) % 2**acc_bits)
+        index = ((phase + word) % np.uint64(2**acc_bits)) >> np.uint64(shift)
+        index = index.astype(np.int64)
+        if dither:
+            outputs.append((table[index], table[(index + 1) % depth]))
+        else:
+            outputs.append(table[index])
+    return outputs
+
+
+def _voice(memory, start, length, loop, increment, k):
+    """
+        The samples a SamplePlayer voice playing a region plays, 'k'
+        (an array) samples after it started, 0 once it has stopped.
+
+        Its offset goes up by 'increment' a sample. A looped one takes
+        the region's length off each time it gets past the end, which
+        keeps it inside if the increment is no more than the length
+        (so it is a remainder) and otherwise takes the length off every
+        time. A one shot region stops at the first step past its end.
+    """
+    end = length << 16
+    if not loop:
+        offset = k * increment
+        playing = offset < end
+    elif increment <= end:
+        offset = k * increment % max(end, 1)
+        playing = np.full(len(k), end != 0)
+    else:
+        offset = k * (increment - end)
+        playing = np.full(len(k), end != 0)
+    values = memory[(start + (offset >> 16)) % len(memory)]
+    return np.where(playing, values, 0)
+
+
+def sampler(memory, plays, samples):
+    """
+        The first 'samples' samples from a SamplePlayer with 'memory'
+        (its 16 bit words, signed) in it. 'plays' is a list of (sample,
+        start, length, loop, increment, fade), each region starting just
+        before sample number 'sample'.
+
+        It has two voices and a new region goes on the one that isn't
+        the current one, the output being the current voice crossfaded
+        in over the other one. A voice steps through its region by
+        'increment' (16.16 fixed point) a sample.
+
+        Between one region starting and the next everything is a
+        function of how many samples it has been, so only the regions
+        are a python loop.
+    """
+    memory = np.asarray(memory, dtype=np.int64)
+    out = np.zeros(samples, dtype=np.int64)
+    plays = sorted((p for p in plays if p[0] < samples), key=lambda p: p[0])
+    for i, (first, start, length, loop, increment, fade) in enumerate(plays):
+        last = plays[i + 1][0] if i + 1 < len(plays) else samples
+        n = np.arange(first, last, dtype=np.int64)
+        new = _voice(memory, start, length, loop, increment, n - first)
+        if i > 0:
+            before = plays[i - 1]
+            old = _voice(memory, *before[1:5], n - before[0])
+        else:
+            old = np.zeros(len(n), dtype=np.int64)
+        #
+        # The new region's gain goes up by 'fade' a sample until it
+        # would get to 32767, which is where the crossfade is over.
+        #
+        gain = (n - first) * fade
+        fading = (fade != 0) & (gain < 32767)
+        value = np.where(fading, old + (((new - old) >> 1) * gain >> 14), new)
+        out[first:last] = (value + 2**15) % 2**16 - 2**15
+    return out
@@ -0,0 +1,114 @@
+#
+# vim: expandtab:ts=4:
+#
+# A stand-in serial port whose other end is a simulated design.
+#
+# simulate() (see sim/__init__.py) works out every input before the
+# simulation starts, which is fine for a batch of register commands but
+# not for a host that has to hear back from the design before it can go
+# on, like the audio streamer (tools/pcmstream.py) waiting for credits.
+#
+#    port = SerialStandIn()
+#    trace = converse(top, serial, port, streamer.step, cycles, bit, ...)
+#
+# runs 'top' in Migen's simulator with 'port' wired to its serial pins:
+# what the host writes to the port goes to the design's rx a bit at a
+# time, what the design sends on tx is read back into the port, and every
+# 'poll' clocks the host function is called with the port. The port has
+# the write(), read() and in_waiting of a pyserial port, so the host code
+# is the same code that talks to the board. The simulation stops when the
+# host returns something true or after 'cycles' clocks.
+#
+# It needs the testbench to run during the simulation, so it is Migen
+# only, there is no Verilator version.
+#
+from collections import deque
+
+import numpy as np
+
+from migen.sim.core import Simulator
+
+from sim import clocks, _overrides, _record
+
+
+class SerialStandIn:
+    """
+        The host's end of the simulated serial line. Nothing blocks: a
+        read returns whatever has come back so far.
+    """
+    def __init__(self):
+        self.to_design = deque()
+        self.from_design = bytearray()
+        self.written = 0
+
+    def write(self, data):
+        self.to_design.extend(data)
+        self.written += len(data)
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self.from_design)
+
+    def read(self, size=1):
+        data = bytes(self.from_design[:size])
+        del self.from_design[:size]
+        return data
+
+
+def converse(top, pads, port, host, cycles, clocks_per_bit, plan=None,
+             poll=None, record=(), domain="sys"):
+    """
+        Simulates 'top' with 'port' (a SerialStandIn) on 'pads' (rx and
+        tx, 'clocks_per_bit' clocks a bit) and calls 'host(port)' every
+        'poll' clocks (by default a byte time) until it returns
+        something true or 'cycles' clocks have gone by. Returns the
+        signals in 'record' on each clock, as simulate() does.
+    """
+    record = _record(record)
+    names = list(record)
+    signals = [record[n] for n in names]
+    poll = poll or 10 * clocks_per_bit
+    rows = []
+
+    def bench():
+        yield pads.rx.eq(1)
+        bits = []           # the bits still to go out on rx
+        sending = 0         # clocks left of the bit on rx
+        receiving = None    # clocks since the start bit on tx
+        received = 0
+        for cycle in range(cycles):
+            if sending == 0 and not bits and port.to_design:
+                byte = port.to_design.popleft()
+                bits = [0] + [(byte >> i) & 1 for i in range(8)] + [1]
+            if sending == 0 and bits:
+                yield pads.rx.eq(bits.pop(0))
+                sending = clocks_per_bit
+            if sending:
+                sending -= 1
+            yield
+            rows.append((yield signals))
+
+            tx = yield pads.tx
+            if receiving is None:
+                if tx == 0:
+                    receiving = 0
+                    received = 0
+            else:
+                receiving += 1
+                middle, bit = divmod(receiving - clocks_per_bit // 2,
+                                     clocks_per_bit)
+                if bit == 0 and 1 <= middle <= 8:
+                    received |= tx << (middle - 1)
+                elif bit == 0 and middle == 9:
+                    port.from_design.append(received)
+                    receiving = None
+            if cycle % poll == poll - 1 and host(port):
+                break
+
+    fragment = top.get_fragment()
+    with Simulator(fragment, {domain: bench()}, clocks=clocks(fragment, plan),
+                   special_overrides=_overrides) as s:
+        s.run()
+    values = np.array(rows, dtype=np.int64).reshape(len(rows), len(names))
+    return {n: values[:, i] for i, n in enumerate(names)}
@@ -0,0 +1,116 @@
+#
+# vim: expandtab:ts=4:
+#
+# How fast are the simulation backends?
+#
+#    python3 -m sim.speed [--cycles N] [design ...]
+#
+# Simulates each design (tone, the biggest, by default) for N clocks with
+# each backend and prints the clocks per second. Verilator is run once
+# first so that verilating and compiling the design isn't counted, that
+# time is printed on its own. It also checks that the two backends
+# recorded exactly the same thing, which is a good test of the Verilator
+# backend.
+#
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from sim import load, simulate, verilator
+
+
+def _tone():
+    m = load("05_tone/simple_tone.py", scale=256)
+    plat = m.icebreaker
+    top = m.Tone(16)
+    return top, plat.clock_plan, "i2s", {
+        "sclk": plat.lookup_request("pmod1_0"),
+        "lrclk": plat.lookup_request("pmod1_1"),
+        "sdo": plat.lookup_request("pmod1_2"),
+        "phase": top.dds.phase,
+    }
+
+
+def _blink():
+    m = load("01_blink/blink.py", scale=10000)
+    plat = m.icebreaker
+    top = m.Blink(3)
+    return top, plat.clock_plan, "sys", {
+        "red": plat.lookup_request("user_led_red"),
+    }
+
+
+def _counter_two():
+    m = load("04_display_two/display_two.py", scale=12000)
+    plat = m.icebreaker
+    top = m.Counter(4)
+    disp = plat.lookup_request("led7seg", 0)
+    return top, plat.clock_plan, "sys", {
+        "num": disp.num, "sel": disp.sel,
+    }
+
+#
+# name -> function that makes (top, plan, domain, record)
+#
+DESIGNS = {
+    "blink": _blink,
+    "counter_two": _counter_two,
+    "tone": _tone,
+}
+
+
+def measure(design, backend, cycles):
+    """
+        Simulates 'design' for 'cycles' clocks with 'backend', returns
+        the trace and how long it took.
+    """
+    top, plan, domain, record = DESIGNS[design]()
+    start = time.time()
+    trace = simulate(top, cycles, record=record, plan=plan, domain=domain,
+                     backend=backend)
+    return trace, time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m sim.speed",
+        description="Compare the speed of the simulation backends")
+    parser.add_argument("--cycles", type=int, default=20000,
+                        help="clocks to simulate (default 20000)")
+    parser.add_argument("designs", nargs="*", metavar="design",
+                        help=f"designs to simulate ({', '.join(DESIGNS)})")
+    args = parser.parse_args(argv)
+    designs = args.designs or ["tone"]
+    unknown = [d for d in designs if d not in DESIGNS]
+    if unknown:
+        parser.error(f"no design called {', '.join(unknown)}")
+    if not verilator.available():
+        print("verilator isn't installed, only timing the Migen simulator")
+
+    print(f"{'design':14s} {'backend':10s} {'clocks':>9s} {'build s':>8s} "
+          f"{'run s':>8s} {'clocks/s':>11s}")
+    mismatched = 0
+    for design in designs:
+        traces = {}
+        for backend in ("migen", "verilator"):
+            build = ""
+            if backend == "verilator":
+                if not verilator.available():
+                    continue
+                _, seconds = measure(design, backend, 1)
+                build = f"{seconds:.1f}"
+            traces[backend], seconds = measure(design, backend, args.cycles)
+            print(f"{design:14s} {backend:10s} {args.cycles:9d} {build:>8s} "
+                  f"{seconds:8.2f} {args.cycles / seconds:11.0f}", flush=True)
+        if len(traces) == 2:
+            differ = [n for n in traces["migen"]
+                      if not np.array_equal(traces["migen"][n], traces["verilator"][n])]
+            if differ:
+                mismatched += 1
+                print(f"{design}: the backends disagree about {', '.join(differ)}")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#
+# vim: expandtab:ts=4:
+#
+# A Verilator backend for sim.simulate().
+#
+# Migen's simulator runs the design in python, a few thousand clocks a
+# second for something the size of the tone example. That's fine for
+# checking a couple of I2S frames but a few seconds of audio at 50 MHz is
+# hundreds of millions of clocks. Verilator turns Verilog into C++ that
+# runs the same thing at millions of clocks a second.
+#
+# The design is turned into Verilog the same way the build does it
+# (Migen's verilog.convert()), with the same stand ins for the PLL and
+# the reset synchronizers as the Migen simulation. Anything that is
+# recorded becomes an output port, anything that is driven an input, and
+# a small C++ main() is generated that
+#
+#    - toggles the clocks with the same periods (and phases) the Migen
+#      simulator would use,
+#    - applies the input changes from a schedule file on the clocks they
+#      are for, and
+#    - writes the recorded outputs, one row of 64 bit values per clock,
+#      to a file that numpy reads straight back in.
+#
+# The schedule and the number of clocks are read when it runs, so the
+# same binary is used however a testbench drives it. Verilating and
+# compiling take a while so the binary is kept in the build cache (see
+# tools/buildcache.py) under a hash of the Verilog and the C++, and a
+# second run of the same design goes straight to running it.
+#
+# The rows line up with the Migen backend's: row n is what the signals
+# were after the clock that followed the changes for cycle n.
+#
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from migen import *
+from migen.fhdl.tools import lower_specials, list_targets
+from migen.fhdl.verilog import convert
+
+from tools.buildcache import cache_dir
+
+
+def available():
+    """
+        True if Verilator is installed.
+    """
+    return shutil.which("verilator") is not None
+
+
+_main = """\
+// Generated by sim/verilator.py
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+#include "verilated.h"
+#include "Vtop.h"
+
+struct Change {
+    uint64_t cycle;
+    uint64_t input;
+    uint64_t value;
+};
+
+static void set_input(Vtop *top, uint64_t input, uint64_t value)
+{
+    switch (input) {
+%(set_inputs)s
+    }
+}
+
+static void record(Vtop *top, uint64_t *row)
+{
+%(record)s
+}
+
+int main(int argc, char **argv)
+{
+    if (argc != 4) {
+        fprintf(stderr, "usage: %%s cycles schedule trace\\n", argv[0]);
+        return 2;
+    }
+    uint64_t cycles = strtoull(argv[1], NULL, 10);
+
+    std::vector<Change> changes;
+    FILE *in = fopen(argv[2], "rb");
+    if (in == NULL) {
+        perror(argv[2]);
+        return 1;
+    }
+    Change c;
+    while (fread(&c, sizeof(c), 1, in) == 1)
+        changes.push_back(c);
+    fclose(in);
+
+    FILE *out = fopen(argv[3], "wb");
+    if (out == NULL) {
+        perror(argv[3]);
+        return 1;
+    }
+
+    Vtop *top = new Vtop;
+%(reset_inputs)s
+    // clocks: half period and time left before the next transition
+    const int nclocks = %(nclocks)d;
+    uint64_t half[nclocks] = {%(half)s};
+    uint64_t left[nclocks] = {%(half)s};
+    bool high[nclocks] = {false};
+    top->eval();
+
+    uint64_t row[%(nrecord)d + 1];
+    uint64_t edge = 0;
+    size_t next = 0;
+    while (true) {
+        uint64_t dt = left[0];
+        for (int i = 1; i < nclocks; i++)
+            if (left[i] < dt)
+                dt = left[i];
+        bool rising = false;
+        for (int i = 0; i < nclocks; i++) {
+            left[i] -= dt;
+            if (left[i] == 0) {
+                high[i] = !high[i];
+                left[i] = half[i];
+                if (i == %(sample)d && high[i])
+                    rising = true;
+            }
+        }
+        if (rising) {
+            // what it was before this clock is the row for the last one
+            edge++;
+            if (edge >= 2) {
+                record(top, row);
+                fwrite(row, sizeof(uint64_t), %(nrecord)d, out);
+                if (edge > cycles)
+                    break;
+            }
+        }
+%(set_clocks)s
+        top->eval();
+        if (rising) {
+            while (next < changes.size() && changes[next].cycle < edge - 1)
+                next++;
+            bool changed = false;
+            while (next < changes.size() && changes[next].cycle == edge - 1) {
+                set_input(top, changes[next].input, changes[next].value);
+                changed = true;
+                next++;
+            }
+            if (changed)
+                top->eval();
+        }
+    }
+    fclose(out);
+    top->final();
+    delete top;
+    return 0;
+}
+"""
+
+
+def _build(source, data_files, main):
+    """
+        Verilates and compiles 'source' (and its memory init files) with
+        'main', or finds the result of doing that before in the cache.
+        Returns the directory the binary (Vsim) is in.
+    """
+    version = subprocess.run(["verilator", "--version"], stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout
+    key = hashlib.sha256()
+    for part in (version, source, main, *sorted(data_files.items())):
+        key.update(repr(part).encode())
+    directory = os.path.join(cache_dir(), "verilator", key.hexdigest()[:32])
+    if os.path.exists(os.path.join(directory, "Vsim")):
+        return directory
+
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    work = tempfile.mkdtemp(dir=os.path.dirname(directory))
+    with open(os.path.join(work, "top.v"), "w") as f:
+        f.write(source)
+    with open(os.path.join(work, "main.cpp"), "w") as f:
+        f.write(main)
+    for name, content in data_files.items():
+        with open(os.path.join(work, name), "w") as f:
+            f.write(content)
+    subprocess.run(["verilator", "--cc", "--exe", "--build", "-O3",
+                    "--top-module", "top", "-Wno-fatal", "-Wno-lint",
+                    "-Wno-style", "--Mdir", "obj_dir", "-o", "Vsim",
+                    "top.v", "main.cpp"],
+                   cwd=work, check=True, stdout=subprocess.DEVNULL)
+    shutil.move(os.path.join(work, "obj_dir", "Vsim"), os.path.join(work, "Vsim"))
+    shutil.rmtree(os.path.join(work, "obj_dir"))
+    try:
+        os.rename(work, directory)
+    except OSError:
+        # someone else built it at the same time
+        shutil.rmtree(work)
+    return directory
+
+
+def run(fragment, cycles, record, schedule, periods, domain, overrides):
+    """
+        Simulates 'fragment' for 'cycles' clocks of 'domain' and returns
+        an array with a row per clock and a column for each of the values
+        in 'record' (a dict of name: signal or expression). 'schedule' is
+        {cycle: [(signal, value), ...]} and 'periods' the clock periods
+        by domain, as for the Migen simulator.
+    """
+    #
+    # Anything recorded that isn't already a signal gets one to put it
+    # on a port. So does a register that doesn't reset to 0: Migen
+    # declares an output port without its initial value, so it would
+    # start at 0 rather than where the Migen simulator starts it.
+    #
+    wrapper = Module()
+    probes = []
+    for name, value in record.items():
+        if not isinstance(value, Signal) or value.reset.value != 0:
+            probe = Signal(value_bits_sign(value), name=f"probe_{name}")
+            wrapper.comb += probe.eq(value)
+            value = probe
+        if len(value) > 64:
+            raise ValueError(f"{name} is wider than 64 bits")
+        probes.append(value)
+    fragment = fragment + wrapper.get_fragment()
+
+    fragment, _ = lower_specials(overrides, fragment)
+    for name in periods:
+        if name not in [cd.name for cd in fragment.clock_domains]:
+            fragment.clock_domains.append(ClockDomain(name))
+    driven = list_targets(fragment)
+
+    clock_names = sorted(periods)
+    clks = [fragment.clock_domains[name].clk for name in clock_names]
+    resets = [cd.rst for cd in fragment.clock_domains
+              if cd.rst is not None and cd.rst not in driven]
+    inputs = []
+    for changes in schedule.values():
+        for signal, _ in changes:
+            if signal in driven:
+                raise ValueError(f"{signal} is driven by the design, "
+                                 f"only inputs can be driven")
+            if signal not in inputs:
+                inputs.append(signal)
+
+    ios = set(probes) | set(inputs) | set(resets) | \
+          {clk for clk in clks if clk not in driven}
+    output = convert(fragment, ios=ios, name="top")
+    name = output.ns.get_name
+
+    set_inputs = "\n".join(f"    case {i}: top->{name(s)} = value; break;"
+                           for i, s in enumerate(inputs))
+    record_lines = "\n".join(f"    row[{i}] = top->{name(s)};"
+                             for i, s in enumerate(probes))
+    reset_inputs = "\n".join(f"    top->{name(s)} = {s.reset.value};"
+                             for s in [*inputs, *resets])
+    set_clocks = "\n".join(f"        top->{name(clk)} = high[{i}];"
+                           for i, clk in enumerate(clks) if clk not in driven)
+    main = _main % {
+        "set_inputs": set_inputs,
+        "record": record_lines,
+        "reset_inputs": reset_inputs,
+        "set_clocks": set_clocks,
+        "nclocks": len(clks),
+        "half": ", ".join(str(periods[n] // 2) for n in clock_names),
+        "sample": clock_names.index(domain),
+        "nrecord": len(probes),
+    }
+    directory = _build(output.main_source, output.data_files, main)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        changes = sorted((cycle, inputs.index(s), v & (2**64 - 1))
+                         for cycle, pairs in schedule.items()
+                         for s, v in pairs)
+        schedule_file = os.path.join(tmp, "schedule")
+        trace_file = os.path.join(tmp, "trace")
+        np.array(changes, dtype=np.uint64).reshape(-1, 3).tofile(schedule_file)
+        subprocess.run([os.path.join(directory, "Vsim"), str(cycles),
+                        schedule_file, trace_file], cwd=directory, check=True)
+        rows = np.fromfile(trace_file, dtype=np.uint64)
+
+    rows = rows.reshape(-1, len(probes))[:cycles].astype(np.int64)
+    for i, probe in enumerate(probes):
+        width = len(probe)
+        if width < 64:
+            rows[:, i] &= (1 << width) - 1
+            if probe.signed:
+                rows[:, i] -= (rows[:, i] >> (width - 1)) << width
+    return rows
@@ -0,0 +1,5 @@
+#
+# This is the tools directory, it holds the host side helpers (build
+# cache, build orchestration, report parsing, Etc.) that the examples
+# use. None of this ends up in the FPGA.
+#
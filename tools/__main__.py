@@ -0,0 +1,227 @@
+#
+# vim: expandtab:ts=4:
+#
+# One command line for doing things with a design:
+#
+#    python3 -m tools elaborate [--stand-in] design
+#    python3 -m tools verilog [--stand-in] [-o DIR] design
+#    python3 -m tools simulate [--stand-in] [--backend B] [bench ...]
+#    python3 -m tools build design
+#    python3 -m tools flash [--no-build] design
+#    python3 -m tools watch [--stand-in] [--sim [BENCH ...]] [--build]
+#                           [--diff] design [design ...]
+#
+# where design is a script name (display_two) or directory (04_display_two).
+#
+# 'elaborate' runs the design script up to where it would build (see
+# tools/capture.py), finalizes the module and the platform, and prints the
+# module tree (what each module adds: statements, signals and their bits,
+# memory) and the clocks. It is the quick way to see that a change still
+# elaborates, and how long that takes, without going anywhere near yosys.
+# 'verilog' goes one step further and writes the Verilog (build/verilog
+# by default). 'simulate' runs the testbenches (see sim/), 'build' runs the
+# script like make does and 'flash' builds it and programs the board with
+# iceprog. 'watch' keeps doing 'elaborate' and 'verilog' (and if asked,
+# 'simulate' and 'build') as the files are edited, see tools/watch.py.
+#
+# --stand-in does all of that with the stand-in platform (tools/standin.py)
+# in place of the real one, so nothing can end up running the toolchain.
+#
+# Nothing from Migen, LiteX or the examples is imported until a command
+# needs it, so asking for --help (or a bench name) doesn't pay for them.
+#
+import argparse
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+
+def _design(name):
+    from tools.buildall import discover, select
+    design, = select(discover(), [name])
+    return design
+
+
+def _platform(args):
+    """
+        The context the design is run in, with the stand-in platform if
+        it was asked for.
+    """
+    if args.stand_in:
+        from tools.standin import stand_in
+        return stand_in()
+    return contextlib.nullcontext()
+
+
+def _finalize(captured):
+    """
+        Finalizes the captured module and its platform (as the build
+        would), returns the fragment and how long each took.
+    """
+    start = time.perf_counter()
+    fragment = captured.top.get_fragment()
+    middle = time.perf_counter()
+    captured.platform.finalize(fragment)
+    return fragment, middle - start, time.perf_counter() - middle
+
+
+def elaborate(args):
+    from tools.capture import capture
+    from tools.profiler import module_tree, count_driven
+
+    design = _design(args.design)
+    start = time.perf_counter()
+    with _platform(args):
+        captured = capture(design)
+        fragment, modules, platform = _finalize(captured)
+    tree = module_tree(captured.top)
+    count_driven(tree)
+
+    print(f"{design} ({type(captured.platform).__name__})")
+    print(f"    script          {captured.seconds:7.3f}s")
+    print(f"    modules         {modules:7.3f}s")
+    print(f"    platform        {platform:7.3f}s")
+    print()
+
+    def label(node):
+        depth = node.path.count("/")
+        return f"{'  ' * depth}{node.path.rsplit('/', 1)[-1]} ({type(node.module).__name__})"
+    nodes = list(tree.all())
+    width = max([len(label(n)) for n in nodes] + [16]) + 2
+    print(f"{'module':<{width}}{'stmts':>7}{'signals':>9}{'bits':>7}{'memory':>8}")
+    for node in nodes:
+        t = node.total()
+        print(f"{label(node):<{width}}{t['statements']:>7}{t['signals']:>9}"
+              f"{t['bits']:>7}{t['memory_bits']:>8}")
+
+    plan = getattr(captured.platform, "clock_plan", None)
+    if plan is not None:
+        print()
+        for domain in plan.domains():
+            print(f"{domain:<16}{plan.freq(domain) / 1e6:10.4f} MHz")
+    print(f"\nelaborated in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def verilog(args):
+    from tools.capture import capture
+
+    design = _design(args.design)
+    out = os.path.abspath(args.output or os.path.join(design.build_dir, "verilog"))
+    with _platform(args):
+        captured = capture(design)
+        fragment, _, _ = _finalize(captured)
+        v = captured.platform.get_verilog(fragment, name="top")
+    os.makedirs(out, exist_ok=True)
+    # the memories' init files are written to the current directory
+    cwd = os.getcwd()
+    try:
+        os.chdir(out)
+        v.write("top.v")
+    finally:
+        os.chdir(cwd)
+    print(f"wrote {os.path.join(out, 'top.v')}")
+    return 0
+
+
+def simulate(args):
+    if args.backend:
+        os.environ["ICEBREAKER_SIM"] = args.backend
+    with _platform(args):
+        from sim.__main__ import main
+        return main(args.benches)
+
+
+def build(args):
+    import runpy
+
+    design = _design(args.design)
+    cwd = os.getcwd()
+    argv = sys.argv
+    try:
+        os.chdir(design.directory)
+        sys.argv = [design.script]
+        runpy.run_path(design.script, run_name="__main__")
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+    return 0
+
+
+def flash(args):
+    design = _design(args.design)
+    if shutil.which("iceprog") is None:
+        print("iceprog isn't installed", file=sys.stderr)
+        return 1
+    if not args.no_build:
+        build(args)
+    bitstream = os.path.join(design.build_dir, "top.bin")
+    if not os.path.exists(bitstream):
+        print(f"{bitstream} hasn't been built", file=sys.stderr)
+        return 1
+    return subprocess.call(["iceprog", bitstream])
+
+
+def watch(args):
+    from tools.buildall import discover, select
+    from tools.watch import Watcher
+
+    designs = select(discover(), args.designs)
+    try:
+        return Watcher(designs, stand_in=args.stand_in, sim=args.sim,
+                       build=args.build, diff=args.diff).run()
+    except KeyboardInterrupt:
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools",
+        description="Elaborate, simulate, build or flash the examples")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(func, help, stand_in=True):
+        p = commands.add_parser(func.__name__, help=help)
+        p.set_defaults(func=func)
+        if stand_in:
+            p.add_argument("--stand-in", action="store_true",
+                           help="use the stand-in platform, which can't build")
+        return p
+
+    p = command(elaborate, "finalize a design and show its module tree")
+    p.add_argument("design", help="script name (cylon) or directory (02_cylon)")
+    p = command(verilog, "write a design's Verilog")
+    p.add_argument("-o", "--output", help="directory for the Verilog "
+                                          "(default build/verilog)")
+    p.add_argument("design", help="script name (cylon) or directory (02_cylon)")
+    p = command(simulate, "run the testbenches")
+    p.add_argument("--backend", choices=("migen", "verilator", "auto"),
+                   help="simulator (default ICEBREAKER_SIM or auto)")
+    p.add_argument("benches", nargs="*", metavar="bench",
+                   help="benches to run (default all of them)")
+    p = command(build, "build a design (what make does)", stand_in=False)
+    p.add_argument("design", help="script name (cylon) or directory (02_cylon)")
+    p = command(flash, "build a design and program the board", stand_in=False)
+    p.add_argument("--no-build", action="store_true",
+                   help="program what was built last")
+    p.add_argument("design", help="script name (cylon) or directory (02_cylon)")
+
+    p = command(watch, "re-elaborate designs whenever they are edited")
+    p.add_argument("--sim", nargs="*", metavar="BENCH",
+                   help="run these benches (all of them if none are named) "
+                        "after every change")
+    p.add_argument("--build", action="store_true",
+                   help="build a design whenever its Verilog changes")
+    p.add_argument("--diff", action="store_true",
+                   help="print the changes to the Verilog")
+    p.add_argument("designs", nargs="+", metavar="design",
+                   help="script names (cylon) or directories (02_cylon)")
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#
+# vim: expandtab:ts=4:
+#
+# Resource and fmax benchmarks for the examples.
+#
+# This builds the examples (all of them, or the ones named) through the
+# normal icestorm flow, pulls the cell counts out of the yosys report
+# and the per clock domain fmax out of the nextpnr log, and appends them
+# to a JSON history file. The compare command then looks at the last two
+# runs in the history (or the last run and an older one) and complains
+# about anything that got bigger or slower by more than a threshold, so
+# a change to SevenSegmentLedDisplay or the sine table shows what it
+# costs in LUTs and MHz before anyone flashes a board. A design that
+# doesn't build any more (which includes not meeting timing, nextpnr
+# gives up on those) goes in the history as failed, 'run' exits with 1
+# and 'compare' counts it as a regression.
+#
+# Usage (from the top of the repository):
+#
+#    python3 -m tools.bench run [-j N] [design ...]
+#    python3 -m tools.bench compare [--threshold PCT] [--against N]
+#    python3 -m tools.bench show
+#
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from tools.buildall import TOP, build_all, discover, select
+
+DEFAULT_HISTORY = os.path.join(TOP, "benchmarks", "history.json")
+
+#
+# The resources we keep track of, and the prefix of the yosys cells that
+# count towards each of them. (DFFs come in lots of flavours, SB_DFFE,
+# SB_DFFSR, SB_DFFESS, ... and the globals are SB_GB or SB_GB_IO.)
+#
+RESOURCES = {
+    "lut4": "SB_LUT4",
+    "dff": "SB_DFF",
+    "carry": "SB_CARRY",
+    "bram": "SB_RAM40_4K",
+    "global": "SB_GB",
+    "dsp": "SB_MAC16",
+    "spram": "SB_SPRAM256KA",
+}
+
+
+#
+# yosys leaves inserting the global buffers (and deciding about the
+# hard blocks) to nextpnr, so where nextpnr reports a count it wins.
+#
+PLACED = {
+    "global": "SB_GB",
+    "bram": "ICESTORM_RAM",
+    "dsp": "ICESTORM_DSP",
+    "spram": "ICESTORM_SPRAM",
+}
+
+
+def resources(cells, utilisation=None):
+    """
+        Boils the yosys cell counts (and the nextpnr utilisation, when
+        there is one) down to the RESOURCES above.
+    """
+    counts = {name: sum(n for cell, n in cells.items() if cell.startswith(prefix))
+              for name, prefix in RESOURCES.items()}
+    for name, bel in PLACED.items():
+        if utilisation and bel in utilisation:
+            counts[name] = utilisation[bel][0]
+    return counts
+
+
+def git_revision():
+    """
+        Returns the current commit (with a + if the tree is dirty) so
+        each history entry can be tied back to the code it measured.
+    """
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TOP,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             check=True).stdout.decode().strip()
+        dirty = subprocess.run(["git", "status", "--porcelain",
+                                "--untracked-files=no"], cwd=TOP,
+                               stdout=subprocess.PIPE).stdout.strip()
+        return rev + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def measure(designs, jobs=None):
+    """
+        Builds 'designs' and returns a history entry for them. A
+        design that didn't build is {"failed": log}.
+    """
+    entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "revision": git_revision(), "designs": {}}
+    for result in build_all(designs, jobs):
+        if not result["ok"]:
+            print(f"{result['design']}: build FAILED, see {result['log']}")
+            entry["designs"][result["design"]] = {"failed": result["log"]}
+            continue
+        entry["designs"][result["design"]] = {
+            "resources": resources(result["cells"], result["utilisation"]),
+            "fmax": {clk: f for clk, (f, target) in result["fmax"].items()},
+            "seconds": round(result["seconds"], 2),
+        }
+    return entry
+
+
+def compare(old, new, threshold=2.0):
+    """
+        Compares two history entries and returns a list of (design,
+        what, old, new, percent) for every resource that grew or fmax
+        that dropped by more than 'threshold' percent. A resource that
+        goes from zero to something always counts.
+
+        A design that built before but failed or is missing now, and a
+        clock that had an fmax before and hasn't now, count too, with
+        None for the percentage.
+    """
+    regressions = []
+    for design, before in sorted(old["designs"].items()):
+        if "failed" in before:
+            continue
+        now = new["designs"].get(design)
+        if now is None or "failed" in now:
+            regressions.append((design, "build", "ok",
+                                "missing" if now is None else "FAILED", None))
+            continue
+        for clk, was in sorted(before["fmax"].items()):
+            if clk not in now["fmax"]:
+                regressions.append((design, f"fmax {clk}", was, "missing",
+                                    None))
+    for design, now in sorted(new["designs"].items()):
+        before = old["designs"].get(design)
+        if before is None or "failed" in before or "failed" in now:
+            continue
+        for name, n in sorted(now["resources"].items()):
+            was = before["resources"].get(name, 0)
+            if n > was and (was == 0 or 100.0 * (n - was) / was > threshold):
+                pct = 100.0 * (n - was) / was if was else float("inf")
+                regressions.append((design, name, was, n, pct))
+        for clk, f in sorted(now["fmax"].items()):
+            was = before["fmax"].get(clk)
+            if was and 100.0 * (was - f) / was > threshold:
+                regressions.append((design, f"fmax {clk}", was, f,
+                                    -100.0 * (was - f) / was))
+    return sorted(regressions, key=lambda r: r[0])
+
+
+def show(entry, out=sys.stdout):
+    """
+        Prints one history entry as a table.
+    """
+    names = list(RESOURCES)
+    out.write(f"{entry['time']}  {entry['revision']}\n")
+    out.write(f"{'design':<28}" + "".join(f"{n:>7}" for n in names) +
+              "  fmax MHz\n")
+    for design, d in sorted(entry["designs"].items()):
+        if "failed" in d:
+            out.write(f"{design:<28}  FAILED, see {d['failed']}\n")
+            continue
+        fmax = ", ".join(f"{clk} {f:.1f}" for clk, f in sorted(d["fmax"].items()))
+        out.write(f"{design:<28}" +
+                  "".join(f"{d['resources'].get(n, 0):>7}" for n in names) +
+                  f"  {fmax}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resource/fmax benchmarks")
+    parser.add_argument("--history", default=DEFAULT_HISTORY,
+                        help="history file (default: benchmarks/history.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="build and append a history entry")
+    run.add_argument("-j", "--jobs", type=int, default=None)
+    run.add_argument("designs", nargs="*")
+    cmp = sub.add_parser("compare", help="flag regressions in the last run")
+    cmp.add_argument("--threshold", type=float, default=2.0,
+                     help="percent change that counts (default 2)")
+    cmp.add_argument("--against", type=int, default=-2,
+                     help="history entry to compare with (default: the "
+                          "one before the last)")
+    sub.add_parser("show", help="print the last run")
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    if args.command == "run":
+        entry = measure(select(discover(), args.designs), args.jobs)
+        history.append(entry)
+        save_history(args.history, history)
+        show(entry)
+        failed = any("failed" in d for d in entry["designs"].values())
+        return 1 if failed else 0
+    if not history:
+        raise SystemExit(f"No benchmark history in {args.history}")
+    if args.command == "show":
+        show(history[-1])
+        return 0
+    if len(history) < 2:
+        print("Only one run in the history, nothing to compare with")
+        return 0
+    old, new = history[args.against], history[-1]
+    regressions = compare(old, new, args.threshold)
+    print(f"Comparing {new['revision']} ({new['time']}) with "
+          f"{old['revision']} ({old['time']}), threshold {args.threshold}%")
+    for design, what, was, now, pct in regressions:
+        change = "" if pct is None else f" ({pct:+.1f}%)"
+        print(f"  REGRESSION {design}: {what} {was} -> {now}{change}")
+    if not regressions:
+        print("  no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
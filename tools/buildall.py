@@ -0,0 +1,189 @@
+#
+# vim: expandtab:ts=4:
+#
+# Build every example in the tree at once.
+#
+# Each example directory (01_blink, 02_cylon, ...) has a Makefile with a
+# DESIGN= line naming the design script. This finds all of them, runs the
+# design scripts (which elaborate the design and then run yosys, nextpnr
+# and icepack through the build cache) several at a time, and prints a
+# summary of how long each one took, how many LUTs it used and how fast
+# nextpnr thinks it will run.
+#
+# Every design script is run in its own python process, so the Migen
+# elaboration and the toolchain runs all overlap. The pool that hands out
+# the jobs only has to wait on those processes, so it is a thread pool;
+# the work itself is spread across processes (and cores) either way.
+#
+# Usage (from the top of the repository):
+#
+#    python3 -m tools.buildall [-j N] [design ...]
+#
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tools.reports import read_reports
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_example_dir = re.compile(r"^\d\d_\w+$")
+_design_var = re.compile(r"^DESIGN\s*=\s*(\S+)", re.MULTILINE)
+
+
+class Design:
+    """
+        One example design, the directory it lives in and the name of
+        its design script (without the .py).
+    """
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.script = os.path.join(directory, name + ".py")
+        self.build_dir = os.path.join(directory, "build")
+
+    def __repr__(self):
+        return f"{os.path.basename(self.directory)}/{self.name}"
+
+
+def discover(top=TOP):
+    """
+        Returns a list of Design for every NN_xxx directory under 'top'
+        that has a Makefile with a DESIGN= line.
+    """
+    designs = []
+    for entry in sorted(os.listdir(top)):
+        directory = os.path.join(top, entry)
+        makefile = os.path.join(directory, "Makefile")
+        if not _example_dir.match(entry) or not os.path.isfile(makefile):
+            continue
+        with open(makefile) as f:
+            m = _design_var.search(f.read())
+        if m and os.path.isfile(os.path.join(directory, m.group(1) + ".py")):
+            designs.append(Design(directory, m.group(1)))
+    return designs
+
+
+def select(designs, names):
+    """
+        Picks the designs named on the command line, a design can be
+        given by its script name (cylon) or its directory (02_cylon).
+    """
+    if not names:
+        return designs
+    chosen = [d for d in designs
+              if d.name in names or os.path.basename(d.directory) in names]
+    missing = set(names) - {d.name for d in chosen} - \
+              {os.path.basename(d.directory) for d in chosen}
+    if missing:
+        raise SystemExit(f"Unknown design(s): {', '.join(sorted(missing))}")
+    return chosen
+
+
+def build_one(design, args=(), env=None):
+    """
+        Runs one design script and returns a dict with its status, wall
+        time and the numbers from its reports. The script's output goes
+        to build/make.log in its directory rather than to the terminal,
+        otherwise the parallel builds would be unreadable.
+    """
+    os.makedirs(design.build_dir, exist_ok=True)
+    log_file = os.path.join(design.build_dir, "make.log")
+    start = time.monotonic()
+    with open(log_file, "wb") as log:
+        rc = subprocess.call([sys.executable, design.script, *args],
+                             cwd=design.directory, stdout=log,
+                             stderr=subprocess.STDOUT, env=env)
+    result = {
+        "design": repr(design),
+        "ok": rc == 0,
+        "seconds": time.monotonic() - start,
+        "log": log_file,
+    }
+    result.update(read_reports(design.build_dir))
+    return result
+
+
+def build_all(designs, jobs=None, args=(), progress=None):
+    """
+        Builds 'designs' with up to 'jobs' of them running at the same
+        time (default is one per core). Returns the results in the same
+        order as 'designs'. 'progress' is called with each result as it
+        finishes.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_one, d, args): d for d in designs}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if progress:
+                progress(result)
+    return [results[d] for d in designs]
+
+
+def luts(result):
+    """
+        Returns the LUT count, from the yosys cell counts if we have
+        them, otherwise from nextpnr's logic cell count.
+    """
+    if "SB_LUT4" in result["cells"]:
+        return result["cells"]["SB_LUT4"]
+    lc = result["utilisation"].get("ICESTORM_LC")
+    return lc[0] if lc else None
+
+
+def format_fmax(fmax):
+    return ", ".join(f"{clk} {f:.1f}" + (f"/{t:.1f}" if t else "")
+                     for clk, (f, t) in sorted(fmax.items())) or "-"
+
+
+def print_summary(results, out=sys.stdout):
+    """
+        Prints one line per design, wall time, LUTs and fmax (achieved
+        and, when constrained, the target) in MHz.
+    """
+    width = max([len(r["design"]) for r in results] + [6])
+    out.write(f"{'design':<{width}}  status  {'time':>7}  {'LUTs':>5}  "
+              f"fmax MHz (achieved/target)\n")
+    for r in results:
+        n = luts(r)
+        out.write(f"{r['design']:<{width}}  "
+                  f"{'ok' if r['ok'] else 'FAILED':<6}  "
+                  f"{r['seconds']:6.1f}s  "
+                  f"{n if n is not None else '-':>5}  "
+                  f"{format_fmax(r['fmax'])}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build all of the examples in parallel")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of designs to build at the same time "
+                             "(default: one per core)")
+    parser.add_argument("designs", nargs="*",
+                        help="only build these (e.g. cylon or 02_cylon)")
+    args = parser.parse_args(argv)
+
+    designs = select(discover(), args.designs)
+    start = time.monotonic()
+
+    def progress(result):
+        status = "done" if result["ok"] else f"FAILED (see {result['log']})"
+        print(f"{result['design']}: {status} in {result['seconds']:.1f}s",
+              flush=True)
+
+    results = build_all(designs, args.jobs, progress=progress)
+    print()
+    print_summary(results)
+    print(f"\n{len(results)} designs in {time.monotonic() - start:.1f}s")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+#
+# vim: expandtab:ts=4:
+#
+# A content addressed cache for the yosys / nextpnr / icepack flow.
+#
+# The Makefiles in the examples re-run the design script whenever its
+# modification time changes. Most of the time the edit was to a comment
+# or to some python helper and the Verilog that Migen generates is exactly
+# the same as last time, but we still sit through synthesis and place and
+# route (and nextpnr is the slow one).
+#
+# The trick here is to split the LiteX build in two. First we ask LiteX
+# to do everything *except* run the toolchain (run=False). That leaves
+# the generated Verilog, the pin constraints, the yosys script and the
+# build script in the build directory. We hash those, along with the
+# versions of the tools that are going to be run, and use the hash as
+# the name of a directory in the cache. If that directory exists we
+# just copy the results (the .asc/.bin, the reports, Etc.) back into the
+# build directory. If it doesn't, we run the build script and save what
+# it produced for next time.
+#
+# LiteX doesn't rewrite a file if its contents haven't changed, so we
+# can't tell which files it generated by looking at modification times.
+# Instead we remember which files the toolchain produced (in the
+# <build_name>.outputs manifest) and treat everything else in the build
+# directory as an input.
+#
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from functools import lru_cache
+
+#
+# Where the cache lives. It can be moved with the ICEBREAKER_BUILD_CACHE
+# environment variable, and setting ICEBREAKER_NO_CACHE to anything turns
+# the cache off (the build still works, it just always runs the tools).
+#
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "icebreaker-with-litex")
+
+#
+# The tools the icestorm flow runs. Their versions are part of the key
+# so that upgrading yosys or nextpnr doesn't hand back stale results.
+#
+TOOLCHAIN = ("yosys", "nextpnr-ice40", "icepack")
+
+#
+# LiteX stamps the date (and on older versions a "generated on" line)
+# into the files it writes. Those lines change on every run even when
+# nothing else does so they are left out of the hash.
+#
+_banner = re.compile(rb"^\W*(date\s*:|.*auto-?generated\b.*\bon\s+\d{4}-)",
+                     re.IGNORECASE)
+
+
+def cache_dir():
+    """
+        Returns the directory the build cache is kept in.
+    """
+    return os.environ.get("ICEBREAKER_BUILD_CACHE", DEFAULT_CACHE_DIR)
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    """
+        Returns a string that identifies the installed version of
+        'tool'. yosys and nextpnr will tell us with a flag, icepack
+        won't, so for anything that doesn't answer we fall back to the
+        path, size and modification time of the binary.
+    """
+    path = shutil.which(tool)
+    if path is None:
+        return f"{tool}: not installed"
+    for flag in ("--version", "-V"):
+        try:
+            out = subprocess.run([path, flag], stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if out.returncode == 0 and out.stdout.strip():
+            return out.stdout.decode(errors="replace").strip()
+    st = os.stat(path)
+    return f"{path} {st.st_size} {st.st_mtime_ns}"
+
+
+def snapshot(build_dir):
+    """
+        Returns a dict of file name -> (size, mtime) for every file in
+        the build directory.
+    """
+    files = {}
+    for root, dirs, names in os.walk(build_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            files[os.path.relpath(path, build_dir)] = (st.st_size,
+                                                       st.st_mtime_ns)
+    return files
+
+
+def changed(before, after):
+    """
+        Returns the (sorted) list of files that are new or were
+        rewritten between the two snapshots.
+    """
+    return sorted(f for f, st in after.items() if before.get(f) != st)
+
+
+def _manifest(build_dir, build_name):
+    return os.path.join(build_dir, f"{build_name}.outputs")
+
+
+def read_outputs(build_dir, build_name="top"):
+    """
+        Returns the set of files the toolchain produced the last time
+        it ran (or was restored from the cache) in this build directory.
+    """
+    try:
+        with open(_manifest(build_dir, build_name)) as f:
+            return set(f.read().split())
+    except OSError:
+        return set()
+
+
+def write_outputs(build_dir, build_name, files):
+    """
+        Records 'files' as the toolchain outputs for this build
+        directory, they are left out of the next cache key.
+    """
+    with open(_manifest(build_dir, build_name), "w") as f:
+        f.write("\n".join(sorted(files)) + "\n")
+
+
+def build_key(build_dir, sources, tools=TOOLCHAIN, extra=""):
+    """
+        Computes the cache key for a build. 'sources' are the files
+        (relative to build_dir) that LiteX generated for this build,
+        they are hashed with the date banners removed. The toolchain
+        versions and any 'extra' text (options that aren't already in
+        the build script) are hashed in as well.
+    """
+    h = hashlib.sha256()
+    for name in sorted(sources):
+        h.update(name.encode() + b"\0")
+        with open(os.path.join(build_dir, name), "rb") as f:
+            for line in f:
+                if not _banner.match(line):
+                    h.update(line)
+        h.update(b"\0")
+    for tool in tools:
+        h.update(tool_version(tool).encode() + b"\0")
+    h.update(extra.encode())
+    return h.hexdigest()
+
+
+def build_commands(build_dir, build_name="top"):
+    """
+        Returns the commands in the LiteX build script as a list of
+        argument lists, one per step (yosys, nextpnr, icepack, Etc.).
+        Comments and shell settings are skipped. This lets the other
+        tools run the steps one at a time, or change their options.
+    """
+    script = os.path.join(build_dir, f"build_{build_name}.sh")
+    commands = []
+    with open(script) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line.startswith("set "):
+                continue
+            commands.append(shlex.split(line))
+    return commands
+
+
+def find_command(commands, tool):
+    """
+        Returns the first command in 'commands' that runs 'tool'.
+    """
+    for cmd in commands:
+        if os.path.basename(cmd[0]) == tool:
+            return cmd
+    raise ValueError(f"build script doesn't run {tool}")
+
+
+def run_logged(cmd, cwd, log_file, append=False):
+    """
+        Runs 'cmd' in 'cwd', copying its output both to our stdout and
+        to 'log_file' (so that the reports can be parsed later). Raises
+        OSError if the command fails, the same as LiteX does.
+    """
+    with open(log_file, "ab" if append else "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        for line in proc.stdout:
+            log.write(line)
+            sys.stdout.buffer.write(line)
+        sys.stdout.flush()
+        if proc.wait() != 0:
+            raise OSError(f"Error running {' '.join(cmd)}, see {log_file}")
+
+
+def _store(entry, build_dir, files):
+    """
+        Copies 'files' from the build directory into the cache entry.
+        The copy is made into a temporary directory and renamed into
+        place so a half written entry is never used.
+    """
+    parent = os.path.dirname(entry)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    for name in files:
+        dst = os.path.join(tmp, name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(os.path.join(build_dir, name), dst)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # somebody else (another job) stored it first, that's fine
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _restore(entry, build_dir):
+    """
+        Copies a cache entry back into the build directory. The copies
+        get a fresh modification time so that 'make' sees them as new.
+        Returns the list of files restored.
+    """
+    files = []
+    for root, dirs, names in os.walk(entry):
+        for name in names:
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, entry)
+            dst = os.path.join(build_dir, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+            files.append(rel)
+    return files
+
+
+def cached_build(platform, top, build_dir="build", build_name="top",
+                 **kwargs):
+    """
+        This is a drop in replacement for platform.build(top). It
+        generates the sources with LiteX, and then either restores the
+        toolchain results from the cache or runs the toolchain and
+        stores them. Returns the LiteX namespace, like build() does.
+
+        Any extra keyword arguments are passed on to platform.build().
+    """
+    vns = platform.build(top, build_dir=build_dir, build_name=build_name,
+                         run=False, **kwargs)
+    outputs = read_outputs(build_dir, build_name) | {
+        os.path.basename(_manifest(build_dir, build_name))}
+    generated = snapshot(build_dir)
+    sources = [f for f in generated if f not in outputs]
+
+    script = os.path.join(build_dir, f"build_{build_name}.sh")
+    log_file = os.path.join(build_dir, f"{build_name}.log")
+    use_cache = not os.environ.get("ICEBREAKER_NO_CACHE")
+
+    key = build_key(build_dir, sources)
+    entry = os.path.join(cache_dir(), key[:2], key)
+    if use_cache and os.path.isdir(entry):
+        restored = _restore(entry, build_dir)
+        write_outputs(build_dir, build_name, outputs | set(restored))
+        print(f"Build cache hit ({key[:16]}), skipped yosys/nextpnr/icepack")
+        return vns
+
+    run_logged(["bash", os.path.basename(script)], build_dir,
+               os.path.abspath(log_file))
+    results = changed(generated, snapshot(build_dir))
+    write_outputs(build_dir, build_name, outputs | set(results))
+    if use_cache:
+        _store(entry, build_dir, results)
+        print(f"Build cache stored ({key[:16]}, {len(results)} files)")
+    return vns
@@ -0,0 +1,70 @@
+#
+# vim: expandtab:ts=4:
+#
+# Getting hold of a design without building it.
+#
+# Each design script makes its platform and its top module and then hands
+# them to cached_build() (or seed_sweep()), all under 'if __name__ ==
+# "__main__"' so that importing it doesn't build anything. The tools that
+# want the design itself (the profiler, the elaborate and verilog
+# commands in tools/__main__.py) don't want to know how each script
+# makes its module though, with what arguments and from which clock
+# plan, so
+#
+#    captured = capture(design)
+#
+# runs the script the way its Makefile does, from its own directory, but
+# with cached_build() and seed_sweep() swapped for a function that stops
+# the script and keeps what it was going to build: captured.platform,
+# captured.top and the rest of the arguments (captured.kwargs, the seed
+# and so on). captured.seconds is how long the script took to get that
+# far.
+#
+import os
+import runpy
+import sys
+import time
+
+
+class Captured(Exception):
+    """
+        What a design script was going to build. It is raised from the
+        build call to get out of the script.
+    """
+    def __init__(self, platform, top, args, kwargs, seconds):
+        super().__init__("captured a build")
+        self.platform = platform
+        self.top = top
+        self.args = args
+        self.kwargs = kwargs
+        self.seconds = seconds
+
+
+def capture(design):
+    """
+        Runs the script of 'design' (a tools.buildall.Design) up to its
+        build and returns a Captured.
+    """
+    import tools.buildcache
+    import tools.seedsweep
+
+    def build(platform, top, *args, **kwargs):
+        raise Captured(platform, top, args, kwargs,
+                       time.perf_counter() - started)
+
+    saved = (tools.buildcache.cached_build, tools.seedsweep.seed_sweep,
+             sys.argv, os.getcwd())
+    tools.buildcache.cached_build = build
+    tools.seedsweep.seed_sweep = build
+    sys.argv = [design.script]
+    started = time.perf_counter()
+    try:
+        os.chdir(design.directory)
+        runpy.run_path(design.script, run_name="__main__")
+    except Captured as captured:
+        return captured
+    finally:
+        (tools.buildcache.cached_build, tools.seedsweep.seed_sweep,
+         sys.argv, cwd) = saved
+        os.chdir(cwd)
+    raise SystemExit(f"{design} didn't build anything")
@@ -0,0 +1,24 @@
+#
+# vim: expandtab:ts=4:
+#
+# The parts of a design that the host talks to (the register bus, the
+# logic analyzer, the PCM stream and the sampler) each have a describe()
+# that says what the host needs to know about them, the baud rate, where
+# the registers are, the sample rate, Etc. When the design is built that
+# goes in its build directory as JSON, which is where the host tools
+# (tools/regclient.py, tools/la2vcd.py, ...) look for it.
+#
+import json
+import os
+
+
+def write_json(path, obj):
+    """
+        Writes 'obj' to 'path' as JSON, making the directory it goes in
+        if there isn't one yet.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=1)
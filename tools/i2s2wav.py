@@ -0,0 +1,333 @@
+#
+# vim: expandtab:ts=4:
+#
+# Decode an I2S capture into a WAV file and measure the tone in it.
+#
+# Checking what the tone example sends to the I2S2 PMOD used to mean a
+# scope on the real_sclk/real_sdo/real_lrclk pins. This takes a capture
+# of those three lines instead, from a logic analyzer or a simulation,
+# and turns the bit stream back into the 24 bit stereo samples:
+#
+#    python3 -m tools.i2s2wav capture.bin out.wav --capture-rate 24e6 \
+#        --freq 880
+#
+# A capture is either
+#
+#    - a raw logic analyzer dump (sigrok's "binary" output, Saleae's
+#      binary export, ...), one byte per sample with SCLK, LRCLK and SDO
+#      on the bits given by --bits (0, 1 and 2 by default), or
+#    - an .npz file with "sclk", "lrclk" and "sdo" arrays, one entry per
+#      clock, which is what the simulation returns (see sim/). Saving a
+#      trace with np.savez(name, **trace, clock=plan.freq("i2s")) records
+#      the clock rate with it.
+#
+# The capture is read a chunk at a time (a raw file through a memory map)
+# and the samples are written to the WAV file as they come out, so a
+# capture of a few hundred million SCLK edges never has to be in memory
+# at once. The decoder carries the half finished word (and the left
+# sample waiting for its right one) from one chunk to the next.
+#
+# The bits are read on the rising edge of SCLK and each word starts one
+# bit after LRCLK changes, MSB first. pmod/i2s2.py sends the left sample
+# while LRCLK is high, which is the opposite of the I2S standard, so
+# that is the default here and --left-low decodes standard I2S.
+#
+# While it is writing the WAV file it averages the power spectrum of each
+# channel over overlapping blocks of samples (Welch's method, the memory
+# it needs is one block), and at the end it finds the tone in it and
+# reports its frequency, how far that is from --freq, the signal to noise
+# ratio and the total harmonic distortion.
+#
+import argparse
+import sys
+import wave
+
+import numpy as np
+
+#
+# Samples of a raw capture read at a time.
+#
+CHUNK = 1 << 24
+
+
+class I2SDecoder:
+    """
+        Turns chunks of an I2S capture into (left, right) samples.
+        'width' is the number of bits in a sample and 'left' the level
+        of LRCLK while the left sample is sent.
+    """
+    def __init__(self, width=24, left=1):
+        self.width = width
+        self.left = left
+        self._sclk = 1
+        self._offset = 0
+        # the SCLK edges since the last LRCLK change that hasn't got all
+        # of its word yet: the bits, the LRCLK levels and where they were
+        self._bits = np.zeros(0, dtype=np.uint8)
+        self._lr = np.zeros(0, dtype=np.uint8)
+        self._at = np.zeros(0, dtype=np.int64)
+        self._prev_lr = None
+        # a left word (its value and position) waiting for its right one
+        self._pending = None
+
+    def feed(self, sclk, lrclk, sdo):
+        """
+            Decodes the next chunk of the capture, returns an (n, 2)
+            array of the samples that were finished in it and an array of
+            where (the capture sample) each of them started.
+        """
+        sclk = np.asarray(sclk, dtype=np.uint8)
+        before = np.concatenate(([self._sclk], sclk[:-1]))
+        rising = np.flatnonzero((sclk == 1) & (before == 0))
+        if len(sclk):
+            self._sclk = sclk[-1]
+        bits = np.concatenate((self._bits, np.asarray(sdo, dtype=np.uint8)[rising]))
+        lr = np.concatenate((self._lr, np.asarray(lrclk, dtype=np.uint8)[rising]))
+        at = np.concatenate((self._at, rising + self._offset))
+        self._offset += len(sclk)
+
+        if len(lr) == 0:
+            return np.zeros((0, 2), dtype=np.int32), np.zeros(0, dtype=np.int64)
+        prev = np.concatenate(([lr[0] if self._prev_lr is None else self._prev_lr],
+                               lr[:-1]))
+        starts = np.flatnonzero(lr != prev)
+        done = starts[starts + self.width < len(lr)]
+
+        #
+        # Everything from the first word that isn't finished on is kept
+        # for the next chunk, or just the LRCLK level if they all are.
+        #
+        keep = starts[len(done)] if len(done) < len(starts) else len(lr)
+        self._prev_lr = lr[keep - 1] if keep else self._prev_lr
+        self._bits, self._lr, self._at = bits[keep:], lr[keep:], at[keep:]
+
+        weights = 1 << np.arange(self.width - 1, -1, -1, dtype=np.int64)
+        words = bits[done[:, None] + 1 + np.arange(self.width)] @ weights
+        words = words - ((words >> (self.width - 1)) << self.width)
+        channels = lr[done]
+        where = at[done]
+
+        if self._pending is not None:
+            words = np.concatenate(([self._pending[0]], words))
+            channels = np.concatenate(([self.left], channels))
+            where = np.concatenate(([self._pending[1]], where))
+            self._pending = None
+        pairs = np.flatnonzero((channels[:-1] == self.left) &
+                               (channels[1:] != self.left))
+        if len(channels) and channels[-1] == self.left:
+            self._pending = (words[-1], where[-1])
+        frames = np.stack([words[pairs], words[pairs + 1]], axis=1).astype(np.int32)
+        return frames, where[pairs]
+
+
+class ToneAnalysis:
+    """
+        Averages the power spectrum of a stream of samples at 'rate' Hz
+        over Hann windowed blocks of 'block' samples that overlap by
+        half, then measures the tone in it.
+    """
+    def __init__(self, rate, block=8192, harmonics=5):
+        self.rate = rate
+        self.block = block
+        self.harmonics = harmonics
+        self._buffer = np.zeros(0)
+        self._power = None
+        self._blocks = 0
+        self._length = 0
+
+    def _add_block(self, samples):
+        window = np.hanning(len(samples))
+        power = np.abs(np.fft.rfft(samples * window))**2
+        if self._power is None or self._length != len(samples):
+            self._power, self._blocks = power, 1
+            self._length = len(samples)
+        else:
+            self._power += power
+            self._blocks += 1
+
+    def add(self, samples):
+        """
+            Adds some more samples.
+        """
+        self._buffer = np.concatenate((self._buffer, samples))
+        while len(self._buffer) >= self.block:
+            self._add_block(self._buffer[:self.block])
+            self._buffer = self._buffer[self.block // 2:]
+
+    def result(self, freq=None):
+        """
+            Returns a dict with the tone's frequency ("freq", Hz), its
+            error from 'freq' if that is given ("error", Hz and "ppm"),
+            "snr" and "thd" (dB), or None if there weren't enough
+            samples.
+        """
+        if self._power is None:
+            if len(self._buffer) < 32:
+                return None
+            self._add_block(self._buffer)
+        power = self._power / self._blocks
+        n = self._length
+        # the Hann window spreads a tone over +/-2 bins, 3 to be safe
+        span = 3
+        power[:span + 1] = 0    # DC
+        k = int(np.argmax(power))
+        if k <= span or k >= len(power) - 2:
+            return None
+
+        #
+        # The peak is between bins, fitting a parabola to the log of the
+        # power around it gets it to a small fraction of a bin.
+        #
+        a, b, c = np.log(power[k - 1:k + 2] + 1e-300)
+        offset = 0.5 * (a - c) / (a - 2 * b + c) if a - 2 * b + c else 0
+        measured = (k + offset) * self.rate / n
+
+        def band(center):
+            lo, hi = max(center - span, 0), min(center + span + 1, len(power))
+            return power[lo:hi].sum()
+
+        signal = band(k)
+        harmonics = 0
+        for h in range(2, self.harmonics + 1):
+            at = int(round(h * (k + offset)))
+            if at + span < len(power):
+                harmonics += band(at)
+        noise = max(power.sum() - signal - harmonics, 1e-300)
+        result = {
+            "freq": measured,
+            "snr": 10 * np.log10(signal / noise),
+            "thd": 10 * np.log10(max(harmonics, 1e-300) / signal),
+        }
+        if freq:
+            result["error"] = measured - freq
+            result["ppm"] = 1e6 * (measured - freq) / freq
+        return result
+
+
+def read_capture(path, bits=(0, 1, 2), chunk=CHUNK):
+    """
+        Yields (sclk, lrclk, sdo) chunks of the capture in 'path' and
+        the capture's clock rate if it knows it (an .npz with "clock").
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            clock = float(data["clock"]) if "clock" in data else None
+            lines = [data[name] for name in ("sclk", "lrclk", "sdo")]
+        return clock, (tuple(line[i:i + chunk] for line in lines)
+                       for i in range(0, len(lines[0]), chunk))
+
+    samples = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def chunks():
+        for i in range(0, len(samples), chunk):
+            block = np.asarray(samples[i:i + chunk])
+            yield tuple((block >> bit) & 1 for bit in bits)
+    return None, chunks()
+
+
+def decode(path, wav=None, capture_rate=None, rate=None, freq=None,
+           left=1, width=24, bits=(0, 1, 2), chunk=CHUNK):
+    """
+        Decodes the capture in 'path', writes the samples to 'wav' (if
+        it is given) and returns a dict with the number of "frames", the
+        sample "rate" and the ToneAnalysis results for "left" and
+        "right". The sample rate is 'rate', or worked out from how far
+        apart the frames are and the capture's sample rate
+        'capture_rate' (Hz).
+    """
+    clock, chunks = read_capture(path, bits, chunk)
+    capture_rate = capture_rate or clock
+    if rate is None and not capture_rate:
+        raise ValueError("Need the capture's sample rate (--capture-rate) "
+                         "or the sample rate (--rate)")
+    decoder = I2SDecoder(width, left)
+    analysis = None
+    out = None
+    count = 0
+    first = last = None
+    # frames held back until there are two to work out the rate from
+    held = []
+    try:
+        for sclk, lrclk, sdo in chunks:
+            frames, where = decoder.feed(sclk, lrclk, sdo)
+            if not len(frames):
+                continue
+            if first is None:
+                first = where[0]
+            last = where[-1]
+            if analysis is None:
+                held.append(frames)
+                if rate is None:
+                    if last == first:
+                        continue
+                    rate = capture_rate * (sum(map(len, held)) - 1) / (last - first)
+                frames = np.concatenate(held)
+                analysis = [ToneAnalysis(rate), ToneAnalysis(rate)]
+                if wav is not None:
+                    out = wave.open(wav, "wb")
+                    out.setnchannels(2)
+                    out.setsampwidth(3)
+                    out.setframerate(int(round(rate)))
+            count += len(frames)
+            for channel, samples in zip(analysis, frames.T):
+                channel.add(samples / 2**(width - 1))
+            if out is not None:
+                pcm = (frames.astype("<i4") << (24 - width)).view(np.uint8)
+                out.writeframes(pcm.reshape(-1, 4)[:, :3].tobytes())
+    finally:
+        if out is not None:
+            out.close()
+    if capture_rate and count > 1:
+        rate = capture_rate * (count - 1) / (last - first)
+        for channel in analysis or ():
+            channel.rate = rate
+    return {
+        "frames": count,
+        "rate": rate,
+        "left": analysis[0].result(freq) if analysis else None,
+        "right": analysis[1].result(freq) if analysis else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.i2s2wav",
+        description="Decode an I2S capture into a WAV file")
+    parser.add_argument("capture", help="raw capture (one byte a sample) or .npz")
+    parser.add_argument("wav", nargs="?", help="WAV file to write")
+    parser.add_argument("--capture-rate", type=float,
+                        help="samples per second of the capture")
+    parser.add_argument("--rate", type=float,
+                        help="audio sample rate (if there's no capture rate)")
+    parser.add_argument("--freq", type=float, help="the tone that was asked for (Hz)")
+    parser.add_argument("--bits", default="0,1,2",
+                        help="bits of a raw capture with SCLK,LRCLK,SDO (0,1,2)")
+    parser.add_argument("--width", type=int, default=24, help="bits per sample")
+    parser.add_argument("--left-low", action="store_true",
+                        help="left is sent while LRCLK is low (standard I2S)")
+    args = parser.parse_args(argv)
+
+    bits = tuple(int(b) for b in args.bits.split(","))
+    try:
+        result = decode(args.capture, args.wav, args.capture_rate, args.rate,
+                        args.freq, left=0 if args.left_low else 1,
+                        width=args.width, bits=bits)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(f"{result['frames']} frames at {result['rate'] or 0:.1f} Hz")
+    for channel in ("left", "right"):
+        r = result[channel]
+        if r is None:
+            print(f"{channel:6s} not enough samples to measure")
+            continue
+        error = ""
+        if "error" in r:
+            error = f" ({r['error']:+.4f} Hz, {r['ppm']:+.1f} ppm)"
+        print(f"{channel:6s} {r['freq']:.4f} Hz{error}, SNR {r['snr']:.1f} dB, "
+              f"THD {r['thd']:.1f} dB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+#
+# vim: expandtab:ts=4:
+#
+# The host side of the logic analyzer (cores/logic_analyzer.py).
+#
+# It arms the analyzer over the serial port with a trigger, waits for the
+# capture to come back and writes it out as a VCD file for GTKWave (or
+# anything else that reads them):
+#
+#    python3 -m tools.la2vcd build/analyzer.json capture.vcd \
+#        --trigger lrclk=rise --trigger sdo=1
+#
+# The first argument is the description the design wrote when it was
+# built (LogicAnalyzer.write_description()), it has the names and widths
+# of the probes, the depth and the sample rate. Each --trigger is
+# name=VALUE (the probe has to be that value), name=rise or name=fall
+# (a one bit probe has to have just gone to 1 or 0), they all have to be
+# true at once. With no --trigger it triggers straight away.
+#
+# The iCEBreaker's FTDI chip has two channels, the first one programs the
+# flash and the second one is the serial port, so that is --port's
+# default (/dev/ttyUSB1 on Linux). It needs pyserial. --save keeps the
+# bytes that came back and --raw makes the VCD file from them again,
+# without the board.
+#
+# In the VCD file the time starts at the first sample and there is an
+# extra one bit signal, 'trigger', that is 1 for the sample the analyzer
+# triggered on.
+#
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+# the command that arms the analyzer (cores.logic_analyzer.ARM)
+ARM = ord("A")
+
+
+def load_description(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _probe(description, name):
+    for probe in description["probes"]:
+        if probe["name"] == name:
+            return probe
+    raise ValueError(f"There is no probe called {name}, there is "
+                     f"{', '.join(p['name'] for p in description['probes'])}")
+
+
+def trigger_command(description, specs=()):
+    """
+        The bytes that arm the analyzer with the trigger in 'specs'
+        (name=VALUE, name=rise or name=fall).
+    """
+    mask = value = edge = 0
+    for spec in specs:
+        name, _, want = spec.partition("=")
+        probe = _probe(description, name.strip())
+        bits = ((1 << probe["width"]) - 1) << probe["offset"]
+        want = want.strip().lower()
+        if want in ("rise", "fall"):
+            if probe["width"] != 1:
+                raise ValueError(f"{name} is {probe['width']} bits, only a one "
+                                 f"bit probe can rise or fall")
+            edge |= bits
+            level = 1 if want == "rise" else 0
+        else:
+            try:
+                level = int(want, 0)
+            except ValueError:
+                raise ValueError(f"Can't make sense of the trigger {spec}")
+            if level >> probe["width"]:
+                raise ValueError(f"{name} is only {probe['width']} bits, it "
+                                 f"can't be {level}")
+        mask |= bits
+        value = (value & ~bits) | (level << probe["offset"])
+    n = description["nbytes"]
+    return (bytes([ARM]) + mask.to_bytes(n, "little") +
+            value.to_bytes(n, "little") + edge.to_bytes(n, "little"))
+
+
+def capture(port, description, command, timeout=None):
+    """
+        Arms the analyzer on serial port 'port' with 'command' and
+        returns the bytes of the capture, or None if it didn't come
+        back within 'timeout' seconds.
+    """
+    try:
+        import serial
+    except ImportError:
+        raise SystemExit("Reading the analyzer needs pyserial "
+                         "(pip install pyserial)")
+    size = description["depth"] * description["nbytes"]
+    with serial.Serial(port, description["baudrate"], timeout=0.5) as s:
+        s.reset_input_buffer()
+        s.write(command)
+        data = bytearray()
+        start = time.monotonic()
+        while len(data) < size:
+            data += s.read(size - len(data))
+            if timeout is not None and time.monotonic() - start > timeout:
+                return None
+    return bytes(data)
+
+
+def samples(data, description):
+    """
+        The samples in a capture's bytes, as a numpy array of ints.
+    """
+    n = description["nbytes"]
+    raw = np.frombuffer(data, dtype=np.uint8)[:description["depth"] * n]
+    raw = raw.reshape(-1, n).astype(np.uint64)
+    words = np.zeros(len(raw), dtype=np.uint64)
+    for i in range(n):
+        words |= raw[:, i] << np.uint64(8 * i)
+    return words
+
+
+def probe_values(words, description):
+    """
+        name -> array of that probe's value in each sample.
+    """
+    values = {}
+    for probe in description["probes"]:
+        mask = np.uint64((1 << probe["width"]) - 1)
+        values[probe["name"]] = (words >> np.uint64(probe["offset"])) & mask
+    return values
+
+
+def _vcd_id(n):
+    # the short printable names VCD files use for their variables
+    chars = "".join(chr(c) for c in range(33, 127))
+    ident = ""
+    while True:
+        ident += chars[n % len(chars)]
+        n //= len(chars)
+        if not n:
+            return ident
+
+
+def write_vcd(f, words, description, module="analyzer"):
+    """
+        Writes the samples 'words' to the open file 'f' as a VCD file.
+    """
+    values = probe_values(words, description)
+    trigger = np.zeros(len(words), dtype=np.uint64)
+    trigger[description["pre"]] = 1
+    values["trigger"] = trigger
+    widths = {p["name"]: p["width"] for p in description["probes"]}
+    widths["trigger"] = 1
+    ids = {name: _vcd_id(i) for i, name in enumerate(values)}
+
+    f.write(f"$date {time.strftime('%Y-%m-%d %H:%M:%S')} $end\n")
+    f.write("$version tools/la2vcd.py $end\n")
+    f.write("$timescale 1ps $end\n")
+    f.write(f"$scope module {module} $end\n")
+    for name in values:
+        f.write(f"$var wire {widths[name]} {ids[name]} {name} $end\n")
+    f.write("$upscope $end\n$enddefinitions $end\n")
+
+    def show(name, v):
+        if widths[name] == 1:
+            return f"{int(v)}{ids[name]}"
+        return f"b{int(v):b} {ids[name]}"
+
+    # the samples where anything changed, and what did
+    changes = {0: list(values)}
+    for name, v in values.items():
+        for i in np.flatnonzero(np.diff(v)) + 1:
+            changes.setdefault(int(i), []).append(name)
+    period = 1e12 / description["rate"]
+    for i in sorted(changes):
+        f.write(f"#{int(round(i * period))}\n")
+        if i == 0:
+            f.write("$dumpvars\n")
+        for name in changes[i]:
+            f.write(show(name, values[name][i]) + "\n")
+        if i == 0:
+            f.write("$end\n")
+    f.write(f"#{int(round(len(words) * period))}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.la2vcd",
+        description="Capture from the logic analyzer and write a VCD file")
+    parser.add_argument("description", help="the analyzer's description "
+                                            "(build/analyzer.json)")
+    parser.add_argument("vcd", help="VCD file to write")
+    parser.add_argument("--trigger", action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="trigger condition: name=VALUE, name=rise or "
+                             "name=fall (all of them have to be true)")
+    parser.add_argument("--port", default="/dev/ttyUSB1",
+                        help="the serial port (default /dev/ttyUSB1)")
+    parser.add_argument("--timeout", type=float,
+                        help="give up after this many seconds")
+    parser.add_argument("--save", help="write the bytes that came back to SAVE")
+    parser.add_argument("--raw", help="make the VCD file from a --save'd "
+                                      "capture instead")
+    args = parser.parse_args(argv)
+
+    description = load_description(args.description)
+    if args.raw:
+        with open(args.raw, "rb") as f:
+            data = f.read()
+    else:
+        try:
+            command = trigger_command(description, args.trigger)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"armed, waiting for {description['depth']} samples", flush=True)
+        data = capture(args.port, description, command, args.timeout)
+        if data is None:
+            print("it didn't trigger", file=sys.stderr)
+            return 1
+        if args.save:
+            with open(args.save, "wb") as f:
+                f.write(data)
+    if len(data) < description["depth"] * description["nbytes"]:
+        print(f"only {len(data)} bytes of a "
+              f"{description['depth'] * description['nbytes']} byte capture",
+              file=sys.stderr)
+        return 1
+
+    words = samples(data, description)
+    with open(args.vcd, "w") as f:
+        write_vcd(f, words, description)
+    print(f"{len(words)} samples at {description['rate'] / 1e6:.3f} MHz, "
+          f"{description['pre']} before the trigger, written to {args.vcd}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#
+# vim: expandtab:ts=4:
+#
+# The host side of the audio stream (pmod/pcm_stream.py, 08_stream).
+#
+#    python3 -m tools.pcmstream build/stream.json song.wav
+#
+# reads a WAV file, turns it into what the design plays and streams it over
+# the serial port. The design writes what the host needs to know (the
+# sample rate, the baud rate, the size of its FIFO and of a block) to
+# build/stream.json when it is built.
+#
+# Getting the samples ready is all numpy and is done before anything is
+# sent:
+#
+#    - read_wav() reads 8, 16, 24 or 32 bit PCM, mono or stereo (a mono
+#      file plays on both channels), as floats from -1 to 1,
+#    - resample() changes the sample rate to the design's (31.25 kHz for
+#      08_stream), through the FFT: the spectrum is cut off (or padded
+#      out) at the new Nyquist frequency, so nothing above it folds back
+#      down as aliasing, and
+#    - quantize() turns the floats into 16 bit samples with a little
+#      random (triangular) dither, so the rounding is noise rather than
+#      distortion that follows the music.
+#
+# blocks() cuts the frames into DATA commands of the design's block size
+# and Streamer sends them, as many at a time as it has credits for (the
+# design gives one back each time it has played a block), so a whole
+# window of blocks goes out in one write. It asks for the status (the
+# underrun and overrun counters and how full the FIFO is) when it starts,
+# every --status seconds while it plays and at the end, and reports how
+# far the counters moved. Streamer.step() only needs something with
+# write(), read() and in_waiting, a pyserial port or the simulation's
+# stand-in (sim/serial.py), which is how sim/benches.py tests it.
+#
+# It needs numpy and pyserial.
+#
+import argparse
+import json
+import sys
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+# the commands and what comes back (pmod/pcm_stream.py)
+DATA = 0x01
+STATUS = 0x02
+END = 0x03
+CREDIT = 0x01
+
+# the bytes after STATUS in a status reply
+STATUS_BYTES = 10
+
+Status = namedtuple("Status", "underruns overruns level")
+
+
+def read_wav(path):
+    """
+        The sample rate of WAV file 'path' and its samples, an (n, 2)
+        array of floats from -1 to 1.
+    """
+    with wave.open(path, "rb") as f:
+        rate = f.getframerate()
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        data = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        words = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (words - ((words >> 23) << 24)) / 2.0**23
+    elif width in (2, 4):
+        samples = np.frombuffer(data, dtype=f"<i{width}") / 2.0**(8 * width - 1)
+    else:
+        raise ValueError(f"{path} has {8 * width} bit samples")
+    samples = samples.reshape(-1, channels)
+    if channels == 1:
+        samples = np.repeat(samples, 2, axis=1)
+    return rate, samples[:, :2]
+
+
+def resample(samples, rate, new_rate):
+    """
+        'samples' (an (n, channels) array) at 'rate' Hz, resampled to
+        'new_rate' Hz through the FFT.
+    """
+    if rate == new_rate or len(samples) == 0:
+        return samples
+    n = len(samples)
+    m = int(round(n * new_rate / rate))
+    spectrum = np.fft.rfft(samples, axis=0)
+    bins = m // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate((spectrum,
+            np.zeros((bins - len(spectrum), samples.shape[1]), dtype=complex)))
+    return np.fft.irfft(spectrum, m, axis=0) * (m / n)
+
+
+def quantize(samples, bits=16, dither=True, rng=None):
+    """
+        'samples' (floats from -1 to 1) as 'bits' bit integers, with
+        triangular dither of one step either way if 'dither'. Anything
+        past full scale is clipped.
+    """
+    scale = 2**(bits - 1)
+    values = np.asarray(samples) * (scale - 1)
+    if dither:
+        rng = rng or np.random.default_rng()
+        values = values + rng.random(values.shape) - rng.random(values.shape)
+    return np.clip(np.round(values), -scale, scale - 1).astype(np.int16)
+
+
+def blocks(frames, block):
+    """
+        The DATA commands for 'frames' (an (n, 2) array of 16 bit
+        samples), 'block' frames each. The last one is padded out with
+        silence.
+    """
+    frames = np.asarray(frames, dtype="<i2")
+    short = -len(frames) % block
+    if short:
+        frames = np.concatenate((frames, np.zeros((short, 2), dtype="<i2")))
+    data = frames.reshape(-1, block * 2)
+    return [bytes([DATA]) + d.tobytes() for d in data]
+
+
+class Streamer:
+    """
+        Sends 'packets' (from blocks()) to a design that starts out with
+        room for 'credits' of them. step() does whatever can be done now
+        and 'done' says when they have all been played and the last
+        status has come back. 'statuses' is every status that came back.
+    """
+    def __init__(self, packets, credits):
+        self.packets = packets
+        self.credits = credits
+        self.sent = 0
+        self.played = 0
+        self.statuses = []
+        self.ended = False
+        self.done = False
+        self._asked = 0
+        self._final = False
+        self._reply = None
+        # a stream that was cut off may have left the design thinking it
+        # is still playing, and the counters are read before it starts
+        self._out = bytearray([END])
+        self.request_status()
+
+    def request_status(self):
+        """
+            Asks for the counters with the next write.
+        """
+        self._out.append(STATUS)
+        self._asked += 1
+
+    def receive(self, data):
+        """
+            Takes the bytes that came back from the design.
+        """
+        for byte in data:
+            if self._reply is not None:
+                self._reply.append(byte)
+                if len(self._reply) == STATUS_BYTES:
+                    r = self._reply
+                    self.statuses.append(Status(
+                        int.from_bytes(r[0:4], "big"),
+                        int.from_bytes(r[4:8], "big"),
+                        int.from_bytes(r[8:10], "big")))
+                    self._reply = None
+                    self._asked -= 1
+            elif byte == CREDIT:
+                self.credits += 1
+                self.played += 1
+            elif byte == STATUS:
+                self._reply = bytearray()
+
+    def step(self, port):
+        """
+            Sends as many blocks as there are credits for (and the END
+            after the last one), and reads what has come back.
+        """
+        n = min(self.credits, len(self.packets) - self.sent)
+        if n > 0:
+            self._out += b"".join(self.packets[self.sent:self.sent + n])
+            self.sent += n
+            self.credits -= n
+        if self.sent == len(self.packets) and not self.ended:
+            self._out.append(END)
+            self.ended = True
+        if self.played >= len(self.packets) and not self._final:
+            self.request_status()
+            self._final = True
+        if self._out:
+            port.write(bytes(self._out))
+            self._out.clear()
+        waiting = port.in_waiting
+        data = port.read(waiting or 1)
+        if data:
+            self.receive(data)
+        self.done = self._final and self._asked == 0
+
+    def counted(self):
+        """
+            How far the counters have moved since the stream started,
+            a Status (with the last level).
+        """
+        if not self.statuses:
+            return None
+        first, last = self.statuses[0], self.statuses[-1]
+        return Status((last.underruns - first.underruns) % 2**32,
+                      (last.overruns - first.overruns) % 2**32, last.level)
+
+
+def prepare(path, description, dither=True):
+    """
+        The frames to stream from WAV file 'path' for the design
+        'description' (from build/stream.json).
+    """
+    rate, samples = read_wav(path)
+    samples = resample(samples, rate, description["sample_rate"])
+    return quantize(samples, dither=dither)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.pcmstream",
+        description="Stream a WAV file to the design over the serial port")
+    parser.add_argument("description", help="the design's build/stream.json")
+    parser.add_argument("wav", help="the WAV file to play")
+    parser.add_argument("--port", default="/dev/ttyUSB1",
+                        help="the serial port (default /dev/ttyUSB1)")
+    parser.add_argument("--status", type=float, default=1.0, metavar="SECONDS",
+                        help="how often to read the counters (default 1)")
+    parser.add_argument("--no-dither", action="store_true",
+                        help="round the samples without dither")
+    args = parser.parse_args(argv)
+
+    with open(args.description) as f:
+        description = json.load(f)
+    frames = prepare(args.wav, description, dither=not args.no_dither)
+    packets = blocks(frames, description["block"])
+    seconds = len(frames) / description["sample_rate"]
+    print(f"{args.wav}: {len(frames)} frames at "
+          f"{description['sample_rate']:.0f} Hz, {seconds:.1f}s")
+
+    try:
+        import serial
+    except ImportError:
+        raise SystemExit("The streamer needs pyserial (pip install pyserial)")
+    streamer = Streamer(packets, description["depth"] // description["block"])
+    with serial.Serial(args.port, description["baudrate"], timeout=0.01) as port:
+        port.reset_input_buffer()
+        start = last = time.monotonic()
+        while not streamer.done:
+            streamer.step(port)
+            now = time.monotonic()
+            if now - last >= args.status and not streamer.ended:
+                streamer.request_status()
+                last = now
+                counted = streamer.counted()
+                if counted is not None:
+                    print(f"{now - start:6.1f}s  {streamer.played} of "
+                          f"{len(packets)} blocks, FIFO {counted.level} "
+                          f"frames, {counted.underruns} underruns, "
+                          f"{counted.overruns} overruns")
+    counted = streamer.counted()
+    print(f"done: {counted.underruns} underruns, {counted.overruns} overruns")
+    return 1 if counted.underruns or counted.overruns else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+#
+# vim: expandtab:ts=4:
+#
+# Where does the build time (and the FPGA) go?
+#
+# When a design gets slow to build it isn't obvious if it is Migen
+# elaborating the design in python, turning it into Verilog, or yosys and
+# nextpnr, and the reports only say how big the whole thing is, not which
+# of Counter, SevenSegmentLedDisplay, I2S, PLL, ... it went to. This runs
+# a design script the way 'make' does, but
+#
+#    - times each phase of the build separately: the script itself
+#      (imports, making the platform and constructing the modules),
+#      finalizing the modules, platform finalize, Verilog conversion,
+#      writing the project and then yosys, nextpnr and icepack one at a
+#      time (it runs the build script's commands itself, with no build
+#      cache, into build/profile),
+#    - walks the module tree and counts, for each module, the statements
+#      it added, the signals it drives and how many bits they are, and
+#      its memories, and
+#    - maps the cells in yosys' netlist back to the module that drives
+#      the signal they were made for. yosys names most cells after the
+#      net they drive ("count_SB_DFFSR_Q"), and the rest have a source
+#      line in the Verilog that assigns to one, anything it can't place
+#      is listed as unattributed.
+#
+# It writes the lot to build/profile/profile.json and prints a summary
+# with the modules as an indented tree and a bar for their share of the
+# cells (like a flame graph on its side):
+#
+#    python3 -m tools.profiler [--no-toolchain] [--json FILE] design
+#
+# where design is a script name (display_two) or directory (04_display_two).
+#
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from tools.buildall import discover, select
+from tools.buildcache import build_commands, run_logged
+from tools.capture import capture
+
+#
+# yosys cell types are grouped into these for the summary, the first
+# prefix that matches wins and everything else is "other".
+#
+CELL_GROUPS = (
+    ("lut", "SB_LUT4"),
+    ("dff", "SB_DFF"),
+    ("carry", "SB_CARRY"),
+    ("bram", "SB_RAM40_4K"),
+    ("dsp", "SB_MAC16"),
+)
+
+_target = re.compile(r"^\s*(?:assign\s+)?\\?([\w$.]+)\s*(?:\[[^\]]*\])?\s*<?=")
+_src = re.compile(r"^(?:.*/)?([\w.]+):(\d+)\.\d+-(\d+)\.\d+$")
+
+
+def cell_group(kind):
+    for group, prefix in CELL_GROUPS:
+        if kind.startswith(prefix):
+            return group
+    return "other"
+
+
+class _Phases:
+    """
+        Adds up the time spent in each named phase.
+    """
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed
+
+
+def _assignments(statements):
+    """
+        The number of assignments in 'statements', counting the ones in
+        every branch of the Ifs and Cases.
+    """
+    from migen.fhdl.structure import _Assign, If, Case
+    n = 0
+    for s in statements:
+        if isinstance(s, _Assign):
+            n += 1
+        elif isinstance(s, If):
+            n += _assignments(s.t) + _assignments(s.f)
+        elif isinstance(s, Case):
+            for body in s.cases.values():
+                n += _assignments(body if isinstance(body, list) else [body])
+        elif isinstance(s, (list, tuple)):
+            n += _assignments(s)
+    return n
+
+
+class ModuleStats:
+    """
+        One module in the tree, what it adds to the design by itself
+        ('own') and together with its submodules ('total').
+    """
+    def __init__(self, module, path, children):
+        self.module = module
+        self.path = path
+        self.children = children
+        self.cells = Counter()
+        self.statements = []
+        self.specials = set()
+        self.driven = []
+        self.memory_bits = 0
+
+    def all(self):
+        yield self
+        for child in self.children:
+            yield from child.all()
+
+    def own(self):
+        bits = sum(len(s) for s in self.driven)
+        return {
+            "statements": _assignments(self.statements),
+            "signals": len(self.driven),
+            "bits": bits,
+            "memory_bits": self.memory_bits,
+            "cells": dict(self.cells),
+        }
+
+    def total(self):
+        total = self.own()
+        total["cells"] = Counter(total["cells"])
+        for child in self.children:
+            t = child.total()
+            for key in ("statements", "signals", "bits", "memory_bits"):
+                total[key] += t[key]
+            total["cells"].update(t["cells"])
+        total["cells"] = dict(total["cells"])
+        return total
+
+
+def module_tree(module, path="top"):
+    """
+        Builds the ModuleStats tree for a finalized 'module'. A module's
+        fragment has its submodules' fragments merged into it, so what
+        it added itself is whatever isn't in any of theirs.
+    """
+    children = []
+    seen = Counter()
+    for name, sub in module._submodules:
+        name = name or type(sub).__name__.lower()
+        seen[name] += 1
+        if seen[name] > 1:
+            name = f"{name}{seen[name] - 1}"
+        children.append(module_tree(sub, f"{path}/{name}"))
+    node = ModuleStats(module, path, children)
+
+    fragment = module._fragment
+    statements = list(fragment.comb) + [s for ss in fragment.sync.values()
+                                        for s in ss]
+    theirs = set()
+    specials = set()
+    for child in node.all():
+        if child is node:
+            continue
+        f = child.module._fragment
+        theirs |= {id(s) for s in f.comb}
+        theirs |= {id(s) for ss in f.sync.values() for s in ss}
+        specials |= f.specials
+    node.statements = [s for s in statements if id(s) not in theirs]
+    node.specials = fragment.specials - specials
+    return node
+
+
+def _name(ns, obj):
+    """
+        The name 'obj' has in the Verilog, or None. (Migen's namespace
+        raises a KeyError for something that isn't in it and LiteX's a
+        ValueError.)
+    """
+    try:
+        return ns.get_name(obj)
+    except (KeyError, ValueError):
+        return None
+
+
+def count_driven(tree):
+    """
+        Works out the signals each module in 'tree' drives (node.driven)
+        and how many bits of memory it has (node.memory_bits). This only
+        needs the modules, not the Verilog.
+    """
+    from migen.fhdl.structure import _Fragment
+    from migen.fhdl.specials import Memory, SPECIAL_INPUT
+    from migen.fhdl.tools import list_targets, list_signals
+
+    for node in tree.all():
+        driven = list_targets(_Fragment(comb=node.statements))
+        node.memory_bits = 0
+        for special in node.specials:
+            if isinstance(special, Memory):
+                node.memory_bits += special.width * special.depth
+            # what comes out of a memory port or an instance
+            for obj, attr, direction in special.iter_expressions():
+                if direction != SPECIAL_INPUT:
+                    driven |= list_signals(getattr(obj, attr))
+        node.driven = sorted(driven, key=lambda s: s.duid)
+
+
+def _attribute_signals(tree, ns):
+    """
+        Returns Verilog name -> ModuleStats for the signals (and
+        memories) each module drives.
+    """
+    from migen.fhdl.specials import Memory
+
+    count_driven(tree)
+    owners = {}
+    for node in tree.all():
+        for special in node.specials:
+            if isinstance(special, Memory):
+                owners[_name(ns, special)] = node
+        for s in node.driven:
+            owners[_name(ns, s)] = node
+    owners.pop(None, None)
+    return owners
+
+
+def _owner_of_cell(name, cell, owners, lines):
+    """
+        Which module a yosys cell belongs to: the longest signal name
+        the cell's name starts with, or failing that the signal assigned
+        on the Verilog line it came from.
+    """
+    name = name.lstrip("\\")
+    ends = [m.start() for m in re.finditer(r"[_.$\[]", name)] + [len(name)]
+    for end in reversed(ends):
+        if name[:end] in owners:
+            return owners[name[:end]]
+    for src in cell.get("attributes", {}).get("src", "").split("|"):
+        m = _src.match(src)
+        if not m or not m.group(1).endswith(".v") or m.group(1) not in lines:
+            continue
+        text = lines[m.group(1)]
+        first, last = int(m.group(2)), int(m.group(3))
+        found = Counter()
+        for line in text[first - 1:last]:
+            t = _target.match(line)
+            if t and t.group(1) in owners:
+                found[owners[t.group(1)]] += 1
+        if found:
+            return found.most_common(1)[0][0]
+    return None
+
+
+def attribute_cells(tree, ns, netlist, build_dir, build_name="top"):
+    """
+        Adds the cells in the yosys JSON 'netlist' to the modules in
+        'tree', returns a Counter of the cell types it couldn't place.
+    """
+    owners = _attribute_signals(tree, ns)
+    lines = {}
+    for name in os.listdir(build_dir):
+        if name.endswith(".v"):
+            with open(os.path.join(build_dir, name)) as f:
+                lines[name] = f.read().splitlines()
+    unattributed = Counter()
+    # the other modules in the netlist are yosys' models of the cells
+    module = netlist.get("modules", {}).get(build_name, {})
+    for name, cell in module.get("cells", {}).items():
+        owner = _owner_of_cell(name, cell, owners, lines)
+        if owner is None:
+            unattributed[cell["type"]] += 1
+        else:
+            owner.cells[cell["type"]] += 1
+    return unattributed
+
+
+def profile(design, toolchain=True, build_dir=None):
+    """
+        Builds 'design' (a tools.buildall.Design) with everything timed
+        and returns the report as a dict.
+    """
+    phases = _Phases()
+    build_dir = os.path.abspath(build_dir or
+                                os.path.join(design.build_dir, "profile"))
+    build_name = "top"
+    result = {}
+
+    start = time.perf_counter()
+    import migen
+    import litex.build.generic_platform
+    import litex_boards.platforms.icebreaker
+    phases.add("import", time.perf_counter() - start)
+
+    #
+    # The script is run as if it was run from its Makefile, up to where
+    # it builds (see tools/capture.py), and the build is done here.
+    #
+    captured = capture(design)
+    phases.add("construct", captured.seconds)
+    platform, top = captured.platform, captured.top
+    top.get_fragment = phases.wrap("finalize modules", top.get_fragment)
+    platform.finalize = phases.wrap("finalize platform", platform.finalize)
+    get_verilog = phases.wrap("verilog", platform.get_verilog)
+
+    def verilog(*args, **kwargs):
+        result["verilog"] = get_verilog(*args, **kwargs)
+        return result["verilog"]
+    platform.get_verilog = verilog
+    fragment = top.get_fragment()
+    before = sum(phases.seconds.values())
+    begin = time.perf_counter()
+    kwargs = dict(captured.kwargs)
+    kwargs.pop("seeds", None)
+    platform.build(fragment, build_dir=build_dir,
+                   build_name=build_name, run=False, **kwargs)
+    inside = sum(phases.seconds.values()) - before
+    phases.add("project", time.perf_counter() - begin - inside)
+
+    if toolchain:
+        log_file = os.path.join(build_dir, f"{build_name}.log")
+        append = False
+        for cmd in build_commands(build_dir, build_name):
+            begin = time.perf_counter()
+            run_logged(cmd, build_dir, log_file, append=append)
+            phases.add(os.path.basename(cmd[0]), time.perf_counter() - begin)
+            append = True
+
+    tree = module_tree(top)
+    netlist = {}
+    json_file = os.path.join(build_dir, f"{build_name}.json")
+    if toolchain and os.path.exists(json_file):
+        with open(json_file) as f:
+            netlist = json.load(f)
+    unattributed = attribute_cells(tree, result["verilog"].ns, netlist,
+                                   build_dir, build_name)
+
+    return {
+        "design": repr(design),
+        "phases": {name: round(s, 4) for name, s in phases.seconds.items()},
+        "modules": [{
+            "path": node.path,
+            "class": type(node.module).__name__,
+            "own": node.own(),
+            "total": node.total(),
+        } for node in tree.all()],
+        "unattributed": dict(unattributed),
+    }
+
+
+def _bar(value, most, width=30):
+    if not most:
+        return ""
+    return "#" * max(1 if value else 0, int(round(width * value / most)))
+
+
+def summary(report, out=sys.stdout):
+    """
+        Prints the phases and the module tree of a profile report.
+    """
+    phases = report["phases"]
+    total = sum(phases.values())
+    out.write(f"{report['design']}: {total:.2f}s\n\n")
+    out.write(f"{'phase':<20} {'seconds':>8}\n")
+    longest = max(phases.values(), default=0)
+    for name, seconds in phases.items():
+        out.write(f"{name:<20} {seconds:8.3f}  {_bar(seconds, longest)}\n")
+
+    groups = [g for g, _ in CELL_GROUPS] + ["other"]
+
+    def label(m):
+        depth = m["path"].count("/")
+        return f"{'  ' * depth}{m['path'].rsplit('/', 1)[-1]} ({m['class']})"
+    width = max([len(label(m)) for m in report["modules"]] + [16]) + 2
+    out.write(f"\n{'module':<{width}}" + "".join(f"{g:>6}" for g in groups) +
+              f"{'stmts':>7}{'bits':>7}\n")
+
+    def grouped(cells):
+        counts = Counter()
+        for kind, n in cells.items():
+            counts[cell_group(kind)] += n
+        return counts
+
+    most = max(sum(m["total"]["cells"].values()) for m in report["modules"])
+    for m in report["modules"]:
+        counts = grouped(m["total"]["cells"])
+        out.write(f"{label(m):<{width}}" + "".join(f"{counts[g]:>6}" for g in groups) +
+                  f"{m['total']['statements']:>7}{m['total']['bits']:>7}  "
+                  f"{_bar(sum(counts.values()), most)}\n")
+    if report["unattributed"]:
+        counts = grouped(report["unattributed"])
+        out.write(f"{'(unattributed)':<{width}}" +
+                  "".join(f"{counts[g]:>6}" for g in groups) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.profiler",
+        description="Time each phase of a build and break the design "
+                    "down by module")
+    parser.add_argument("design", help="script name (cylon) or directory (02_cylon)")
+    parser.add_argument("--no-toolchain", action="store_true",
+                        help="stop after writing the Verilog")
+    parser.add_argument("--json", help="where to write the report "
+                                       "(default build/profile/profile.json)")
+    args = parser.parse_args(argv)
+
+    design, = select(discover(), [args.design])
+    report = profile(design, toolchain=not args.no_toolchain)
+    path = args.json or os.path.join(design.build_dir, "profile", "profile.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    summary(report)
+    print(f"\nreport written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#
+# vim: expandtab:ts=4:
+#
+# The host side of the register bus (cores/regbus.py).
+#
+# A design built with its registers on the serial port writes a map of
+# them (RegisterBus.write_map(), build/registers.json) and this reads and
+# writes them by name:
+#
+#    python3 -m tools.regclient build/registers.json
+#    python3 -m tools.regclient build/registers.json counter_count \
+#        counter_value=0x42 counter_rate_divisor=20Hz
+#
+# With nothing but the map it reads every register. A name on its own
+# reads that register, name=VALUE writes it. A value ending in Hz is
+# turned into a divisor (or a DDS tuning word) with what the map says
+# about the register ("hertz"), so counter_rate_divisor=20Hz counts ten
+# times a second (two ticks per count) without having to know the clock.
+# --reset puts the registers back the way the design was built.
+#
+# All of the reads and writes on one command line go out as one batch:
+# the commands for all of them are sent in one write to the serial port
+# and then the answers are read back in one go, so a batch costs one
+# round trip rather than one per register. Writes and reads to registers
+# next to each other are merged into bursts. The bus keeps the order, a
+# read after a write sees what was written.
+#
+# It needs pyserial, batch() and Batch are there for scripts:
+#
+#    with RegisterClient("build/registers.json") as regs:
+#        with regs.batch() as b:
+#            b.write("counter_value", 0x42)
+#            count = b.read("counter_count")
+#        print(count.value)
+#
+import argparse
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# the bridge's commands (litex.soc.cores.uart, CMD_WRITE_BURST_INCR,
+# CMD_READ_BURST_INCR and CMD_WRITE_BURST_FIXED)
+WRITE = 0x01
+READ = 0x02
+WRITE_FIXED = 0x03
+
+# the longest read burst, its answer has to go out before the FIFO in
+# front of the bridge (cores.regbus.FIFO_DEPTH, 64 bytes) fills up with
+# the commands after it
+MAX_READ = 12
+
+
+def load_map(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def to_value(register, value):
+    """
+        The value for 'register' (its entry in the map) from 'value', an
+        int or a string: a number, or a frequency ending in Hz.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lower().endswith("hz"):
+            hertz = register.get("hertz")
+            if hertz is None:
+                raise ValueError(f"This register isn't set in Hz, {value}")
+            freq = float(text[:-2])
+            if "divides" in hertz:
+                value = int(round(hertz["divides"] / freq))
+            else:
+                value = int(round(freq * hertz["multiplies"]))
+        else:
+            value = int(text, 0)
+    if not 0 <= value < 2**register["size"]:
+        raise ValueError(f"{value} doesn't fit in {register['size']} bits")
+    return value
+
+
+def in_hertz(register, value):
+    """
+        What 'value' of 'register' comes to in Hz, or None if it isn't
+        that sort of register.
+    """
+    hertz = register.get("hertz")
+    if hertz is None:
+        return None
+    if "divides" in hertz:
+        return hertz["divides"] / max(value, 1)
+    return value / hertz["multiplies"]
+
+
+class Read:
+    """
+        A read in a Batch, its 'value' is there once the batch is done.
+    """
+    def __init__(self, name, register):
+        self.name = name
+        self.register = register
+        self.value = None
+
+
+class Batch:
+    """
+        A list of reads and writes that go out together. commands() is
+        what to send and size() how many bytes come back, done() takes
+        them and fills in the reads.
+    """
+    def __init__(self, registers):
+        self.registers = registers
+        # (address, WRITE, [word, ...]) or (address, READ, [Read, ...])
+        self.bursts = []
+
+    def _register(self, name):
+        try:
+            return self.registers[name]
+        except KeyError:
+            raise ValueError(f"There is no register called {name}")
+
+    def _words(self, register, value):
+        # the most significant word is first
+        n = register["words"]
+        return [(value >> (32 * (n - 1 - i))) & 0xffffffff for i in range(n)]
+
+    def _add(self, address, command, items):
+        for item in items:
+            last = self.bursts[-1] if self.bursts else None
+            limit = MAX_READ if command == READ else 255
+            if (last is not None and last[1] == command and
+                    last[0] + len(last[2]) == address and len(last[2]) < limit):
+                last[2].append(item)
+            else:
+                self.bursts.append((address, command, [item]))
+            address += 1
+
+    def write(self, name, value):
+        register = self._register(name)
+        if register["access"] != "rw":
+            raise ValueError(f"{name} can only be read")
+        value = to_value(register, value)
+        self._add(register["address"], WRITE, self._words(register, value))
+
+    def stream(self, name, values):
+        """
+            Writes each of 'values' to register 'name' in turn, for a
+            register that puts what is written to it somewhere else
+            each time (like the sampler's 'data'). They go out as
+            bursts to the one address.
+        """
+        register = self._register(name)
+        if register["access"] != "rw" or register["words"] != 1:
+            raise ValueError(f"{name} can't take a stream of words")
+        values = [to_value(register, v) for v in values]
+        for i in range(0, len(values), 255):
+            self.bursts.append((register["address"], WRITE_FIXED,
+                                values[i:i + 255]))
+
+    def read(self, name):
+        register = self._register(name)
+        read = Read(name, register)
+        self._add(register["address"], READ, [read] * register["words"])
+        return read
+
+    def commands(self):
+        data = bytearray()
+        for address, command, items in self.bursts:
+            data += bytes([command, len(items)]) + address.to_bytes(4, "big")
+            if command != READ:
+                for word in items:
+                    data += word.to_bytes(4, "big")
+        return bytes(data)
+
+    def size(self):
+        return sum(4 * len(items) for _, command, items in self.bursts
+                   if command == READ)
+
+    def done(self, data):
+        i = 0
+        for _, command, items in self.bursts:
+            if command != READ:
+                continue
+            for read in items:
+                word = int.from_bytes(data[i:i + 4], "big")
+                read.value = word if read.value is None else \
+                             (read.value << 32) | word
+                i += 4
+
+
+class RegisterClient:
+    """
+        The registers of a design on serial port 'port', 'regmap' is the
+        map it wrote (or its path).
+    """
+    def __init__(self, regmap, port="/dev/ttyUSB1", timeout=1.0):
+        if isinstance(regmap, str):
+            regmap = load_map(regmap)
+        self.map = regmap
+        self.registers = regmap["registers"]
+        try:
+            import serial
+        except ImportError:
+            raise SystemExit("The register client needs pyserial "
+                             "(pip install pyserial)")
+        self.serial = serial.Serial(port, regmap["baudrate"], timeout=timeout)
+        self.timeout = timeout
+
+    def close(self):
+        self.serial.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, batch):
+        """
+            Sends 'batch' and waits for its answers.
+        """
+        self.serial.reset_input_buffer()
+        self.serial.write(batch.commands())
+        size = batch.size()
+        data = bytearray()
+        start = time.monotonic()
+        while len(data) < size:
+            data += self.serial.read(size - len(data))
+            if time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"only {len(data)} of {size} bytes came "
+                                   f"back, is the design on the board?")
+        batch.done(data)
+
+    @contextmanager
+    def batch(self):
+        b = Batch(self.registers)
+        yield b
+        self.run(b)
+
+    def read(self, name):
+        with self.batch() as b:
+            read = b.read(name)
+        return read.value
+
+    def write(self, name, value):
+        with self.batch() as b:
+            b.write(name, value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.regclient",
+        description="Read and write a design's registers over the serial port")
+    parser.add_argument("map", help="the register map (build/registers.json)")
+    parser.add_argument("registers", nargs="*", metavar="NAME[=VALUE]",
+                        help="read NAME or write VALUE to it (a number, or "
+                             "a frequency like 440Hz); all of them if none "
+                             "are given")
+    parser.add_argument("--reset", action="store_true",
+                        help="write back the values the design was built with")
+    parser.add_argument("--port", default="/dev/ttyUSB1",
+                        help="the serial port (default /dev/ttyUSB1)")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="seconds to wait for the answers (default 1)")
+    args = parser.parse_args(argv)
+
+    regmap = load_map(args.map)
+    batch = Batch(regmap["registers"])
+    reads = []
+    try:
+        if args.reset:
+            for name, register in regmap["registers"].items():
+                if "reset" in register:
+                    batch.write(name, register["reset"])
+        names = args.registers
+        if not names and not args.reset:
+            names = list(regmap["registers"])
+        for spec in names:
+            name, equals, value = spec.partition("=")
+            if equals:
+                batch.write(name.strip(), value)
+            else:
+                reads.append(batch.read(name.strip()))
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    with RegisterClient(regmap, args.port, args.timeout) as client:
+        try:
+            client.run(batch)
+        except TimeoutError as e:
+            print(e, file=sys.stderr)
+            return 1
+    took = time.perf_counter() - start
+
+    width = max([len(r.name) for r in reads] + [8])
+    for read in reads:
+        hertz = in_hertz(read.register, read.value)
+        shown = f"  ({hertz:.6g} Hz)" if hertz is not None else ""
+        print(f"{read.name:<{width}}  0x{read.value:08x} {read.value:>10}{shown}")
+    print(f"{len(batch.commands())} bytes out, {batch.size()} back in "
+          f"{took * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
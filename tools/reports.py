@@ -0,0 +1,132 @@
+#
+# vim: expandtab:ts=4:
+#
+# Pull the interesting numbers out of the yosys and nextpnr output.
+#
+# yosys writes its log to <build_name>.rpt (the -l option in the LiteX
+# build script) and the "stat" at the end of synth_ice40 tells us how
+# many of each kind of cell (SB_LUT4, SB_DFF, SB_CARRY, ...) the design
+# turned into. nextpnr only talks to stdout, which the build cache saves
+# in <build_name>.log, and from that we get the device utilisation and
+# the maximum frequency it thinks each clock can run at.
+#
+import os
+import re
+
+#
+# yosys has printed the cell counts two different ways over the years,
+# "   SB_LUT4     30" and more recently "     30   SB_LUT4".
+#
+_cells_header = re.compile(r"^\s*(Number of cells:\s*\d+|\d+\s+cells)\s*$")
+_cell_name_count = re.compile(r"^\s+(\$?[A-Za-z_][\w$]*)\s+(\d+)\s*$")
+_cell_count_name = re.compile(r"^\s+(\d+)\s+(\$?[A-Za-z_][\w$]*)\s*$")
+
+#
+# nextpnr: "Info:          ICESTORM_LC:   123/ 5280     2%"
+#
+_util = re.compile(r"^Info:\s+(\w+):\s+(\d+)\s*/\s*(\d+)\s+\d+%")
+
+#
+# nextpnr: "Info: Max frequency for clock 'sys_clk': 52.31 MHz (PASS at 50.00 MHz)"
+#
+_fmax = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz"
+                   r"(?:\s+\((PASS|FAIL) at ([\d.]+) MHz\))?")
+
+
+def clock_name(name):
+    """
+        nextpnr names clocks after the net that drives them which
+        often ends up as something like 'clk12$SB_IO_IN_$glb_clk'. This
+        trims that back to the name we used in the design.
+    """
+    return re.sub(r"(\$SB_IO_IN)?(_\$glb_clk|\$glb_clk)$", "", name)
+
+
+def parse_yosys_cells(text):
+    """
+        Returns a dict of cell type -> count from the last statistics
+        block in a yosys log.
+    """
+    lines = text.splitlines()
+    start = None
+    for i, line in enumerate(lines):
+        if _cells_header.match(line):
+            start = i + 1
+    cells = {}
+    if start is None:
+        return cells
+    for line in lines[start:]:
+        m = _cell_name_count.match(line)
+        if m:
+            cells[m.group(1)] = int(m.group(2))
+            continue
+        m = _cell_count_name.match(line)
+        if m:
+            cells[m.group(2)] = int(m.group(1))
+            continue
+        if line.strip():
+            break
+    return cells
+
+
+def parse_utilisation(text):
+    """
+        Returns a dict of bel type -> (used, available) from a nextpnr
+        log. The last report wins (nextpnr prints one after packing).
+    """
+    util = {}
+    for line in text.splitlines():
+        m = _util.match(line)
+        if m:
+            util[m.group(1)] = (int(m.group(2)), int(m.group(3)))
+    return util
+
+
+def parse_fmax(text):
+    """
+        Returns a dict of clock -> (fmax, target) in MHz from a nextpnr
+        log. nextpnr prints an estimate before routing and the real
+        number afterwards, the later one wins. target is None when the
+        clock wasn't constrained.
+    """
+    fmax = {}
+    for m in _fmax.finditer(text):
+        target = float(m.group(4)) if m.group(4) else None
+        fmax[clock_name(m.group(1))] = (float(m.group(2)), target)
+    return fmax
+
+
+def _read(path):
+    try:
+        with open(path, errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def read_reports(build_dir, build_name="top"):
+    """
+        Collects the cell counts, utilisation and fmax for the build in
+        'build_dir'. Anything that can't be found is just left empty.
+    """
+    log = _read(os.path.join(build_dir, f"{build_name}.log"))
+    rpt = _read(os.path.join(build_dir, f"{build_name}.rpt")) or log
+    return {
+        "cells": parse_yosys_cells(rpt),
+        "utilisation": parse_utilisation(log),
+        "fmax": parse_fmax(log),
+    }
+
+
+def worst_fmax(fmax):
+    """
+        Returns (clock, fmax, target) for the clock with the least
+        margin, or None if there aren't any clocks.
+    """
+    def margin(item):
+        name, (f, target) = item
+        return f / target if target else float("inf")
+    if not fmax:
+        return None
+    name, (f, target) = min(fmax.items(), key=margin)
+    return name, f, target
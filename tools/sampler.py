@@ -0,0 +1,213 @@
+#
+# vim: expandtab:ts=4:
+#
+# The host side of the sample player (pmod/sampler.py, 09_sampler).
+#
+#    python3 -m tools.sampler 09_sampler/build load kick.wav snare.wav pad.wav
+#    python3 -m tools.sampler 09_sampler/build play pad --loop --fade 0.1
+#    python3 -m tools.sampler 09_sampler/build play kick --pitch 1.5
+#    python3 -m tools.sampler 09_sampler/build stop --fade 0.5
+#
+# The first argument is the design's build directory: the sampler writes
+# what it is (sampler.json, the sample rate and how many samples it holds)
+# and the register bus writes where its registers are (registers.json)
+# there when it is built.
+#
+# 'load' reads the WAV files and gets them ready the way the audio
+# streamer does (tools/pcmstream.py: resampled to the design's rate, then
+# dithered down to 16 bits), but mono, the two channels of a stereo file
+# are mixed. They are laid out one after the other from the start of the
+# memory, each one a region named after its file, and the layout goes in
+# samples.json next to the rest so that 'play' can find them later. Then
+# they are sent over the serial port: the address, then two samples to
+# each write to the 'data' register, as fixed bursts (Batch.stream()), and
+# a read at the end so that it only returns once the design has had them
+# all.
+#
+# 'play' starts a region, played once unless it is --loop'ed, faded in
+# over --fade seconds (the one playing fades out) and played --pitch times
+# as fast. 'stop' fades to silence.
+#
+# 'image' lays out the samples the same way but writes them to a file for
+# the flash instead, which the design loads itself when it starts:
+#
+#    python3 -m tools.sampler 09_sampler/build image kick.wav pad.wav
+#    iceprog -o 1024k 09_sampler/build/samples.bin
+#
+# It needs numpy, and pyserial for anything that talks to the board.
+#
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from tools.describe import write_json
+from tools.pcmstream import read_wav, resample, quantize
+from tools.regclient import RegisterClient
+
+# the gain of the new region goes up by 'fade' out of this every sample
+# (cores/sampler.py)
+FULL = 32768
+
+
+def load_description(build):
+    with open(os.path.join(build, "sampler.json")) as f:
+        return json.load(f)
+
+
+def layout(paths, description, dither=True):
+    """
+        The samples from the WAV files 'paths', one after the other as
+        16 bit mono at the design's sample rate, and the regions they
+        make, a dict of name -> {"start", "length"}.
+    """
+    pieces = []
+    regions = {}
+    start = 0
+    for path in paths:
+        rate, samples = read_wav(path)
+        samples = resample(samples.mean(axis=1, keepdims=True), rate,
+                           description["sample_rate"])
+        samples = quantize(samples[:, 0], dither=dither)
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in regions:
+            raise ValueError(f"There are two samples called {name}")
+        regions[name] = {"start": start, "length": len(samples)}
+        pieces.append(samples)
+        start += len(samples)
+    if start > description["words"]:
+        raise ValueError(f"{start} samples don't fit, there is only room "
+                         f"for {description['words']}")
+    samples = np.concatenate(pieces) if pieces else np.zeros(0, np.int16)
+    return samples, regions
+
+
+def words(samples):
+    """
+        'samples' two to a 32 bit word, the first one in the bottom half,
+        the way the 'data' register takes them.
+    """
+    samples = np.asarray(samples, dtype="<i2")
+    if len(samples) % 2:
+        samples = np.append(samples, np.int16(0))
+    return samples.view("<u4").tolist()
+
+
+def fade_step(seconds, sample_rate):
+    """
+        The 'fade' for a crossfade that takes 'seconds', 0 for none.
+    """
+    if seconds <= 0:
+        return 0
+    return int(min(max(round(FULL / (seconds * sample_rate)), 1), FULL - 1))
+
+
+def increment(pitch):
+    """
+        The 'increment' that plays 'pitch' times as fast, 16.16.
+    """
+    step = int(round(pitch * 0x10000))
+    if not 0 < step < 2**32:
+        raise ValueError(f"The sampler can't play {pitch} times as fast")
+    return step
+
+
+def play(batch, region, loop=False, step=0x10000, fade=0):
+    """
+        Adds the writes that start 'region' (from samples.json, or None
+        for silence) to 'batch'.
+    """
+    region = region or {"start": 0, "length": 0}
+    batch.write("sampler_start", region["start"])
+    batch.write("sampler_length", region["length"])
+    batch.write("sampler_loop", int(loop))
+    batch.write("sampler_increment", step)
+    batch.write("sampler_fade", fade)
+    batch.write("sampler_play", 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python3 -m tools.sampler",
+        description="Load samples into the sample player and play them")
+    parser.add_argument("build", help="the design's build directory")
+    parser.add_argument("--port", default="/dev/ttyUSB1",
+                        help="the serial port (default /dev/ttyUSB1)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, what in (("load", "send WAV files to the board"),
+                       ("image", "write WAV files to a file for the flash")):
+        command = commands.add_parser(name, help=what)
+        command.add_argument("wavs", nargs="+", metavar="WAV")
+        command.add_argument("--no-dither", action="store_true",
+                             help="round the samples without dither")
+    command = commands.add_parser("play", help="play a sample")
+    command.add_argument("name", help="the sample, its WAV file's name")
+    command.add_argument("--loop", action="store_true",
+                         help="play it over and over")
+    command.add_argument("--pitch", type=float, default=1.0,
+                         help="how many times as fast to play it")
+    command.add_argument("--fade", type=float, default=0.0, metavar="SECONDS",
+                         help="how long the crossfade takes (default none)")
+    command = commands.add_parser("stop", help="fade out to silence")
+    command.add_argument("--fade", type=float, default=0.0, metavar="SECONDS",
+                         help="how long the fade takes (default none)")
+    args = parser.parse_args(argv)
+
+    description = load_description(args.build)
+    regmap = os.path.join(args.build, "registers.json")
+    layout_path = os.path.join(args.build, "samples.json")
+    rate = description["sample_rate"]
+
+    if args.command in ("load", "image"):
+        try:
+            samples, regions = layout(args.wavs, description,
+                                      dither=not args.no_dither)
+        except ValueError as e:
+            parser.error(str(e))
+        write_json(layout_path, regions)
+        for name, region in regions.items():
+            print(f"{name:<16} {region['start']:>6} +{region['length']:<6} "
+                  f"{region['length'] / rate:6.2f}s")
+
+    if args.command == "image":
+        if description["flash_offset"] is None:
+            raise SystemExit("This design doesn't load its samples from "
+                             "the flash")
+        image = os.path.join(args.build, "samples.bin")
+        with open(image, "wb") as f:
+            f.write(np.asarray(samples, dtype="<i2").tobytes())
+        print(f"iceprog -o {description['flash_offset'] // 1024}k {image}")
+        return 0
+
+    if args.command == "load":
+        with RegisterClient(regmap, args.port, timeout=5.0) as client:
+            if client.read("sampler_loading"):
+                raise SystemExit("The design is still loading from the flash")
+            with client.batch() as b:
+                b.write("sampler_address", 0)
+                b.stream("sampler_data", words(samples))
+                b.read("sampler_loading")
+        return 0
+
+    if args.command == "stop":
+        region, loop, step = None, False, 0x10000
+    else:
+        with open(layout_path) as f:
+            regions = json.load(f)
+        if args.name not in regions:
+            parser.error(f"There is no sample called {args.name}, "
+                         f"there is {', '.join(regions)}")
+        try:
+            step = increment(args.pitch)
+        except ValueError as e:
+            parser.error(str(e))
+        region, loop = regions[args.name], args.loop
+    with RegisterClient(regmap, args.port) as client:
+        with client.batch() as b:
+            play(b, region, loop, step, fade_step(args.fade, rate))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
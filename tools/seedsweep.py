@@ -0,0 +1,151 @@
+#
+# vim: expandtab:ts=4:
+#
+# nextpnr seed sweep.
+#
+# Placement in nextpnr starts from a random seed and on a fairly full
+# UP5K the maximum frequency can change by 10% or more from one seed to
+# the next. Rather than guess, this runs yosys once and then runs nextpnr
+# with several different seeds at the same time on the same yosys JSON.
+# Each run's timing report is parsed and the placement with the best
+# worst-case slack (or best fmax) is kept, packed into the bitstream and
+# its seed is written to build/seed.json so the build can be repeated
+# with exactly that seed (SEED=n, or platform.build(..., seed=n)).
+#
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.buildcache import (build_commands, changed, find_command,
+                              read_outputs, run_logged, snapshot,
+                              write_outputs)
+from tools.reports import parse_fmax, worst_fmax
+
+
+def set_option(cmd, flag, value):
+    """
+        Returns a copy of 'cmd' with 'flag' set to 'value', replacing
+        it if it is already there.
+    """
+    cmd = list(cmd)
+    if flag in cmd:
+        cmd[cmd.index(flag) + 1] = str(value)
+    else:
+        cmd += [flag, str(value)]
+    return cmd
+
+
+def worst_slack(fmax):
+    """
+        Returns the worst slack in ns over all of the constrained clocks
+        (negative means it failed timing) or None if none are.
+    """
+    slacks = [1e3 / target - 1e3 / f for f, target in fmax.values() if target]
+    return min(slacks) if slacks else None
+
+
+def score(fmax, criterion="slack"):
+    """
+        How good a placement is, bigger is better. "slack" is the worst
+        slack over the constrained clocks, "fmax" is the lowest fmax.
+    """
+    if criterion == "slack":
+        slack = worst_slack(fmax)
+        if slack is not None:
+            return slack
+    worst = worst_fmax(fmax)
+    return worst[1] if worst else float("-inf")
+
+
+def _place(build_dir, nextpnr, asc, seed):
+    """
+        Runs one nextpnr placement with 'seed', writing its .asc and its
+        log into build_dir/seed_<n>/. Returns a dict describing the run.
+    """
+    seed_dir = f"seed_{seed}"
+    os.makedirs(os.path.join(build_dir, seed_dir), exist_ok=True)
+    cmd = set_option(set_option(nextpnr, "--seed", seed),
+                     "--asc", os.path.join(seed_dir, asc))
+    log = os.path.join(build_dir, seed_dir, "nextpnr.log")
+    start = time.monotonic()
+    with open(log, "wb") as f:
+        ok = subprocess.call(cmd, cwd=build_dir, stdout=f,
+                             stderr=subprocess.STDOUT) == 0
+    with open(log, errors="replace") as f:
+        fmax = parse_fmax(f.read())
+    return {"seed": seed, "ok": ok, "seconds": time.monotonic() - start,
+            "fmax": fmax, "dir": seed_dir, "command": cmd}
+
+
+def seed_sweep(platform, top, seeds=8, first_seed=1, jobs=None,
+               criterion="slack", build_dir="build", build_name="top",
+               **kwargs):
+    """
+        Builds 'top' like platform.build() does but runs 'seeds' nextpnr
+        placements (seeds first_seed, first_seed+1, ...), up to 'jobs' at
+        a time, and keeps the best one by 'criterion' ("slack" or
+        "fmax"). Returns the LiteX namespace.
+    """
+    vns = platform.build(top, build_dir=build_dir, build_name=build_name,
+                         run=False, **kwargs)
+    before = snapshot(build_dir)
+    commands = build_commands(build_dir, build_name)
+    yosys = find_command(commands, "yosys")
+    nextpnr = find_command(commands, "nextpnr-ice40")
+    asc = nextpnr[nextpnr.index("--asc") + 1]
+    log_file = os.path.abspath(os.path.join(build_dir, f"{build_name}.log"))
+
+    #
+    # Synthesis only has to happen once, every placement starts from the
+    # same JSON netlist.
+    #
+    run_logged(yosys, build_dir, log_file)
+
+    candidates = list(range(first_seed, first_seed + seeds))
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        runs = list(pool.map(lambda s: _place(build_dir, nextpnr, asc, s),
+                             candidates))
+
+    for run in runs:
+        run["score"] = score(run["fmax"], criterion) if run["ok"] else None
+        fmax = ", ".join(f"{clk} {f:.2f} MHz" for clk, (f, t) in
+                         sorted(run["fmax"].items()))
+        print(f"seed {run['seed']:3d}: {'ok' if run['ok'] else 'FAILED'} "
+              f"{run['seconds']:.1f}s {fmax}")
+    placed = [r for r in runs if r["ok"]]
+    if not placed:
+        raise OSError(f"nextpnr failed for every seed, see {build_dir}/seed_*")
+    best = max(placed, key=lambda r: r["score"])
+    print(f"Best seed is {best['seed']} ({criterion} {best['score']:.3f})")
+
+    #
+    # Put the winner where the rest of the build script expects it and
+    # run the remaining steps (icepack) as they are. The winning log is
+    # appended to the build log so the reports can find it.
+    #
+    shutil.copyfile(os.path.join(build_dir, best["dir"], asc),
+                    os.path.join(build_dir, asc))
+    with open(log_file, "ab") as log, \
+         open(os.path.join(build_dir, best["dir"], "nextpnr.log"), "rb") as f:
+        log.write(f.read())
+    for cmd in commands[commands.index(nextpnr) + 1:]:
+        run_logged(cmd, build_dir, log_file, append=True)
+
+    with open(os.path.join(build_dir, "seed.json"), "w") as f:
+        json.dump({
+            "seed": best["seed"],
+            "criterion": criterion,
+            "command": best["command"],
+            "runs": [{k: r[k] for k in ("seed", "ok", "score", "fmax")}
+                     for r in runs],
+        }, f, indent=2)
+    print(f"Seed recorded in {build_dir}/seed.json, rebuild it with "
+          f"SEED={best['seed']}")
+
+    outputs = read_outputs(build_dir, build_name)
+    outputs |= set(changed(before, snapshot(build_dir)))
+    write_outputs(build_dir, build_name, outputs)
+    return vns
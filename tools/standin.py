@@ -0,0 +1,150 @@
+#
+# vim: expandtab:ts=4:
+#
+# A stand-in for the iCEBreaker platform that can't build.
+#
+# Elaborating a design, turning it into Verilog and simulating it only
+# use the platform for its resources: request() and lookup_request(),
+# add_extension() for the PMODs, default_clk_period for the ClockPlan and
+# add_period_constraint() for the clocks. None of that needs yosys or
+# nextpnr, only build() does. The real platform comes with its toolchain
+# object though, and a slip (a script imported the wrong way, a missing
+# __main__ check) goes straight on to run it.
+#
+# StandInPlatform is a LiteX GenericPlatform, so the resources work
+# exactly as they do on the real one, with a toolchain that only remembers
+# what it is told: the clock constraints, the extra yosys commands (see
+# cores/sine_rom.py) and so on. Asking it to build or to program a board
+# is an error. Its Verilog is the same as the real platform's, it uses
+# the same iCE40 lowerings for the specials (AsyncResetSynchronizer and
+# friends) and the same attributes.
+#
+# The design scripts make their own platforms, so rather than passing
+# one in
+#
+#    with stand_in():
+#        module = sim.load("04_display_two/display_two.py")
+#
+# swaps the platform classes the scripts get (litex_boards' iCEBreaker
+# Platform and LiteX's LatticePlatform and LatticeiCE40Platform, which
+# 01_blink makes its own platform from) for stand-ins while it is in
+# effect. tools/__main__.py does this for its --stand-in option.
+#
+import contextlib
+import math
+
+from litex.build.generic_platform import GenericPlatform
+
+
+class StandInError(Exception):
+    pass
+
+
+class StandInToolchain:
+    """
+        Takes everything a design tells the toolchain and does nothing
+        with it.
+    """
+    def __init__(self, name="icestorm"):
+        self.name = name
+        self.clocks = {}
+        self.false_paths = set()
+        self._yosys_cmds = []
+
+    def add_period_constraint(self, platform, clk, period, keep=True, name=None):
+        # as LiteX's toolchains do, so that the Verilog comes out the same
+        if clk is None:
+            return
+        if hasattr(clk, "p"):
+            clk = clk.p
+        if keep:
+            clk.attr.add("keep")
+        period = math.floor(period * 1e3) / 1e3
+        if clk in self.clocks and self.clocks[clk][0] != period:
+            raise ValueError(f"Clock already constrained to "
+                             f"{self.clocks[clk][0]:.2f}ns, not {period:.2f}ns")
+        self.clocks[clk] = [period, name]
+
+    def add_false_path_constraint(self, platform, from_, to):
+        self.false_paths.add((from_, to))
+
+    def build(self, platform, *args, **kwargs):
+        raise StandInError("The stand-in platform can't build a design, "
+                           "run it without --stand-in")
+
+
+class StandInPlatform(GenericPlatform):
+    """
+        A platform for 'device' with the resources in 'io' and
+        'connectors' and no toolchain. It takes the same arguments as
+        LiteX's LatticePlatform.
+    """
+    def __init__(self, device, io, connectors=[], toolchain="icestorm",
+                 name=None, **kwargs):
+        GenericPlatform.__init__(self, device, io, connectors, name=name)
+        self.toolchain = StandInToolchain(toolchain)
+
+    def get_verilog(self, *args, special_overrides=dict(), **kwargs):
+        from litex.build.lattice.icestorm import LatticeIceStormToolchain
+        so = dict(LatticeIceStormToolchain.special_overrides)
+        so.update(special_overrides)
+        return GenericPlatform.get_verilog(self, *args,
+            special_overrides=so,
+            attr_translate=LatticeIceStormToolchain.attr_translate,
+            **kwargs)
+
+    def add_false_path_constraint(self, from_, to):
+        self.toolchain.add_false_path_constraint(self, from_, to)
+
+    def build(self, *args, **kwargs):
+        return self.toolchain.build(self, *args, **kwargs)
+
+    def create_programmer(self):
+        raise StandInError("The stand-in platform can't program a board")
+
+
+class Platform(StandInPlatform):
+    """
+        The iCEBreaker (the resources of litex_boards' platform) on the
+        stand-in toolchain. It has the same name as litex_boards' class
+        because Migen names some signals after it (platform_int_rst).
+    """
+    default_clk_name = "clk12"
+    default_clk_period = 1e9 / 12e6
+
+    def __init__(self, toolchain="icestorm"):
+        from litex_boards.platforms.icebreaker import _io, _connectors
+        StandInPlatform.__init__(self, "ice40-up5k-sg48", _io, _connectors,
+                                 toolchain=toolchain)
+
+    def do_finalize(self, fragment):
+        StandInPlatform.do_finalize(self, fragment)
+        self.add_period_constraint(self.lookup_request("clk12", loose=True),
+                                   1e9 / 12e6)
+
+
+@contextlib.contextmanager
+def stand_in():
+    """
+        While this is in effect design scripts (and sim.load() and
+        sim.platform()) get stand-in platforms rather than real ones.
+    """
+    import litex.build.lattice
+    import litex.build.lattice.platform
+    import litex_boards.platforms.icebreaker
+
+    swaps = [
+        (litex_boards.platforms.icebreaker, "Platform", Platform),
+        (litex.build.lattice, "LatticePlatform", StandInPlatform),
+        (litex.build.lattice, "LatticeiCE40Platform", StandInPlatform),
+        (litex.build.lattice.platform, "LatticePlatform", StandInPlatform),
+        (litex.build.lattice.platform, "LatticeiCE40Platform", StandInPlatform),
+    ]
+    saved = [(module, name, getattr(module, name)) for module, name, _ in swaps]
+    try:
+        for module, name, cls in swaps:
+            setattr(module, name, cls)
+        yield
+    finally:
+        for module, name, cls in saved:
+            setattr(module, name, cls)
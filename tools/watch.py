@@ -0,0 +1,288 @@
+#
+# vim: expandtab:ts=4:
+#
+# Re-elaborate designs as they are edited, in one warm python process.
+#
+# Every 'make' starts a new python, imports Migen, LiteX and litex_boards
+# again and elaborates the design from scratch before yosys even starts,
+# which is most of the wait when all that changed was a line in a PMOD
+# module. This keeps one process running with all of that imported and
+# watches the files instead:
+#
+#    python3 -m tools watch [--stand-in] [--sim [BENCH ...]] [--build]
+#                           [--diff] design [design ...]
+#
+# It polls the design scripts and everything in pmod/ and cores/ (and
+# sim/ with --sim) every half second. When something changes, the shared
+# modules are forgotten (only this repository's, Migen and LiteX stay
+# imported) and the designs that used the changed file are elaborated
+# again (see tools/capture.py) and turned into Verilog. The Verilog is
+# compared with the last time: it either didn't change (a comment, or a
+# rewrite that comes to the same thing) or it prints how many lines did,
+# and with --diff the diff itself.
+#
+# --sim runs the testbenches named (all of them if there aren't any
+# names) after every change, and --build runs the build (through the
+# build cache, as the script would) for a design whose Verilog changed.
+# Otherwise the toolchain is only run on request: typing 'b' and enter
+# builds the designs, 's' runs the benches and 'q' quits.
+#
+import difflib
+import os
+import re
+import select
+import sys
+import time
+import traceback
+
+from tools.buildall import TOP
+from tools.capture import capture
+
+# the directories with modules the designs share
+SHARED = ("pmod", "cores")
+
+# the lines of the Verilog that change every time it is written
+_stamp = re.compile(r"^//.*(Date|Auto-Generated by LiteX on)")
+
+
+def _ours(name, module):
+    """
+        Is 'module' one of this repository's, other than the tools?
+    """
+    path = getattr(module, "__file__", None) or ""
+    return (path.startswith(TOP + os.sep) and name != "__main__" and
+            name.split(".")[0] != "tools")
+
+
+def forget():
+    """
+        Drops this repository's modules (pmod, cores, sim, ...) from
+        sys.modules so that the next import reads them again.
+    """
+    for name, module in list(sys.modules.items()):
+        if _ours(name, module):
+            del sys.modules[name]
+
+
+def _netlist(output):
+    """
+        What a design's Verilog comes to: its text without the time
+        stamps, and its data files (the memory contents).
+    """
+    lines = [l for l in output.main_source.splitlines() if not _stamp.match(l)]
+    return lines, dict(output.data_files)
+
+
+class Watched:
+    """
+        One design being watched: the files it was made from and the
+        Verilog it came to the last time.
+    """
+    def __init__(self, design):
+        self.design = design
+        self.files = {os.path.abspath(design.script)}
+        self.netlist = None
+        self.failed = False
+
+    def elaborate(self, stand_in=False):
+        """
+            Elaborates the design again, returns the Verilog lines that
+            changed (None the first time).
+        """
+        forget()
+        with _platform(stand_in):
+            captured = capture(self.design)
+            fragment = captured.top.get_fragment()
+            captured.platform.finalize(fragment)
+            output = captured.platform.get_verilog(fragment, name="top")
+        self.files = {os.path.abspath(self.design.script)} | {
+            os.path.abspath(m.__file__) for n, m in list(sys.modules.items())
+            if _ours(n, m)}
+        netlist = _netlist(output)
+        previous, self.netlist = self.netlist, netlist
+        if previous is None:
+            return None
+        diff = list(difflib.unified_diff(previous[0], netlist[0], "before",
+                                         "after", lineterm=""))
+        for name in sorted(set(previous[1]) | set(netlist[1])):
+            if previous[1].get(name) != netlist[1].get(name):
+                diff.append(f"~ {name}")
+        return diff
+
+    def build(self):
+        """
+            Builds the design the way its script does.
+        """
+        import tools.buildcache
+        import tools.seedsweep
+        forget()
+        captured = capture(self.design)
+        build = tools.buildcache.cached_build
+        if "seeds" in captured.kwargs:
+            build = tools.seedsweep.seed_sweep
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.design.directory)
+            build(captured.platform, captured.top, *captured.args,
+                  **captured.kwargs)
+        finally:
+            os.chdir(cwd)
+
+
+def _platform(stand_in):
+    import contextlib
+    if stand_in:
+        from tools.standin import stand_in as context
+        return context()
+    return contextlib.nullcontext()
+
+
+def _files(watched, sim):
+    """
+        Every file to keep an eye on.
+    """
+    files = set()
+    for w in watched:
+        files |= w.files
+    for directory in SHARED + (("sim",) if sim is not None else ()):
+        path = os.path.join(TOP, directory)
+        for name in os.listdir(path):
+            if name.endswith(".py"):
+                files.add(os.path.join(path, name))
+    return files
+
+
+def _mtimes(files):
+    times = {}
+    for f in files:
+        try:
+            times[f] = os.stat(f).st_mtime_ns
+        except OSError:
+            times[f] = None
+    return times
+
+
+def _line(design, message):
+    print(f"{time.strftime('%H:%M:%S')} {design}: {message}", flush=True)
+
+
+class Watcher:
+    """
+        Watches 'designs' (tools.buildall.Design) and re-elaborates them,
+        see the top of the file for the rest.
+    """
+    def __init__(self, designs, stand_in=False, sim=None, build=False,
+                 diff=False, interval=0.5):
+        self.watched = [Watched(d) for d in designs]
+        self.stand_in = stand_in
+        self.sim = sim
+        self.auto_build = build
+        self.diff = diff
+        self.interval = interval
+
+    def elaborate(self, watched):
+        """
+            Elaborates each of 'watched', returns the ones whose Verilog
+            changed.
+        """
+        changed = []
+        for w in watched:
+            start = time.perf_counter()
+            try:
+                diff = w.elaborate(self.stand_in)
+                w.failed = False
+            except (Exception, SystemExit):
+                traceback.print_exc()
+                _line(w.design, "didn't elaborate")
+                w.failed = True
+                continue
+            took = f"elaborated in {time.perf_counter() - start:.2f}s"
+            if diff is None:
+                _line(w.design, took)
+            elif not diff:
+                _line(w.design, f"{took}, the Verilog is the same")
+            else:
+                added = sum(1 for l in diff if l[:1] == "+" and l[:3] != "+++")
+                removed = sum(1 for l in diff if l[:1] == "-" and l[:3] != "---")
+                _line(w.design, f"{took}, the Verilog changed "
+                                f"(+{added} -{removed} lines)")
+                if self.diff:
+                    print("\n".join(diff), flush=True)
+                changed.append(w)
+        return changed
+
+    def simulate(self):
+        forget()
+        from sim.__main__ import main
+        try:
+            with _platform(self.stand_in):
+                main(self.sim)
+        except Exception:
+            traceback.print_exc()
+
+    def build(self, watched):
+        if self.stand_in:
+            print("The stand-in platform can't build, run watch without "
+                  "--stand-in to build", flush=True)
+            return
+        for w in watched:
+            start = time.perf_counter()
+            try:
+                w.build()
+                _line(w.design, f"built in {time.perf_counter() - start:.1f}s")
+            except (Exception, SystemExit):
+                traceback.print_exc()
+                _line(w.design, "didn't build")
+
+    def _command(self):
+        """
+            Waits up to the polling interval for a command on stdin,
+            returns it (or None).
+        """
+        if sys.stdin is None or sys.stdin.closed or not sys.stdin.isatty():
+            time.sleep(self.interval)
+            return None
+        ready, _, _ = select.select([sys.stdin], [], [], self.interval)
+        if not ready:
+            return None
+        return sys.stdin.readline().strip().lower() or None
+
+    def run(self):
+        # the slow imports, done once
+        import migen
+        import litex.build.generic_platform
+        import litex.build.lattice.icestorm
+        import litex_boards.platforms.icebreaker
+
+        self.elaborate(self.watched)
+        if self.sim is not None:
+            self.simulate()
+        files = _files(self.watched, self.sim)
+        before = _mtimes(files)
+        print("watching (b = build, s = simulate, q = quit)", flush=True)
+        while True:
+            command = self._command()
+            if command == "q":
+                return 0
+            if command == "b":
+                self.build(self.watched)
+            elif command == "s":
+                self.simulate()
+
+            now = _mtimes(files)
+            edited = {f for f in files if now[f] != before[f]}
+            before = now
+            if not edited:
+                continue
+            # give the editor a moment to finish writing
+            time.sleep(0.1)
+            # a design that didn't elaborate may not have got as far as
+            # importing the file that was fixed
+            affected = [w for w in self.watched if w.files & edited or w.failed]
+            changed = self.elaborate(affected)
+            if self.sim is not None:
+                self.simulate()
+            if self.auto_build and changed:
+                self.build(changed)
+            files = _files(self.watched, self.sim)
+            before = _mtimes(files)